@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost so it sees every query and the full response time
+    'LittleLemonAPI.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,10 +84,33 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite connection profile, selected with the BAR_SQLITE_PROFILE environment
+# variable. "production" switches to WAL journaling so readers never block on
+# writers, waits on the busy timeout instead of failing with "database is
+# locked", and opens every transaction with BEGIN IMMEDIATE so writers queue
+# for the lock up front rather than deadlocking on a read-to-write upgrade.
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'timeout': 10,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA mmap_size=268435456;'
+            'PRAGMA cache_size=-65536;'
+            'PRAGMA temp_store=MEMORY;'
+        ),
+    },
+}
+
+SQLITE_PROFILE = os.environ.get('BAR_SQLITE_PROFILE', 'default')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('BAR_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': SQLITE_PROFILES[SQLITE_PROFILE],
     }
 }
 
@@ -130,14 +156,27 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-REST_FRAMEWORK = {
-    'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+# Response renderers, selected with the BAR_RENDERER_PROFILE environment
+# variable. "production" drops the browsable API, so no request pays for
+# content negotiation between renderers or HTML template loading. Both encode
+# JSON with orjson when it is installed.
+RENDERER_PROFILES = {
+    'default': (
+        'LittleLemonAPI.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
+    'production': (
+        'LittleLemonAPI.renderers.FastJSONRenderer',
+    ),
+}
+
+RENDERER_PROFILE = os.environ.get('BAR_RENDERER_PROFILE', 'default')
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': RENDERER_PROFILES[RENDERER_PROFILE],
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'LittleLemonAPI.authentication.JWTAuthentication',
     ),
 
     'DEFAULT_PERMISSION_CLASSES': (
@@ -152,18 +191,90 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ),
 
-    'DeFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'LittleLemonAPI.throttling.UserTokenBucketThrottle',
+        'LittleLemonAPI.throttling.AnonTokenBucketThrottle',
     ],
 
+    # token buckets: the number is the burst size, refilled evenly over the period
     'DEFAULT_THROTTLE_RATES': {
         'user': '1000/day',
         'anon': '100/day',
+        'checkout': '20/minute',
+        'cart': '120/minute',
+        'menu': '600/minute',
     },
     
 }
 
+# Where throttle buckets live. The in-memory store is per process; set
+# BAR_THROTTLE_STORE=sqlite to share buckets between workers through a file.
+THROTTLE_STORE = {
+    'BACKEND': 'LittleLemonAPI.throttling.LocMemBucketStore',
+    'OPTIONS': {},
+}
+if os.environ.get('BAR_THROTTLE_STORE') == 'sqlite':
+    THROTTLE_STORE = {
+        'BACKEND': 'LittleLemonAPI.throttling.SQLiteBucketStore',
+        'OPTIONS': {'path': os.environ.get('BAR_THROTTLE_PATH', BASE_DIR / 'throttle.sqlite3')},
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # carts of the cache cart store; entries not yet written to the Cart
+    # table must not be culled
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'carts',
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+}
+# LocMem is per process: with several workers, share the carts through Redis
+if os.environ.get('BAR_CART_REDIS_URL'):
+    CACHES['carts'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['BAR_CART_REDIS_URL'],
+    }
+
+# Where carts live. Every change goes to the Cart table by default;
+# BAR_CART_STORE=cache keeps carts in the BAR_CART_CACHE alias and writes
+# them to the table on checkout or after BAR_CART_IDLE seconds without a
+# change (manage.py flush_carts, run periodically).
+CART_STORE = {
+    'BACKEND': 'LittleLemonAPI.cart.DatabaseCartStore',
+    'OPTIONS': {},
+}
+if os.environ.get('BAR_CART_STORE') == 'cache':
+    CART_STORE = {
+        'BACKEND': 'LittleLemonAPI.cart.CacheCartStore',
+        'OPTIONS': {
+            'cache': os.environ.get('BAR_CART_CACHE', 'carts'),
+            'idle': int(os.environ.get('BAR_CART_IDLE', 300)),
+        },
+    }
+
+# In-process cache of authenticated users and their roles (see
+# LittleLemonAPI.authentication). TIMEOUT bounds, in seconds, how long a
+# change made through another worker can go unnoticed.
+AUTH_USER_CACHE = {
+    'SIZE': int(os.environ.get('BAR_AUTH_USER_CACHE_SIZE', 1024)),
+    'TIMEOUT': int(os.environ.get('BAR_AUTH_USER_CACHE_TIMEOUT', 60)),
+}
+# seconds between reloads of the blacklisted token ids
+TOKEN_BLACKLIST_REFRESH = int(os.environ.get('BAR_TOKEN_BLACKLIST_REFRESH', 30))
+
+# First successful responses of checkout and cart writes sent with an
+# Idempotency-Key header, replayed to retries (see LittleLemonAPI.idempotency).
+# Kept per process for TIMEOUT seconds; a duplicate of a request still running
+# waits up to WAIT seconds for it.
+IDEMPOTENCY = {
+    'SIZE': int(os.environ.get('BAR_IDEMPOTENCY_SIZE', 10000)),
+    'TIMEOUT': int(os.environ.get('BAR_IDEMPOTENCY_TIMEOUT', 24 * 3600)),
+    'WAIT': int(os.environ.get('BAR_IDEMPOTENCY_WAIT', 10)),
+}
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -174,4 +285,59 @@ SIMPLE_JWT = {
 DJOSER = {
     'USER_ID_FIELD': 'username',
     'PASSWORD_FIELD': 'password',
-}    
\ No newline at end of file
+}
+
+# Per-view query budgets declared with LittleLemonAPI.metrics.query_budget are
+# logged as warnings when exceeded; strict mode raises instead (tests use it).
+QUERY_BUDGET_STRICT = os.environ.get('BAR_QUERY_BUDGET_STRICT', '') == '1'
+
+# Serve the read endpoints (menu items, categories, order lists) with async
+# views; only worth it under an ASGI server
+ASYNC_READ_ENDPOINTS = os.environ.get('BAR_ASYNC_READ_ENDPOINTS', '') == '1'
+
+# Server-sent events of GET /api/orders/events (see LittleLemonAPI.events).
+# The in-memory broker only reaches streams of the worker that made the change;
+# BAR_EVENTS_BROKER=sqlite shares events between the workers of a host through
+# a file. KEEPALIVE is the number of seconds between keep-alive comments.
+EVENTS_BROKER = {
+    'BACKEND': 'LittleLemonAPI.events.LocMemBroker',
+    'OPTIONS': {},
+}
+if os.environ.get('BAR_EVENTS_BROKER') == 'sqlite':
+    EVENTS_BROKER = {
+        'BACKEND': 'LittleLemonAPI.events.SQLiteBroker',
+        'OPTIONS': {'path': os.environ.get('BAR_EVENTS_PATH', BASE_DIR / 'events.sqlite3')},
+    }
+ORDER_EVENTS = {
+    'KEEPALIVE': int(os.environ.get('BAR_EVENTS_KEEPALIVE', 15)),
+    'QUEUE_SIZE': int(os.environ.get('BAR_EVENTS_QUEUE_SIZE', 100)),
+}
+
+# Warm each worker up (URL patterns, settings classes, serializers, database
+# connection, catalog and staff role caches) before it takes traffic; see
+# LittleLemonAPI.warmup and `manage.py warm_up`
+WARMUP_ON_START = os.environ.get('BAR_WARMUP_ON_START', '') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # one JSON line per request with query count and timings
+        'LittleLemonAPI.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('BAR_REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        # phase timings of the worker warm-up
+        'LittleLemonAPI.warmup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
 application = get_wsgi_application()
+
+# with BAR_WARMUP_ON_START=1, pay the first-request costs before serving
+from LittleLemonAPI.warmup import warm_up_worker  # noqa: E402
+
+warm_up_worker()
@@ -0,0 +1,210 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.permissions import IsAuthenticated
+
+from . import views
+from .authentication import JWTAuthentication
+from .catalog import aget_catalog_version, catalog_etag, category_ids, etag_matches
+from .events import DEFAULT_ORDER_EVENTS, EventStream, subscribe
+from .metrics import query_budget
+from .models import Category, Order
+from .pagination import MenuItemsPagination, OrdersPagination
+from .permissions import IsCustomer, IsDeliveryCrew
+from .renderers import dumps
+from .roles import CUSTOMER, aget_user_roles, has_role
+from .serializers import CategorySerializer, MenuItemSerializer, OrderSerializer
+from .throttling import MenuThrottle, UserTokenBucketThrottle
+
+# Async versions of the read endpoints, served at the same paths as the DRF
+# views when settings.ASYNC_READ_ENDPOINTS is on (ASGI deployments). They
+# return the same bodies and status codes; every other method is handed to
+# the sync view.
+
+_authenticator = JWTAuthentication()
+
+_categories_view = views.CategoryView.as_view({'get': 'list', 'post': 'create'})
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    # same output as DRF's JSONRenderer with the default settings
+    return HttpResponse(dumps(data), status=status, headers=headers, content_type='application/json')
+
+
+def exception_response(exc):
+    """ mirror rest_framework.views.exception_handler for APIExceptions """
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers['WWW-Authenticate'] = _authenticator.authenticate_header(None)
+    if getattr(exc, 'wait', None):
+        headers['Retry-After'] = '%d' % exc.wait
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, status=exc.status_code, headers=headers)
+
+
+async def authorize(request, permission_classes, throttle_classes):
+    """ authenticate, check permissions and throttles like APIView.initial
+
+    Returns an error response, or None when the request may proceed.
+    """
+    try:
+        result = await _authenticator.aauthenticate(request)
+        request.user, request.auth = result if result else (None, None)
+        if request.user is not None:
+            # permission classes read the memoized roles, no query in the loop
+            await aget_user_roles(request.user)
+
+        for permission_class in permission_classes:
+            permission = permission_class()
+            if not permission.has_permission(request, None):
+                if request.user is None:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+        for throttle_class in throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, None):
+                raise exceptions.Throttled(throttle.wait())
+    except exceptions.APIException as exc:
+        return exception_response(exc)
+    return None
+
+
+def sync_fallback(view):
+    """ serve methods other than GET, and streamed GETs, with the sync DRF view """
+    return sync_to_async(view)
+
+
+@query_budget(6)
+@csrf_exempt
+async def menu_items(request):
+    if request.method != 'GET' or 'stream' in request.GET:
+        return await sync_fallback(views.menuItemsView)(request)
+
+    denied = await authorize(request, [IsAuthenticated], [MenuThrottle])
+    if denied:
+        return denied
+    if not has_role(request.user, CUSTOMER):
+        return json_response({"error": "Only customers can view menu items"}, status=status.HTTP_403_FORBIDDEN)
+    if 'since' in request.GET:
+        try:
+            data = await sync_to_async(views.menu_sync_data)(request.GET)
+        except exceptions.APIException as exc:
+            return exception_response(exc)
+        return json_response(data)
+
+    version = await aget_catalog_version()
+    etag = catalog_etag(request, 'menu-items', version=version)
+    if etag_matches(request, etag):
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    category_name = request.GET.get('category_name')
+    category_id = await category_ids.aget(category_name, version) if category_name else None
+    menu_items, ordering, error = views.menu_items_query(request.GET, category_id)
+    if error:
+        return json_response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    if category_name and category_id is None:
+        return json_response(views.unknown_category(category_name), status=status.HTTP_404_NOT_FOUND)
+    paginator = MenuItemsPagination()
+    try:
+        page = await paginator.apaginate_queryset(menu_items, request, ordering=ordering)
+    except exceptions.APIException as exc:
+        return exception_response(exc)
+
+    data = paginator.get_paginated_data(MenuItemSerializer(page, many=True).data)
+    return json_response(data, headers={'ETag': etag})
+
+
+@query_budget(4)
+@csrf_exempt
+async def categories(request):
+    if request.method != 'GET':
+        return await sync_fallback(_categories_view)(request)
+
+    denied = await authorize(request, [IsAuthenticated], [MenuThrottle])
+    if denied:
+        return denied
+
+    etag = catalog_etag(request, 'categories', params=(), version=await aget_catalog_version())
+    if etag_matches(request, etag):
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    categories = [category async for category in Category.objects.all()]
+    if not categories:
+        return json_response({"error": "Category list is empty"}, status=status.HTTP_404_NOT_FOUND)
+    return json_response(CategorySerializer(categories, many=True).data, headers={'ETag': etag})
+
+
+async def _order_list(request, orders, empty_message):
+    paginator = OrdersPagination()
+    try:
+        page = await paginator.apaginate_queryset(OrderSerializer.setup_eager_loading(orders), request)
+    except exceptions.APIException as exc:
+        return exception_response(exc)
+    if not page and not request.GET.get('cursor'):
+        return json_response({"message": empty_message}, status=status.HTTP_204_NO_CONTENT)
+    return json_response(paginator.get_paginated_data(OrderSerializer(page, many=True).data))
+
+
+@query_budget(3)
+@csrf_exempt
+async def customer_orders(request):
+    if request.method != 'GET':
+        return await sync_fallback(views.placeOrderView)(request)
+    if 'stream' in request.GET:
+        return await sync_fallback(views.customerOrderListView)(request)
+
+    denied = await authorize(request, [IsAuthenticated, IsCustomer], [UserTokenBucketThrottle])
+    if denied:
+        return denied
+    return await _order_list(request, Order.objects.filter(user=request.user), "No orders found")
+
+
+@query_budget(4)
+@csrf_exempt
+async def delivery_crew_orders(request):
+    if request.method != 'GET' or 'stream' in request.GET:
+        return await sync_fallback(views.deliveryCrewCheckOrUpdateOrderStatusView)(request)
+
+    denied = await authorize(request, [IsAuthenticated, IsDeliveryCrew], [UserTokenBucketThrottle])
+    if denied:
+        return denied
+    if 'since' in request.GET:
+        try:
+            data = await sync_to_async(views.delivery_sync_data)(request.user, request.GET)
+        except exceptions.APIException as exc:
+            return exception_response(exc)
+        return json_response(data)
+    return await _order_list(request, Order.objects.filter(delivery_crew=request.user), "No assigned orders found")
+
+
+@query_budget(3)
+@csrf_exempt
+async def order_events(request):
+    """ server-sent events of the caller's orders being assigned or changing status
+
+    Streams to customers and drivers alike, each only sees the orders they
+    placed or deliver. Needs an ASGI server: a WSGI worker would hold the
+    stream forever.
+    """
+    if request.method != 'GET':
+        return json_response({"detail": f'Method "{request.method}" not allowed.'},
+                             status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'GET'})
+    if not isinstance(request, ASGIRequest):
+        return json_response({"error": "Order events are only served by the ASGI application"},
+                             status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    denied = await authorize(request, [IsAuthenticated], [UserTokenBucketThrottle])
+    if denied:
+        return denied
+    config = getattr(settings, 'ORDER_EVENTS', DEFAULT_ORDER_EVENTS)
+    subscription = subscribe(request.user.pk)
+    return StreamingHttpResponse(
+        EventStream(subscription, config['KEEPALIVE']),
+        content_type='text/event-stream',
+        # no caching, and no buffering by nginx
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
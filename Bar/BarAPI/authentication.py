@@ -0,0 +1,189 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .metrics import outside_budget
+from .roles import aget_user_roles, get_user_roles, remember_request_roles
+
+DEFAULT_USER_CACHE = {'SIZE': 1024, 'TIMEOUT': 60}
+DEFAULT_BLACKLIST_REFRESH = 30
+
+
+class UserCache:
+    """Authenticated users and their role names in process memory
+
+    Keyed by user id and token version (the password hash claim when
+    revocation is on), least recently used entries are dropped beyond
+    ``settings.AUTH_USER_CACHE['SIZE']``. Signals forget a user when it or
+    its groups change; ``TIMEOUT`` bounds how long a change made by another
+    worker goes unnoticed.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ ``(user, roles)``, the user being a copy the caller may modify """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, roles, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy.copy(user), roles
+
+    def set(self, key, user, roles):
+        config = getattr(settings, 'AUTH_USER_CACHE', DEFAULT_USER_CACHE)
+        # the stored instance is never handed out, request state stays per request
+        entry = (copy.copy(user), roles, time.monotonic() + config['TIMEOUT'])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > config['SIZE']:
+                self._entries.popitem(last=False)
+
+    def forget(self, *user_ids):
+        user_ids = {str(user_id) for user_id in user_ids}
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in user_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class BlacklistSnapshot:
+    """Ids of the unexpired blacklisted tokens, reloaded periodically
+
+    One query every ``settings.TOKEN_BLACKLIST_REFRESH`` seconds replaces a
+    ``token_blacklist`` lookup per request; callers ``refresh()`` when
+    ``stale()``. Blacklisting in this process reloads it on the next request.
+    """
+
+    def __init__(self):
+        self._jtis = frozenset()
+        self._loaded = None
+
+    def stale(self):
+        refresh = getattr(settings, 'TOKEN_BLACKLIST_REFRESH', DEFAULT_BLACKLIST_REFRESH)
+        return self._loaded is None or time.monotonic() - self._loaded >= refresh
+
+    def refresh(self):
+        loaded = time.monotonic()
+        # the reload is the process's, not the cost of the request it lands in
+        with outside_budget():
+            self._jtis = frozenset(
+                BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+                .values_list('token__jti', flat=True)
+            )
+        self._loaded = loaded
+
+    def expire(self):
+        self._loaded = None
+
+    def __contains__(self, jti):
+        return jti in self._jtis
+
+
+user_cache = UserCache()
+blacklist = BlacklistSnapshot()
+
+
+def forget_cached_users(*user_ids):
+    """ drop cached users, called whenever a user or its groups change """
+    user_cache.forget(*user_ids)
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """simplejwt authentication served from an in-process user cache
+
+    A cached user costs no query; the first request of a user loads the row
+    and its roles once. Tokens whose id is blacklisted are refused. There is
+    an async path for async views: token parsing and validation are pure
+    CPU work and shared with the sync path, only a cache miss goes through
+    the async ORM.
+    """
+
+    def get_validated_token(self, raw_token):
+        if blacklist.stale():
+            blacklist.refresh()
+        return self.check_blacklist(super().get_validated_token(raw_token))
+
+    def check_blacklist(self, validated_token):
+        if validated_token.get(api_settings.JTI_CLAIM) in blacklist:
+            raise InvalidToken(_("Token is blacklisted"))
+        return validated_token
+
+    def cache_key(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        return str(user_id), validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+
+    def cached_user(self, key):
+        cached = user_cache.get(key)
+        if cached is None:
+            return None
+        user, roles = cached
+        remember_request_roles(user, roles)
+        return user
+
+    def get_user(self, validated_token):
+        key = self.cache_key(validated_token)
+        user = self.cached_user(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(key, user, get_user_roles(user))
+        return user
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        if blacklist.stale():
+            await sync_to_async(blacklist.refresh)()
+        validated_token = self.check_blacklist(super().get_validated_token(raw_token))
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        key = self.cache_key(validated_token)
+        user = self.cached_user(key)
+        if user is not None:
+            return user
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: key[0]})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        user_cache.set(key, user, await aget_user_roles(user))
+        return user
@@ -0,0 +1,388 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .checkout import EmptyCartError, create_order, place_order
+from .db import values_cte, write_transaction
+from .models import Cart, MenuItem
+from .serializers import CartSerializer
+
+logger = logging.getLogger(__name__)
+
+# upper bound for one batch request, keeps the statement well under
+# SQLite's bound parameter limit
+MAX_BATCH_ITEMS = 100
+
+# a cart line must fit its row: Cart.quantity is a SmallIntegerField and
+# Cart.price has max_digits=6
+MAX_LINE_QUANTITY = 999
+MAX_LINE_PRICE = Decimal('9999.99')
+
+
+class CartLineTooLarge(Exception):
+    """Adding would take cart lines past ``MAX_LINE_QUANTITY`` or ``MAX_LINE_PRICE``"""
+
+    def __init__(self, menuitem_ids):
+        self.menuitem_ids = sorted(menuitem_ids)
+        super().__init__(f"A cart line holds at most {MAX_LINE_QUANTITY} items "
+                         f"and {MAX_LINE_PRICE}: {self.menuitem_ids}")
+
+
+def _upsert(user, quantities):
+    """ INSERT ... ON CONFLICT DO UPDATE adding to the existing quantity
+
+    The menu item price is read inside the statement, so a missing menu item
+    simply inserts no row. An existing cart row keeps its unit price, like
+    the read-modify-write this replaces. A line that would go past
+    ``MAX_LINE_QUANTITY`` or ``MAX_LINE_PRICE`` is neither inserted nor
+    updated, and is missing from the result like an unknown menu item.
+    """
+    qn = connection.ops.quote_name
+    cart = qn(Cart._meta.db_table)
+    requested, params = values_cte('requested', ('menuitem_id', 'quantity'), quantities.items())
+    sql = requested + (
+        f'INSERT INTO {cart} (user_id, menuitem_id, quantity, unit_price, price) '
+        f'SELECT %s, m.id, r.quantity, m.price, ROUND(m.price * r.quantity, 2) '
+        f'FROM {qn(MenuItem._meta.db_table)} m JOIN requested r ON m.id = r.menuitem_id '
+        # WHERE is also required by SQLite to tell the ON CONFLICT from a join
+        f'WHERE r.quantity <= %s AND ROUND(m.price * r.quantity, 2) <= %s '
+        f'ON CONFLICT (menuitem_id, user_id) DO UPDATE SET '
+        f'quantity = {cart}.quantity + excluded.quantity, '
+        f'price = ROUND({cart}.unit_price * ({cart}.quantity + excluded.quantity), 2) '
+        f'WHERE {cart}.quantity + excluded.quantity <= %s '
+        f'AND ROUND({cart}.unit_price * ({cart}.quantity + excluded.quantity), 2) <= %s '
+        f'RETURNING id, menuitem_id, quantity'
+    )
+    # a float: SQLite would compare the number with a Decimal's text
+    limits = [MAX_LINE_QUANTITY, float(MAX_LINE_PRICE)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [user.pk] + limits + limits)
+        rows = cursor.fetchall()
+    # quantities are positive, so a row holding exactly the requested
+    # quantity was just inserted
+    return {menuitem_id: (cart_id, quantity == quantities[menuitem_id])
+            for cart_id, menuitem_id, quantity in rows}
+
+
+def _too_large(missing):
+    """ the menu items of ``missing`` that exist: the limits kept their lines out """
+    return set(MenuItem.objects.filter(pk__in=missing).values_list('pk', flat=True))
+
+
+@write_transaction
+def add_cart_item(user, menuitem_id, quantity):
+    """ add ``quantity`` of a menu item to the user's cart in one statement
+
+    Concurrent adds of the same item cannot lose an update. Returns
+    ``(cart_id, created)``; raises ``MenuItem.DoesNotExist`` for an unknown
+    menu item and ``CartLineTooLarge`` past the line limits.
+    """
+    result = _upsert(user, {menuitem_id: quantity})
+    if menuitem_id not in result:
+        if _too_large({menuitem_id}):
+            raise CartLineTooLarge({menuitem_id})
+        raise MenuItem.DoesNotExist(f"Menu item {menuitem_id} does not exist")
+    return result[menuitem_id]
+
+
+class UnknownMenuItems(MenuItem.DoesNotExist):
+    def __init__(self, menuitem_ids):
+        self.menuitem_ids = sorted(menuitem_ids)
+        super().__init__(f"Menu items do not exist: {self.menuitem_ids}")
+
+
+@write_transaction
+def add_cart_items(user, items):
+    """ add many ``(menuitem_id, quantity)`` pairs with one upsert statement
+
+    Repeated menu items are summed. Returns ``{menuitem_id: (cart_id,
+    created)}``; when any menu item is unknown nothing is written and
+    ``UnknownMenuItems`` is raised, ``CartLineTooLarge`` when a line would
+    go past the limits.
+    """
+    quantities = {}
+    for menuitem_id, quantity in items:
+        quantities[menuitem_id] = quantities.get(menuitem_id, 0) + quantity
+
+    result = _upsert(user, quantities)
+    missing = quantities.keys() - result.keys()
+    if missing:
+        # rolls back the rows that were written
+        too_large = _too_large(missing)
+        if too_large:
+            raise CartLineTooLarge(too_large)
+        raise UnknownMenuItems(missing)
+    return result
+
+
+class CartBusy(Exception):
+    """The cart stayed locked by another request for too long"""
+
+
+class DatabaseCartStore:
+    """Carts as Cart rows, every change written through to the table"""
+
+    def lines(self, user):
+        """ the user's cart as Cart instances with their menu item loaded """
+        return list(CartSerializer.setup_eager_loading(Cart.objects.filter(user=user)))
+
+    def add(self, user, quantities):
+        """ add ``{menuitem_id: quantity}`` to the cart
+
+        Returns ``[(cart, created), ...]`` for the affected lines in cart
+        order; raises ``UnknownMenuItems`` and adds nothing when a menu item
+        does not exist, ``CartLineTooLarge`` when a line would go past
+        ``MAX_LINE_QUANTITY`` or ``MAX_LINE_PRICE``.
+        """
+        result = add_cart_items(user, quantities.items())
+        created = {cart_id: created for cart_id, created in result.values()}
+        rows = CartSerializer.setup_eager_loading(Cart.objects.filter(pk__in=created)).order_by('id')
+        return [(row, created[row.pk]) for row in rows]
+
+    def place_order(self, user):
+        return place_order(user)
+
+    def flush_idle(self, idle=None):
+        """ nothing to write behind, returns the number of carts written """
+        return 0
+
+
+def _cents(price):
+    return int(price * 100)
+
+
+def _money(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+class CacheCartStore:
+    """Carts in a Django cache, written to the Cart table behind the requests
+
+    A cart is one cache entry ``{'lines': {menuitem_id: [quantity, unit
+    price in cents, cart id]}, 'dirty': bool, 'touched': timestamp}``, so
+    adds and reads write nothing to the database. Checkout turns the entry
+    into an order directly. ``flush_idle()`` (``manage.py flush_carts``)
+    upserts the carts untouched for ``idle`` seconds as Cart rows, which a
+    cart missing from the cache is loaded from. Cart ids are None until the
+    first flush.
+
+    Changes of a cart are serialized by a lock taken with ``cache.add``, so
+    workers sharing the cache cannot lose an add. The cache must be shared
+    by every worker, have an atomic ``add`` and not evict entries that were
+    not flushed yet: a dedicated alias of Redis, Memcached, or LocMem for a
+    single worker.
+    """
+    # a lock left by a dead worker expires after lock_timeout seconds
+    lock_timeout = 10
+    lock_wait = 5
+    dirty_key = 'cart:dirty'
+
+    def __init__(self, cache='carts', idle=300, timeout=7 * 24 * 3600):
+        self.alias = cache
+        self.idle = idle
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        # cache clients are per thread
+        return caches[self.alias]
+
+    def _key(self, user_id):
+        return f'cart:{user_id}'
+
+    @contextmanager
+    def _locked(self, key):
+        lock, token = f'{key}:lock', uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not self.cache.add(lock, token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise CartBusy(f"{key} is locked, please retry")
+            time.sleep(0.002)
+        try:
+            yield
+        finally:
+            # past lock_timeout the lock may be another request's
+            if self.cache.get(lock) == token:
+                self.cache.delete(lock)
+
+    def _entry(self, user):
+        entry = self.cache.get(self._key(user.pk))
+        if entry is None:
+            rows = Cart.objects.filter(user=user).order_by('id').values_list('id', 'menuitem_id', 'quantity', 'unit_price')
+            entry = {
+                'lines': {menuitem_id: [quantity, _cents(unit_price), cart_id]
+                          for cart_id, menuitem_id, quantity, unit_price in rows},
+                'dirty': False,
+                'touched': time.time(),
+            }
+        return entry
+
+    def _cart_item(self, user, menuitem, line):
+        quantity, cents, cart_id = line
+        return Cart(id=cart_id, user=user, menuitem=menuitem, quantity=quantity,
+                    unit_price=_money(cents), price=_money(cents * quantity))
+
+    def _cart_items(self, user, lines):
+        # lines of deleted menu items are left out, as the rows cascade
+        menuitems = MenuItem.objects.select_related('category').in_bulk(list(lines))
+        return [self._cart_item(user, menuitems[menuitem_id], line)
+                for menuitem_id, line in lines.items() if menuitem_id in menuitems]
+
+    def _mark(self, user_id, dirty):
+        with self._locked(self.dirty_key):
+            index = self.cache.get(self.dirty_key, set())
+            if dirty:
+                index.add(user_id)
+            else:
+                index.discard(user_id)
+            self.cache.set(self.dirty_key, index, None)
+
+    def lines(self, user):
+        """ the user's cart as unsaved Cart instances with their menu item loaded """
+        key = self._key(user.pk)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self._entry(user)
+            # a concurrent add wins over the rows just read
+            self.cache.add(key, entry, self.timeout)
+        return self._cart_items(user, entry['lines'])
+
+    def add(self, user, quantities):
+        """ same contract as ``DatabaseCartStore.add``, only the cache is written """
+        menuitems = MenuItem.objects.select_related('category').in_bulk(list(quantities))
+        missing = quantities.keys() - menuitems.keys()
+        if missing:
+            raise UnknownMenuItems(missing)
+
+        key = self._key(user.pk)
+        with self._locked(key):
+            entry = self._entry(user)
+            lines = entry['lines']
+            too_large = set()
+            for menuitem_id, quantity in quantities.items():
+                # an existing line keeps its unit price, like the upsert
+                held, cents, _ = lines.get(menuitem_id, (0, _cents(menuitems[menuitem_id].price), None))
+                if held + quantity > MAX_LINE_QUANTITY or cents * (held + quantity) > MAX_LINE_PRICE * 100:
+                    too_large.add(menuitem_id)
+            if too_large:
+                raise CartLineTooLarge(too_large)
+            created = {}
+            for menuitem_id, quantity in quantities.items():
+                line = lines.get(menuitem_id)
+                created[menuitem_id] = line is None
+                if line is None:
+                    lines[menuitem_id] = [quantity, _cents(menuitems[menuitem_id].price), None]
+                else:
+                    line[0] += quantity
+            was_dirty, entry['dirty'], entry['touched'] = entry['dirty'], True, time.time()
+            self.cache.set(key, entry, self.timeout)
+            if not was_dirty:
+                self._mark(user.pk, True)
+        return [(self._cart_item(user, menuitems[menuitem_id], line), created[menuitem_id])
+                for menuitem_id, line in lines.items() if menuitem_id in quantities]
+
+    def place_order(self, user):
+        """ turn the cached cart into an order, removing rows a flush wrote """
+        key = self._key(user.pk)
+        with self._locked(key):
+            entry = self._entry(user)
+            cart_items = self._cart_items(user, entry['lines'])
+            if not cart_items:
+                raise EmptyCartError(f"Cart of {user.username} is empty")
+            order = self._checkout(user, cart_items)
+            # cache the empty cart, the next read needs no query
+            self.cache.set(key, {'lines': {}, 'dirty': False, 'touched': time.time()}, self.timeout)
+            if entry['dirty']:
+                self._mark(user.pk, False)
+        return order
+
+    @write_transaction
+    def _checkout(self, user, cart_items):
+        order = create_order(user, cart_items)
+        Cart.objects.filter(user=user).delete()
+        return order
+
+    def flush_idle(self, idle=None):
+        """ write the carts untouched for ``idle`` seconds to Cart rows
+
+        Returns the number of carts written. A cart still being added to
+        is left for a later run.
+        """
+        cutoff = time.time() - (self.idle if idle is None else idle)
+        user_ids = sorted(self.cache.get(self.dirty_key, set()))
+        entries = self.cache.get_many([self._key(user_id) for user_id in user_ids])
+        flushed = 0
+        for user_id in user_ids:
+            key = self._key(user_id)
+            if key in entries and entries[key]['touched'] > cutoff:
+                continue
+            with self._locked(key):
+                entry = self.cache.get(key)
+                if entry is None:
+                    logger.warning('cart of user %s was evicted before it was written', user_id)
+                elif entry['dirty']:
+                    if entry['touched'] > cutoff:
+                        continue
+                    for menuitem_id, cart_id in self._write(user_id, entry['lines']).items():
+                        entry['lines'][menuitem_id][2] = cart_id
+                    entry['dirty'] = False
+                    self.cache.set(key, entry, self.timeout)
+                    flushed += 1
+                self._mark(user_id, False)
+        return flushed
+
+    @write_transaction
+    def _write(self, user_id, lines):
+        """ upsert ``lines`` as Cart rows, returns ``{menuitem_id: cart id}`` """
+        existing = set(MenuItem.objects.filter(pk__in=list(lines)).values_list('pk', flat=True))
+        rows = Cart.objects.bulk_create(
+            [Cart(user_id=user_id, menuitem_id=menuitem_id, quantity=quantity,
+                  unit_price=_money(cents), price=_money(cents * quantity))
+             for menuitem_id, (quantity, cents, _) in lines.items() if menuitem_id in existing],
+            update_conflicts=True,
+            unique_fields=['menuitem', 'user'],
+            update_fields=['quantity', 'unit_price', 'price'],
+        )
+        return {row.menuitem_id: row.pk for row in rows}
+
+
+DEFAULT_CART_STORE = {
+    'BACKEND': 'LittleLemonAPI.cart.DatabaseCartStore',
+    'OPTIONS': {},
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cart_store():
+    """ the store configured by ``settings.CART_STORE``, built once """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'CART_STORE', DEFAULT_CART_STORE)
+                try:
+                    store_class = import_string(config['BACKEND'])
+                except ImportError as e:
+                    raise ImproperlyConfigured(f"Invalid CART_STORE backend: {e}")
+                _store = store_class(**config.get('OPTIONS', {}))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_cart_store(*, setting, **kwargs):
+    global _store
+    if setting == 'CART_STORE':
+        _store = None
@@ -0,0 +1,114 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import CatalogChange, Category
+
+# query parameters that change the body of a catalog response
+CATALOG_QUERY_PARAMS = ('ordering', 'category_name', 'cursor', 'page_size', 'stream')
+
+
+def get_catalog_version():
+    """ current catalog version: the id of the last ``CatalogChange``
+
+    The change log triggers number every MenuItem/Category insert, update
+    and delete, bulk and raw SQL writes included, so every worker sees the
+    new version as soon as the write commits. One primary key lookup.
+    ``prune_catalog_changes`` always keeps the last change, so a version is
+    never reused.
+    """
+    return CatalogChange.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+async def aget_catalog_version():
+    return (await CatalogChange.objects.aaggregate(version=Max('id')))['version'] or 0
+
+
+def catalog_etag(request, scope, params=CATALOG_QUERY_PARAMS, version=None):
+    """ strong ETag for a catalog response built from the version and query
+
+    Async callers pass the ``version`` read with ``aget_catalog_version``.
+    """
+    if version is None:
+        version = get_catalog_version()
+    # request.GET works for both DRF and plain Django (async) requests
+    query = '&'.join(f'{name}={request.GET.get(name, "")}' for name in params)
+    digest = hashlib.sha1(f'{scope}:{version}:{query}'.encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+def category_key(title):
+    """ normalized category title, as in the unique ``Lower('title')`` index """
+    return title.lower()
+
+
+class CategoryIds:
+    """Category ids by normalized title, in process memory
+
+    Loaded with one query and kept while the catalog version is unchanged;
+    the version is read from the database, so a category written by any
+    worker reloads the map. The Category signals also drop it right away.
+    """
+
+    def __init__(self):
+        # (catalog version, ids), swapped as a whole
+        self._state = None
+
+    def current(self, version=None):
+        """ the map, reloaded unless loaded at ``version`` (read if not given) """
+        if version is None:
+            version = get_catalog_version()
+        state = self._state
+        if state is None or state[0] != version:
+            state = self.load()
+        return state[1]
+
+    async def acurrent(self, version=None):
+        if version is None:
+            version = await aget_catalog_version()
+        state = self._state
+        if state is None or state[0] != version:
+            state = await sync_to_async(self.load)()
+        return state[1]
+
+    def load(self):
+        # read the version first: a write landing meanwhile triggers a reload
+        version = get_catalog_version()
+        ids = {}
+        # SQLite's LOWER only folds ASCII: titles differing in the case of
+        # other letters can coexist, the oldest category gets the key
+        for pk, title in Category.objects.order_by('-id').values_list('id', 'title'):
+            ids[category_key(title)] = pk
+        self._state = (version, ids)
+        return self._state
+
+    def clear(self):
+        self._state = None
+
+    def get(self, title, version=None):
+        """ id of the category titled ``title`` in any case, or None """
+        return self.current(version).get(category_key(title))
+
+    async def aget(self, title, version=None):
+        return (await self.acurrent(version)).get(category_key(title))
+
+
+category_ids = CategoryIds()
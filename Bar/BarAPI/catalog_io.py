@@ -0,0 +1,255 @@
+import codecs
+import csv
+import io
+import json
+import shutil
+import tempfile
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db.models.functions import Lower
+
+from .catalog import category_key
+from .db import write_transaction
+from .models import Category, MenuItem
+from .renderers import dumps
+from .serializers import CategoryImportSerializer, MenuItemImportSerializer
+
+# rows validated and written together: one reference lookup, one existence
+# check and bulk_create / bulk_update per batch
+IMPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+}
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ImportReport:
+    """Counts of an import and its first ``MAX_REPORTED_ERRORS`` row errors"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, row, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def read_rows(stream, fmt, report):
+    """ ``(row number, dict)`` pairs read lazily from a CSV or NDJSON upload
+
+    Rows are numbered from 1, the CSV header excluded. Blank cells and
+    columns are left out so optional fields take their default. NDJSON lines
+    that are not a JSON object are reported and skipped.
+    """
+    text = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, {key: value for key, value in row.items() if key and value not in (None, '')}
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            report.error(number, {'non_field_errors': ['Invalid JSON']})
+            continue
+        if not isinstance(row, dict):
+            report.error(number, {'non_field_errors': ['Expected a JSON object']})
+            continue
+        yield number, row
+
+
+def batched(rows, size):
+    """ lists of up to ``size`` items of an iterable, read lazily """
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class CatalogImport:
+    """Validate and write uploaded rows in batches
+
+    A row with an ``id`` updates that object, one without creates a new
+    one. Invalid rows are reported and skipped; the valid ones are written
+    in a single transaction. The upload is spooled first, like Django's
+    file uploads, so the transaction does not hold the SQLite write lock
+    while the client is still sending.
+    """
+    model = None
+    serializer_class = None
+    fields = ()
+
+    def run(self, stream, fmt):
+        """ import a CSV or NDJSON byte stream, returns the ``ImportReport`` """
+        with tempfile.SpooledTemporaryFile(settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+                                           dir=settings.FILE_UPLOAD_TEMP_DIR) as upload:
+            shutil.copyfileobj(stream, upload)
+            return self.write(upload, fmt)
+
+    @write_transaction
+    def write(self, upload, fmt):
+        # replayed from the first row when SQLite is locked
+        upload.seek(0)
+        report = ImportReport()
+        for batch in batched(read_rows(upload, fmt, report), IMPORT_BATCH_SIZE):
+            self.import_batch(batch, report)
+        return report
+
+    def import_batch(self, batch, report):
+        valid = []
+        for number, row in batch:
+            serializer = self.serializer_class(data=row)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                report.error(number, serializer.errors)
+        valid = self.check_references(valid, report)
+
+        ids = {data['id'] for _, data in valid if 'id' in data}
+        existing = set(self.model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+        # updates grouped by their columns: an optional one a row leaves out keeps its value
+        creates, updates = [], {}
+        for number, data in valid:
+            if 'id' not in data:
+                creates.append(self.instance(data))
+            elif data['id'] in existing:
+                fields = tuple(field for field in self.fields if field in data)
+                updates.setdefault(fields, []).append(self.instance(data))
+            else:
+                report.error(number, {'id': [f"{self.model._meta.verbose_name} {data['id']} does not exist"]})
+        if creates:
+            self.model.objects.bulk_create(creates)
+        for fields, objs in updates.items():
+            self.model.objects.bulk_update(objs, fields)
+        report.created += len(creates)
+        report.updated += sum(len(objs) for objs in updates.values())
+
+    def check_references(self, valid, report):
+        return valid
+
+    def instance(self, data):
+        return self.model(**data)
+
+
+class CategoryImport(CatalogImport):
+    model = Category
+    serializer_class = CategoryImportSerializer
+    fields = ('slug', 'title')
+
+    def check_references(self, valid, report):
+        """ refuse a title another category holds, in any case
+
+        Earlier batches are already written, so the lookup sees them; the
+        rows of this batch are checked against each other.
+        """
+        keys = {category_key(data['title']) for _, data in valid}
+        # normalized title -> id of its category, None for one created by this batch
+        taken = dict(Category.objects.annotate(key=Lower('title')).filter(key__in=keys).values_list('key', 'id'))
+        checked = []
+        for number, data in valid:
+            key = category_key(data['title'])
+            if key in taken and (taken[key] is None or taken[key] != data.get('id')):
+                report.error(number, {'title': [f"a category titled '{data['title']}' already exists"]})
+                continue
+            taken[key] = data.get('id')
+            checked.append((number, data))
+        return checked
+
+
+class MenuItemImport(CatalogImport):
+    model = MenuItem
+    serializer_class = MenuItemImportSerializer
+    fields = ('title', 'price', 'featured', 'category')
+
+    def check_references(self, valid, report):
+        category_ids = {data['category'] for _, data in valid}
+        known = set(Category.objects.filter(pk__in=category_ids).values_list('pk', flat=True)) if category_ids else set()
+        checked = []
+        for number, data in valid:
+            if data['category'] in known:
+                checked.append((number, data))
+            else:
+                report.error(number, {'category': [f"category {data['category']} does not exist"]})
+        return checked
+
+    def instance(self, data):
+        # new items are not featured unless the row says so
+        data = {'featured': False, **data}
+        return MenuItem(category_id=data.pop('category'), **data)
+
+
+CATALOG_IMPORTS = {
+    'categories': CategoryImport,
+    'menu-items': MenuItemImport,
+}
+
+CATALOG_EXPORTS = {
+    'categories': (Category, ('id', 'slug', 'title')),
+    'menu-items': (MenuItem, ('id', 'title', 'price', 'featured', 'category')),
+}
+
+
+def _cell(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return '' if value is None else str(value)
+
+
+def json_value(value):
+    # prices keep their two decimals, as in the API
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def csv_chunks(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """ ``header`` then ``rows`` (tuples) as CSV byte chunks of ``chunk_size`` rows """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for chunk in batched(rows, chunk_size):
+        writer.writerows([_cell(value) for value in row] for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # header of an empty export
+        yield buffer.getvalue().encode()
+
+
+def export_rows(kind, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """ every row of ``kind`` by id as CSV or NDJSON byte chunks
+
+    Rows are read as tuples with ``values_list().iterator()``, no model
+    instance is built and at most one chunk is held in memory.
+    """
+    model, fields = CATALOG_EXPORTS[kind]
+    rows = model.objects.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        yield from csv_chunks(fields, rows, chunk_size)
+        return
+    for chunk in batched(rows, chunk_size):
+        yield b''.join(dumps({field: json_value(value) for field, value in zip(fields, row)}) + b'\n'
+                       for row in chunk)
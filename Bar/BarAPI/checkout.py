@@ -0,0 +1,64 @@
+from django.utils import timezone
+
+from .db import write_transaction
+from .models import Cart, Order, OrderItem
+from .reports import record_order_sales
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into an order"""
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+def create_order(user, cart_items):
+    """ insert the Order of ``cart_items``, its OrderItems and sales rollups
+
+    ``cart_items`` are Cart rows or unsaved Cart instances. The caller owns
+    the transaction and removes the cart.
+    """
+    order = Order.objects.create(
+        user=user,
+        delivery_crew=None,
+        status=False,
+        total=sum(item.price for item in cart_items),
+        date=timezone.now().date(),
+    )
+    order_items = OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            menuitem_id=item.menuitem_id,
+            quantity=item.quantity,
+            unit_price=item.unit_price,
+            price=item.price,
+        )
+        for item in cart_items
+    ])
+    record_order_sales(order, order_items)
+    return order
+
+
+@write_transaction
+def place_order(user):
+    """ turn the user's cart into an Order with its OrderItems
+
+    Runs in one transaction with a fixed number of queries regardless of the
+    basket size: read the cart, insert the order, bulk insert the lines,
+    update the daily sales rollups and delete the cart rows. Any failure
+    rolls everything back, so no empty order is left behind.
+    """
+    cart_items = list(
+        Cart.objects.filter(user=user).only('id', 'menuitem_id', 'quantity', 'unit_price', 'price')
+    )
+    if not cart_items:
+        raise EmptyCartError(f"Cart of {user.username} is empty")
+
+    order = create_order(user, cart_items)
+
+    # a concurrent checkout of the same cart deletes fewer rows than we read
+    deleted, _ = Cart.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+    if deleted != len(cart_items):
+        raise CheckoutError("Cart changed during checkout, please retry")
+    return order
@@ -0,0 +1,45 @@
+import functools
+import random
+import time
+
+from django.db import OperationalError, connection, transaction
+
+# bounded retry for writes that lose the SQLite write lock
+WRITE_RETRIES = 3
+RETRY_BACKOFF = 0.05
+
+
+def is_locked_error(exc):
+    message = str(exc)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def write_transaction(func):
+    """ run ``func`` in its own transaction, retrying when SQLite is locked
+
+    With the production SQLite profile the transaction starts with
+    BEGIN IMMEDIATE, so a lock error happens before any work is done and the
+    whole call can safely be replayed. Calls nested in an outer transaction
+    are not retried, the outer block owns the lock.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == WRITE_RETRIES or connection.in_atomic_block or not is_locked_error(exc):
+                    raise
+                time.sleep(RETRY_BACKOFF * (2 ** attempt) * (0.5 + random.random()))
+    return wrapper
+
+
+def values_cte(name, columns, rows):
+    """ ``WITH name (columns) AS (VALUES ...)`` and its flat parameter list
+
+    Lets one INSERT ... SELECT join a batch of rows against real tables.
+    """
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = f'WITH {name} ({", ".join(columns)}) AS (VALUES {", ".join([placeholders] * len(rows))}) '
+    return sql, [value for row in rows for value in row]
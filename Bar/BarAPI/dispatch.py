@@ -0,0 +1,97 @@
+import functools
+import heapq
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from .db import values_cte, write_transaction
+from .events import ORDER_ASSIGNED, order_event, publish
+from .models import ORDER_SEQUENCE, Order, Sequence
+from .roles import DELIVERY
+from .serializers import OrderSerializer
+
+MAX_DISPATCH = 500
+
+
+class NoDeliveryCrew(Exception):
+    """Raised when there is nobody to dispatch orders to"""
+
+
+def _assign_batch_size():
+    # three parameters per row plus the status one, within the backend's limit
+    max_params = connection.features.max_query_params
+    return (max_params - 1) // 3 if max_params else MAX_DISPATCH
+
+
+def _assign_sql(rows):
+    qn = connection.ops.quote_name
+    table = qn(Order._meta.db_table)
+    assigned, params = values_cte('assigned', ('order_id', 'delivery_crew_id', 'updated'), rows)
+    # only orders still unassigned and pending, a concurrent dispatch or a
+    # manual assignment keeps its driver
+    return assigned + (
+        f'UPDATE {table} SET delivery_crew_id = a.delivery_crew_id, updated = a.updated '
+        f'FROM assigned a WHERE {table}.id = a.order_id '
+        f'AND {table}.delivery_crew_id IS NULL AND {table}.status = %s '
+        f'RETURNING {table}.id, {table}.delivery_crew_id'
+    ), params + [False]
+
+
+@write_transaction
+def dispatch_orders(limit=MAX_DISPATCH, order_ids=None):
+    """ assign unassigned pending orders across the Delivery group
+
+    Oldest orders go first, each to the driver with the fewest open
+    (undelivered) orders at that point, ties broken by user id. Four
+    queries for up to 332 orders on SQLite: the drivers with their open
+    order counts, the orders, the change numbers and one UPDATE ... FROM
+    VALUES, repeated for each further 332 to stay under the parameter limit.
+    The orders it assigned are then read back in one pass for their
+    ``order.assigned`` events, published on commit.
+
+    Returns ``(assignments, open_orders)``: ``{order_id: driver username}``
+    for the orders actually assigned and ``{username: open orders}``
+    afterwards. Raises ``NoDeliveryCrew`` when the group has no active member.
+    """
+    drivers = list(
+        User.objects.filter(groups__name=DELIVERY, is_active=True)
+        .annotate(open_orders=Count('delivery_crew', filter=Q(delivery_crew__status=False)))
+        .order_by('id').values_list('id', 'username', 'open_orders')
+    )
+    if not drivers:
+        raise NoDeliveryCrew("No active delivery crew to dispatch to")
+    usernames = {driver_id: username for driver_id, username, _ in drivers}
+    open_orders = {username: count for _, username, count in drivers}
+
+    pending = Order.objects.filter(delivery_crew__isnull=True, status=False)
+    if order_ids is not None:
+        pending = pending.filter(pk__in=order_ids)
+    pending = list(pending.order_by('date', 'id').values_list('id', flat=True)[:limit])
+    if not pending:
+        return {}, open_orders
+
+    heap = [(count, driver_id) for driver_id, _, count in drivers]
+    heapq.heapify(heap)
+    plan = []
+    for order_id in pending:
+        count, driver_id = heap[0]
+        heapq.heapreplace(heap, (count + 1, driver_id))
+        plan.append((order_id, driver_id))
+
+    last = Sequence.next(ORDER_SEQUENCE, count=len(plan))
+    rows = [(order_id, driver_id, number)
+            for number, (order_id, driver_id) in enumerate(plan, start=last - len(plan) + 1)]
+    assignments = {}
+    batch_size = _assign_batch_size()
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.execute(*_assign_sql(rows[start:start + batch_size]))
+            assignments.update((order_id, usernames[driver_id]) for order_id, driver_id in cursor.fetchall())
+
+    if assignments:
+        for order in OrderSerializer.setup_eager_loading(Order.objects.filter(pk__in=assignments)):
+            transaction.on_commit(functools.partial(publish, order_event(ORDER_ASSIGNED, order)))
+    for username in assignments.values():
+        open_orders[username] += 1
+    return assignments, open_orders
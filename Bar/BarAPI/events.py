@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .renderers import dumps
+from .serializers import OrderSerializer
+
+logger = logging.getLogger(__name__)
+
+ORDER_ASSIGNED = 'order.assigned'
+ORDER_STATUS = 'order.status'
+
+DEFAULT_ORDER_EVENTS = {'KEEPALIVE': 15, 'QUEUE_SIZE': 100}
+
+DEFAULT_BROKER = {
+    'BACKEND': 'LittleLemonAPI.events.LocMemBroker',
+    'OPTIONS': {},
+}
+
+
+def order_event(kind, order, *user_ids):
+    """ an event about ``order`` for its customer, its driver and ``user_ids``
+
+    The payload is the order as the order lists return it; ``id`` is the
+    order's change number.
+    """
+    recipients = {order.user_id, order.delivery_crew_id, *user_ids} - {None}
+    return {
+        'event': kind,
+        'id': order.updated,
+        'recipients': sorted(recipients),
+        'data': dict(OrderSerializer(order).data),
+    }
+
+
+def sse_message(event):
+    """ one ``text/event-stream`` message, the recipients left out """
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: ".encode() + dumps(event['data']) + b'\n\n'
+
+
+class Subscription:
+    """The events of one user for one open stream, on its event loop
+
+    Events may be delivered from any thread. Past ``maxsize`` undelivered
+    events the subscription is marked ``overflowed`` and gets no more: the
+    stream ends and the client reloads its orders when it reconnects.
+    """
+
+    def __init__(self, hub, user_id, loop, maxsize):
+        self.hub = hub
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # the loop is closed, the stream is gone
+            pass
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """ the next event, or None after ``timeout`` seconds without one """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class OrderEventHub:
+    """Open event streams of this process by user id
+
+    ``dispatch`` only looks up the event's recipients, so its cost does
+    not grow with the number of open streams.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, loop=None):
+        config = getattr(settings, 'ORDER_EVENTS', DEFAULT_ORDER_EVENTS)
+        subscription = Subscription(self, user_id, loop or asyncio.get_running_loop(), config['QUEUE_SIZE'])
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def dispatch(self, event):
+        with self._lock:
+            subscriptions = [subscription for user_id in event['recipients']
+                             for subscription in self._subscriptions.get(user_id, ())]
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+hub = OrderEventHub()
+
+
+class LocMemBroker:
+    """Events handed straight to the hub of this process, for a single worker"""
+
+    def __init__(self):
+        self._dispatch = None
+
+    def start(self, dispatch):
+        self._dispatch = dispatch
+
+    def publish(self, event):
+        if self._dispatch is not None:
+            self._dispatch(event)
+
+
+class SQLiteBroker:
+    """Events through a SQLite file shared by every worker on the host
+
+    ``publish`` appends the event to the file. Each process with open
+    streams runs one thread reading the new rows every ``poll_interval``
+    seconds into its hub, so every worker delivers the event, the
+    publishing one included. Only the last ``keep`` events are kept.
+    """
+
+    def __init__(self, path, poll_interval=0.2, keep=10_000, timeout=1.0):
+        self.path = str(path)
+        self.poll_interval = poll_interval
+        self.keep = keep
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            # AUTOINCREMENT: ids are not reused once old rows are pruned
+            conn.execute('CREATE TABLE IF NOT EXISTS order_event '
+                         '(id INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    def start(self, dispatch):
+        with self._lock:
+            if self._thread is None:
+                last = self._connection().execute('SELECT COALESCE(MAX(id), 0) FROM order_event').fetchone()[0]
+                self._thread = threading.Thread(target=self._poll, args=(dispatch, last),
+                                                name='order-events', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _poll(self, dispatch, last):
+        conn = self._connection()
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                for last, payload in conn.execute('SELECT id, payload FROM order_event WHERE id > ? ORDER BY id',
+                                                  (last,)):
+                    dispatch(json.loads(payload))
+            except Exception:
+                # a locked file or a bad event must not end delivery to this process;
+                # ``last`` already points past an event that failed
+                logger.exception('reading order events from %s failed', self.path)
+
+    def publish(self, event):
+        conn = self._connection()
+        event_id = conn.execute('INSERT INTO order_event (payload) VALUES (?)', (dumps(event),)).lastrowid
+        if event_id % 1000 == 0:
+            conn.execute('DELETE FROM order_event WHERE id <= ?', (event_id - self.keep,))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """ the broker configured by ``settings.EVENTS_BROKER``, built once """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = getattr(settings, 'EVENTS_BROKER', DEFAULT_BROKER)
+                try:
+                    broker_class = import_string(config['BACKEND'])
+                except ImportError as e:
+                    raise ImproperlyConfigured(f"Invalid EVENTS_BROKER backend: {e}")
+                _broker = broker_class(**config.get('OPTIONS', {}))
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(*, setting, **kwargs):
+    global _broker
+    if setting == 'EVENTS_BROKER':
+        if _broker is not None and hasattr(_broker, 'stop'):
+            _broker.stop()
+        _broker = None
+
+
+def publish(event):
+    """ send ``event`` to the open streams of its recipients, in every worker
+
+    Called once the change is committed: a broker failure is logged, the
+    request that made the change still succeeds and clients catch up by
+    reloading their orders.
+    """
+    try:
+        get_broker().publish(event)
+    except Exception:
+        logger.exception('publishing %s event %s failed', event['event'], event['id'])
+
+
+def subscribe(user_id, loop=None):
+    """ a subscription to the events of ``user_id`` on ``loop`` (the running one)
+
+    The first one starts the broker's delivery to this process.
+    """
+    get_broker().start(hub.dispatch)
+    return hub.subscribe(user_id, loop)
+
+
+class EventStream:
+    """``text/event-stream`` chunks of a subscription until the client leaves
+
+    A comment is sent every ``keepalive`` seconds without an event so
+    proxies keep the connection open. Django calls ``close()`` once the
+    response is done, a disconnect included, which ends the subscription.
+    """
+
+    def __init__(self, subscription, keepalive):
+        self.subscription = subscription
+        self.keepalive = keepalive
+
+    async def __aiter__(self):
+        # EventSource clients reconnect after this many milliseconds
+        yield b'retry: 3000\n\n'
+        while True:
+            event = await self.subscription.get(self.keepalive)
+            if self.subscription.overflowed:
+                yield b'event: reset\ndata: {}\n\n'
+                return
+            yield b': keep-alive\n\n' if event is None else sse_message(event)
+
+    def close(self):
+        self.subscription.close()
@@ -0,0 +1,165 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+DEFAULT_IDEMPOTENCY = {'SIZE': 10_000, 'TIMEOUT': 24 * 3600, 'WAIT': 10}
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class KeyReused(Exception):
+    """The key was first sent with a different request body"""
+
+
+class RequestInProgress(Exception):
+    """The first request with the key was still running when the wait ended"""
+
+
+class _Entry:
+    __slots__ = ('fingerprint', 'done', 'response', 'expires')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        # (status, data) once the first request succeeded
+        self.response = None
+        self.expires = None
+
+
+class IdempotencyStore:
+    """First successful responses by idempotency key, in process memory
+
+    An entry is claimed before the request runs, so a concurrent duplicate
+    waits for it rather than running the write again. Completed entries
+    expire after ``settings.IDEMPOTENCY['TIMEOUT']`` seconds and the least
+    recently used ones are dropped beyond ``SIZE``. A failed request frees
+    its key for the next attempt.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key, fingerprint, wait):
+        """ the stored ``(status, data)`` of ``key``, or ``(None, entry)``
+        when the caller runs the request and must ``finish(key, entry, ...)``
+
+        Raises ``KeyReused`` when the key came with another body and
+        ``RequestInProgress`` when the first request is still running after
+        ``wait`` seconds.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    entry = self._entries[key] = _Entry(fingerprint)
+                    self._evict()
+                    return None, entry
+                if entry.fingerprint != fingerprint:
+                    raise KeyReused(key)
+                if entry.response is not None:
+                    self._entries.move_to_end(key)
+                    return entry.response, None
+            if not entry.done.wait(max(deadline - time.monotonic(), 0)):
+                raise RequestInProgress(key)
+            # done: replay it, or claim the key if the first attempt failed
+
+    def finish(self, key, entry, response=None):
+        """ keep ``(status, data)`` for replays, or free the key with None """
+        config = getattr(settings, 'IDEMPOTENCY', DEFAULT_IDEMPOTENCY)
+        with self._lock:
+            if response is not None:
+                entry.response = response
+                entry.expires = time.monotonic() + config['TIMEOUT']
+            elif self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def _evict(self):
+        size = getattr(settings, 'IDEMPOTENCY', DEFAULT_IDEMPOTENCY)['SIZE']
+        if len(self._entries) <= size:
+            return
+        # in-flight entries stay, their waiters need them
+        for key in [key for key, entry in self._entries.items() if entry.response is not None]:
+            if len(self._entries) <= size:
+                break
+            del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+idempotency_store = IdempotencyStore()
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = sorted(data.lists())
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _detach(data):
+    # serializer.data keeps a reference to its serializer and instances
+    if isinstance(data, dict):
+        return dict(data)
+    if isinstance(data, list):
+        return list(data)
+    return data
+
+
+def idempotent(view):
+    """ replay the first successful response to a repeated ``Idempotency-Key``
+
+    Goes under the DRF view decorators (or on a view method): the key is
+    scoped to the authenticated user, method and path. A replay runs no
+    query and carries ``Idempotent-Replayed: true``. Requests without the
+    header are not affected.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if isinstance(arg, Request))
+        header = request.headers.get(IDEMPOTENCY_HEADER)
+        if header is None:
+            return view(*args, **kwargs)
+        if not header or len(header) > MAX_KEY_LENGTH or not header.isprintable():
+            return Response({"error": f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} printable characters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        key = f'{request.user.pk}:{request.method}:{request.path}:{header}'
+        wait = getattr(settings, 'IDEMPOTENCY', DEFAULT_IDEMPOTENCY)['WAIT']
+        try:
+            stored, entry = idempotency_store.begin(key, request_fingerprint(request), wait)
+        except KeyReused:
+            return Response({"error": f"{IDEMPOTENCY_HEADER} was already used with a different request"},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except RequestInProgress:
+            return Response({"error": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+                            status=status.HTTP_409_CONFLICT)
+        if stored is not None:
+            stored_status, data = stored
+            return Response(data, status=stored_status, headers={REPLAYED_HEADER: 'true'})
+
+        response = None
+        try:
+            response = view(*args, **kwargs)
+        finally:
+            # only successes are kept: a failed write can be tried again
+            succeeded = response is not None and status.is_success(response.status_code)
+            idempotency_store.finish(key, entry, (response.status_code, _detach(response.data)) if succeeded else None)
+        return response
+    return wrapper
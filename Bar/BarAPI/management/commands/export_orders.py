@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...catalog_io import EXPORT_CONTENT_TYPES
+from ...order_export import export_orders
+from .rebuild_sales_rollups import iso_date
+
+
+class Command(BaseCommand):
+    help = 'Stream the order history with its lines as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=iso_date, help='first order day (default: first order)')
+        parser.add_argument('--end', type=iso_date, help='last order day (default: last order)')
+        parser.add_argument('--output', choices=sorted(EXPORT_CONTENT_TYPES), default='csv', help='default: csv')
+        parser.add_argument('--file', help='write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+        chunks = export_orders(options['output'], start, end)
+        if options['file']:
+            with open(options['file'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Exported orders to {options['file']}"))
+            return
+        for chunk in chunks:
+            self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ...cart import get_cart_store
+
+
+class Command(BaseCommand):
+    help = 'Write carts kept in the cache to the Cart table once they are idle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle', type=int,
+                            help='seconds without a change before a cart is written (default: the store setting)')
+
+    def handle(self, *args, **options):
+        flushed = get_cart_store().flush_idle(options['idle'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {flushed} carts'))
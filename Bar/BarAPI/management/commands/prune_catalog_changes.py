@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ...sync import CATALOG_CHANGES_KEPT, prune_catalog_changes
+
+
+class Command(BaseCommand):
+    help = 'Drop old menu changes; clients that are further behind get a snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=CATALOG_CHANGES_KEPT,
+                            help=f'latest changes to keep (default: {CATALOG_CHANGES_KEPT})')
+
+    def handle(self, *args, **options):
+        deleted = prune_catalog_changes(options['keep'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} menu changes'))
@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...reports import rebuild_sales_rollups
+
+
+def iso_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"'{value}' is not a date (YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups from the orders of a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=iso_date, help='first day to rebuild (default: first order)')
+        parser.add_argument('--end', type=iso_date, help='last day to rebuild (default: last order)')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+        days, categories, menuitems = rebuild_sales_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {days} days, {categories} category rows and {menuitems} menu item rows'
+        ))
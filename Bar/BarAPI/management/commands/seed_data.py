@@ -0,0 +1,149 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import ORDER_SEQUENCE, Cart, Category, MenuItem, Order, OrderItem, Sequence
+from ...reports import rebuild_sales_rollups
+from ...roles import CUSTOMER, DELIVERY, MANAGER
+
+USER_PREFIX = 'seed_'
+CATEGORY_PREFIX = 'seed-'
+SEED_PASSWORD = 'seed-password'
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Seed a deterministic, production-sized dataset with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='random seed, same seed gives the same data')
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--menu-items', type=int, default=300)
+        parser.add_argument('--customers', type=int, default=500)
+        parser.add_argument('--managers', type=int, default=5)
+        parser.add_argument('--delivery', type=int, default=25)
+        parser.add_argument('--carts', type=int, default=100, help='number of customers with a non-empty cart')
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--max-lines', type=int, default=4, help='maximum cart / order lines')
+        parser.add_argument('--days', type=int, default=365, help='spread order dates over this many days')
+        parser.add_argument('--clear', action='store_true', help='remove previously seeded data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(username__startswith=USER_PREFIX).exists():
+            raise CommandError('Seed data already exists, run again with --clear to replace it')
+
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            categories = self.seed_categories(options['categories'])
+            items = self.seed_menu_items(rng, categories, options['menu_items'])
+            customers, managers, drivers = self.seed_users(options)
+            carts = self.seed_carts(rng, customers[:options['carts']], items, options['max_lines'])
+            orders, lines = self.seed_orders(rng, customers, drivers, items, options)
+            # bulk inserted orders bypass checkout, which maintains the rollups
+            rebuild_sales_rollups()
+
+        if options['verbosity'] >= 1:
+            self.stdout.write(self.style.SUCCESS(
+                f'Seeded {len(categories)} categories, {len(items)} menu items, '
+                f'{len(customers)} customers, {len(managers)} managers, {len(drivers)} delivery crew, '
+                f'{carts} cart rows, {orders} orders and {lines} order items'
+            ))
+
+    def clear(self):
+        with transaction.atomic():
+            users = User.objects.filter(username__startswith=USER_PREFIX)
+            Order.objects.filter(user__in=users).delete()
+            Cart.objects.filter(user__in=users).delete()
+            users.delete()
+            MenuItem.objects.filter(category__slug__startswith=CATEGORY_PREFIX).delete()
+            Category.objects.filter(slug__startswith=CATEGORY_PREFIX).delete()
+            rebuild_sales_rollups()
+
+    def seed_categories(self, count):
+        return Category.objects.bulk_create(
+            [Category(slug=f'{CATEGORY_PREFIX}{i}', title=f'Category {i}') for i in range(count)],
+            batch_size=BATCH_SIZE,
+        )
+
+    def seed_menu_items(self, rng, categories, count):
+        return MenuItem.objects.bulk_create(
+            [
+                MenuItem(
+                    title=f'Menu item {i}',
+                    price=Decimal(rng.randrange(150, 3000)) / 100,
+                    featured=rng.random() < 0.1,
+                    category=rng.choice(categories),
+                )
+                for i in range(count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    def seed_users(self, options):
+        # hashing is slow, every seeded user shares one password hash
+        password = make_password(SEED_PASSWORD)
+
+        def create(role, count, **extra):
+            users = User.objects.bulk_create(
+                [User(username=f'{USER_PREFIX}{role.lower()}_{i:05d}', password=password, **extra) for i in range(count)],
+                batch_size=BATCH_SIZE,
+            )
+            group, _ = Group.objects.get_or_create(name=role)
+            User.groups.through.objects.bulk_create(
+                [User.groups.through(user_id=user.pk, group_id=group.pk) for user in users],
+                batch_size=BATCH_SIZE,
+            )
+            return users
+
+        customers = create(CUSTOMER, options['customers'])
+        managers = create(MANAGER, options['managers'], is_staff=True)
+        drivers = create(DELIVERY, options['delivery'])
+        return customers, managers, drivers
+
+    def seed_carts(self, rng, customers, items, max_lines):
+        carts = []
+        for customer in customers:
+            for item in rng.sample(items, rng.randint(1, max_lines)):
+                quantity = rng.randint(1, 3)
+                carts.append(Cart(user=customer, menuitem=item, quantity=quantity,
+                                  unit_price=item.price, price=item.price * quantity))
+        Cart.objects.bulk_create(carts, batch_size=BATCH_SIZE)
+        return len(carts)
+
+    def seed_orders(self, rng, customers, drivers, items, options):
+        today = datetime.date.today()
+        orders, order_lines = [], []
+        for _ in range(options['orders']):
+            lines = []
+            for item in rng.sample(items, rng.randint(1, options['max_lines'])):
+                quantity = rng.randint(1, 3)
+                lines.append(OrderItem(menuitem=item, quantity=quantity,
+                                       unit_price=item.price, price=item.price * quantity))
+            driver = rng.choice(drivers) if drivers and rng.random() < 0.8 else None
+            orders.append(Order(
+                user=rng.choice(customers),
+                delivery_crew=driver,
+                status=driver is not None and rng.random() < 0.7,
+                total=sum(line.price for line in lines),
+                date=today - datetime.timedelta(days=rng.randrange(options['days'])),
+            ))
+            order_lines.append(lines)
+
+        # bulk_create skips Order.save, number the orders for the driver sync here
+        last = Sequence.next(ORDER_SEQUENCE, count=len(orders)) if orders else 0
+        for number, order in enumerate(orders, start=last - len(orders) + 1):
+            order.updated = number
+        Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+        for order, lines in zip(orders, order_lines):
+            for line in lines:
+                line.order = order
+        flat = [line for lines in order_lines for line in lines]
+        OrderItem.objects.bulk_create(flat, batch_size=BATCH_SIZE)
+        return len(orders), len(flat)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...warmup import WARMUP_PHASES, warm_up
+
+
+class Command(BaseCommand):
+    help = 'Load URL patterns, settings classes, serializers, the database connection and caches, timing each phase'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phase', action='append', choices=list(WARMUP_PHASES), dest='phases',
+                            help='run only this phase (repeatable, default: all)')
+
+    def handle(self, *args, **options):
+        timings = warm_up(options['phases'])
+        for name, seconds in timings.items():
+            self.stdout.write(f'{name:<12}{seconds * 1000:>9.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Warmed up in {sum(timings.values()) * 1000:.1f} ms'))
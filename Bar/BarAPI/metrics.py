@@ -0,0 +1,112 @@
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+
+_current = contextvars.ContextVar('bar_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a view runs more queries than its budget"""
+
+
+class RequestMetrics:
+    """Per-request counters filled by QueryTimingMiddleware"""
+
+    def __init__(self):
+        self.queries = 0
+        # queries run by outside_budget blocks
+        self.unbudgeted = 0
+        self.sql_time = 0.0
+        self.phases = {}
+        self.budget = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @property
+    def budgeted_queries(self):
+        return self.queries - self.unbudgeted
+
+    def over_budget(self):
+        return self.budget is not None and self.budgeted_queries > self.budget
+
+
+def current_metrics():
+    return _current.get()
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def measure(phase):
+    """ add the time spent in the block to ``phase`` of the current request """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(phase, time.perf_counter() - start)
+
+
+@contextmanager
+def outside_budget():
+    """ queries of the block are counted and timed but not held against the
+    view's budget; for periodic housekeeping that happens to land in a request
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    before = metrics.queries
+    try:
+        yield
+    finally:
+        metrics.unbudgeted += metrics.queries - before
+
+
+def query_budget(limit):
+    """ declare the maximum number of SQL queries a view may run
+
+    Apply it above ``@api_view`` for function views; viewsets can set a
+    ``query_budget`` class attribute instead.
+    """
+    def declare():
+        metrics = _current.get()
+        # the outermost declaration wins
+        if metrics is not None and metrics.budget is None:
+            metrics.budget = limit
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapped(request, *args, **kwargs):
+                declare()
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapped(request, *args, **kwargs):
+                declare()
+                return view(request, *args, **kwargs)
+        wrapped.query_budget = limit
+        return wrapped
+    return decorator
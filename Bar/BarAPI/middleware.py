@@ -0,0 +1,106 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .metrics import RequestMetrics, QueryBudgetExceeded, activate, current_metrics, deactivate
+
+logger = logging.getLogger('LittleLemonAPI.requests')
+
+
+class QueryTimingMiddleware:
+    """Record query count, SQL, serializer and view time for every request
+
+    The numbers are sent back in a ``Server-Timing`` header and logged as
+    one JSON line. Views declaring a query budget log a warning when they go
+    over it, or raise ``QueryBudgetExceeded`` when ``QUERY_BUDGET_STRICT``
+    is set (as the test suite does).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = activate(metrics)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(metrics.execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = activate(metrics)
+        start = time.perf_counter()
+        # the async ORM runs queries in the request's thread-sensitive
+        # executor, whose connection is not the event loop thread's one
+        await sync_to_async(_add_execute_wrapper)(metrics.execute_wrapper)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_execute_wrapper)(metrics.execute_wrapper)
+            deactivate(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, view_time):
+        response['Server-Timing'] = self.server_timing(metrics, view_time)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'sql_ms': round(metrics.sql_time * 1000, 2),
+            'serialize_ms': round(metrics.phases.get('serialize', 0.0) * 1000, 2),
+            'view_ms': round(view_time * 1000, 2),
+        }
+        logger.info(json.dumps(record))
+
+        if metrics.over_budget():
+            message = (f"{request.method} {request.path} ran {metrics.budgeted_queries} queries, "
+                       f"budget is {metrics.budget}")
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # viewsets declare the budget as a class attribute
+        budget = getattr(getattr(view_func, 'cls', None), 'query_budget', None)
+        if budget is not None:
+            current_metrics().budget = budget
+        return None
+
+    @staticmethod
+    def server_timing(metrics, view_time):
+        entries = [
+            f'db;dur={metrics.sql_time * 1000:.2f};desc="{metrics.queries} queries"',
+            f'serialize;dur={metrics.phases.get("serialize", 0.0) * 1000:.2f}',
+        ]
+        entries += [
+            f'{phase};dur={seconds * 1000:.2f}'
+            for phase, seconds in metrics.phases.items() if phase != 'serialize'
+        ]
+        entries.append(f'view;dur={view_time * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def _add_execute_wrapper(wrapper):
+    connection.execute_wrappers.append(wrapper)
+
+
+def _remove_execute_wrapper(wrapper):
+    connection.execute_wrappers.remove(wrapper)
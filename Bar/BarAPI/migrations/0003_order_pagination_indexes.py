@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0002_alter_cart_price_alter_cart_quantity_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'date', 'id'], name='order_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_crew', 'date', 'id'], name='order_crew_date_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_orders(apps, schema_editor):
+    # existing orders get their id as change number, so a first sync sees them
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    Sequence = apps.get_model('LittleLemonAPI', 'Sequence')
+    Order.objects.update(updated=F('id'))
+    last = Order.objects.aggregate(last=Max('id'))['last'] or 0
+    Sequence.objects.update_or_create(name='order', defaults={'value': last})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0004_daily_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderUnassignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.PositiveBigIntegerField()),
+                ('updated', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_crew', 'updated'], name='order_crew_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='orderunassignment',
+            name='delivery_crew',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='orderunassignment',
+            index=models.Index(fields=['delivery_crew', 'updated'], name='unassign_crew_updated_idx'),
+        ),
+        migrations.RunPython(number_existing_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+SEARCH = '"LittleLemonAPI_menuitemsearch"'
+MENUITEM = '"LittleLemonAPI_menuitem"'
+CATEGORY = '"LittleLemonAPI_category"'
+
+# FTS5 index of menu item and category titles, rowid = menu item id. The
+# prefix indexes make 2 and 3 character typeahead prefixes index lookups.
+# Triggers rather than signals keep it in sync, so bulk_create,
+# QuerySet.update() and raw SQL writes are covered too.
+CREATE = [
+    f"CREATE VIRTUAL TABLE {SEARCH} USING fts5("
+    f"title, category, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+
+    f"CREATE TRIGGER menuitem_search_insert AFTER INSERT ON {MENUITEM} BEGIN "
+    f"INSERT INTO {SEARCH} (rowid, title, category) "
+    f"SELECT new.id, new.title, c.title FROM {CATEGORY} c WHERE c.id = new.category_id; "
+    f"END",
+
+    # price and featured changes leave the index alone
+    f"CREATE TRIGGER menuitem_search_update AFTER UPDATE OF title, category_id ON {MENUITEM} "
+    f"WHEN old.title IS NOT new.title OR old.category_id IS NOT new.category_id BEGIN "
+    f"DELETE FROM {SEARCH} WHERE rowid = old.id; "
+    f"INSERT INTO {SEARCH} (rowid, title, category) "
+    f"SELECT new.id, new.title, c.title FROM {CATEGORY} c WHERE c.id = new.category_id; "
+    f"END",
+
+    f"CREATE TRIGGER menuitem_search_delete AFTER DELETE ON {MENUITEM} BEGIN "
+    f"DELETE FROM {SEARCH} WHERE rowid = old.id; "
+    f"END",
+
+    f"CREATE TRIGGER category_search_update AFTER UPDATE OF title ON {CATEGORY} "
+    f"WHEN old.title IS NOT new.title BEGIN "
+    f"UPDATE {SEARCH} SET category = new.title "
+    f"WHERE rowid IN (SELECT id FROM {MENUITEM} WHERE category_id = new.id); "
+    f"END",
+
+    f"INSERT INTO {SEARCH} (rowid, title, category) "
+    f"SELECT m.id, m.title, c.title FROM {MENUITEM} m JOIN {CATEGORY} c ON c.id = m.category_id",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS category_search_update",
+    "DROP TRIGGER IF EXISTS menuitem_search_delete",
+    "DROP TRIGGER IF EXISTS menuitem_search_update",
+    "DROP TRIGGER IF EXISTS menuitem_search_insert",
+    f"DROP TABLE IF EXISTS {SEARCH}",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0005_order_sync'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE, DROP),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:33
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0006_menu_item_search'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('title'), name='category_title_key', violation_error_message='A category with this title already exists.'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+CHANGE = '"LittleLemonAPI_catalogchange"'
+MENUITEM = '"LittleLemonAPI_menuitem"'
+CATEGORY = '"LittleLemonAPI_category"'
+
+
+def log_trigger(name, event, table, kind, row, deleted, when=''):
+    return (f"CREATE TRIGGER {name} AFTER {event} ON {table} {when}BEGIN "
+            f"INSERT INTO {CHANGE} (kind, object_id, deleted) VALUES ('{kind}', {row}.id, {deleted}); "
+            f"END")
+
+
+# every insert, update and delete of a menu item or category appends a
+# change; updates that leave the row as it was (bulk_update of an unchanged
+# import) do not
+CREATE = [
+    log_trigger('menuitem_change_insert', 'INSERT', MENUITEM, 'menuitem', 'new', 0),
+    log_trigger('menuitem_change_update', 'UPDATE', MENUITEM, 'menuitem', 'new', 0,
+                'WHEN old.title IS NOT new.title OR old.price IS NOT new.price '
+                'OR old.featured IS NOT new.featured OR old.category_id IS NOT new.category_id '),
+    log_trigger('menuitem_change_delete', 'DELETE', MENUITEM, 'menuitem', 'old', 1),
+    log_trigger('category_change_insert', 'INSERT', CATEGORY, 'category', 'new', 0),
+    log_trigger('category_change_update', 'UPDATE', CATEGORY, 'category', 'new', 0,
+                'WHEN old.slug IS NOT new.slug OR old.title IS NOT new.title '),
+    log_trigger('category_change_delete', 'DELETE', CATEGORY, 'category', 'old', 1),
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS category_change_delete",
+    "DROP TRIGGER IF EXISTS category_change_update",
+    "DROP TRIGGER IF EXISTS category_change_insert",
+    "DROP TRIGGER IF EXISTS menuitem_change_delete",
+    "DROP TRIGGER IF EXISTS menuitem_change_update",
+    "DROP TRIGGER IF EXISTS menuitem_change_insert",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0007_category_title_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('menuitem', 'menu item'), ('category', 'category')], max_length=16)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.RunSQL(CREATE, DROP),
+    ]
@@ -1,12 +1,27 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Lower
 
 # Create your models here.
 
+# Category and MenuItem titles are indexed for search by SQLite triggers
+# (migration 0006, see search.py), and their writes logged in CatalogChange by
+# others (migration 0008). A migration that makes SQLite rebuild one of these
+# tables drops its triggers and has to create them again.
+
 class Category(models.Model):
     slug = models.SlugField(null=False)
     title = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        constraints = [
+            # menu filtering resolves a category name through this key, see
+            # catalog.category_ids; an expression index, no table rebuild
+            models.UniqueConstraint(Lower('title'), name='category_title_key',
+                                    violation_error_message='A category with this title already exists.'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -19,6 +34,23 @@ class MenuItem(models.Model):
     def __str__(self):
         return self.title
 
+class CatalogChange(models.Model):
+    """Append-only log of menu item and category writes, for the menu sync
+
+    Rows are written by SQLite triggers, so bulk and raw SQL writes are
+    logged too. The id is the change number: AUTOINCREMENT never reuses one,
+    and SQLite's single writer makes them visible in increasing order.
+    """
+    MENUITEM = 'menuitem'
+    CATEGORY = 'category'
+
+    kind = models.CharField(max_length=16, choices=[(MENUITEM, 'menu item'), (CATEGORY, 'category')])
+    object_id = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.id}__{self.kind}_{self.object_id}'
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -31,16 +63,87 @@ class Cart(models.Model):
     def __str__(self):
         return f"{self.user.username}__{self.menuitem.title}"
 
+class Sequence(models.Model):
+    """Named counters, taken inside the transaction of the change they number
+
+    The increment holds the write lock until commit, so numbers become
+    visible in increasing order and a reader never skips a change.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def next(cls, name, count=1):
+        """ reserve ``count`` numbers of ``name``, returns the last one """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (name, value) VALUES (%s, %s) '
+                f'ON CONFLICT (name) DO UPDATE SET value = {table}.value + excluded.value '
+                f'RETURNING value',
+                [name, count],
+            )
+            return cursor.fetchone()[0]
+
+    def __str__(self):
+        return f'{self.name}={self.value}'
+
+ORDER_SEQUENCE = 'order'
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='delivery_crew')
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True) 
+    # ORDER_SEQUENCE number of the last change, drives the delivery crew sync
+    updated = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of a customer's / a driver's orders
+            models.Index(fields=['user', 'date', 'id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'date', 'id'], name='order_crew_date_idx'),
+            # "changed since" polls of a driver's orders
+            models.Index(fields=['delivery_crew', 'updated'], name='order_crew_updated_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_delivery_crew_id = instance.__dict__.get('delivery_crew_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """ number the change and record a driver losing the order """
+        # no savepoint: a failed save aborts the caller's transaction anyway
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            self.updated = Sequence.next(ORDER_SEQUENCE)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'updated'}
+            super().save(*args, **kwargs)
+            previous = getattr(self, '_loaded_delivery_crew_id', None)
+            if previous is not None and previous != self.delivery_crew_id:
+                OrderUnassignment.objects.create(order_id=self.pk, delivery_crew_id=previous, updated=self.updated)
+        self._loaded_delivery_crew_id = self.delivery_crew_id
 
     def __str__(self):
         return f'order_{self.id}__{self.user.username}'   
 
+class OrderUnassignment(models.Model):
+    """An order leaving a driver's list (reassigned or deleted), for their sync"""
+    order_id = models.PositiveBigIntegerField()
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE)
+    updated = models.PositiveBigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_crew', 'updated'], name='unassign_crew_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f'order_{self.order_id}__{self.delivery_crew_id}'
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -49,4 +152,42 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+
+class DailySales(models.Model):
+    """Revenue, orders and units sold per day, kept up to date at checkout"""
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'sales_{self.date}'
+
+class DailyCategorySales(models.Model):
+    """Per category and day; ``orders`` counts orders with any item of the category"""
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'category')
+
+    def __str__(self):
+        return f'sales_{self.date}__{self.category_id}'
+
+class DailyMenuItemSales(models.Model):
+    """Per menu item and day"""
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+    def __str__(self):
+        return f'sales_{self.date}__{self.menuitem_id}'
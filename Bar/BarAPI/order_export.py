@@ -0,0 +1,67 @@
+from itertools import groupby
+from operator import itemgetter
+
+from .catalog_io import EXPORT_CHUNK_SIZE, batched, csv_chunks, json_value
+from .models import OrderItem
+from .renderers import dumps
+
+# (column, OrderItem lookup); the order columns come first and repeat on
+# every line of the order in CSV
+ORDER_COLUMNS = (
+    ('order', 'order_id'),
+    ('date', 'order__date'),
+    ('customer', 'order__user__username'),
+    ('delivery_crew', 'order__delivery_crew__username'),
+    ('status', 'order__status'),
+    ('total', 'order__total'),
+)
+LINE_COLUMNS = (
+    ('menuitem', 'menuitem_id'),
+    ('title', 'menuitem__title'),
+    ('category', 'menuitem__category__title'),
+    ('quantity', 'quantity'),
+    ('unit_price', 'unit_price'),
+    ('price', 'price'),
+)
+ORDER_EXPORT_COLUMNS = tuple(column for column, _ in ORDER_COLUMNS + LINE_COLUMNS)
+
+
+def order_lines(start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """ one tuple per order line of the orders dated ``start`` to ``end``
+
+    A single query joining order, customer, driver, menu item and category,
+    read with a server-side cursor in ``chunk_size`` rows. The ``Order.date``
+    index narrows the range; lines come by date, order and menu item.
+    """
+    lines = OrderItem.objects.all()
+    if start:
+        lines = lines.filter(order__date__gte=start)
+    if end:
+        lines = lines.filter(order__date__lte=end)
+    lookups = [lookup for _, lookup in ORDER_COLUMNS + LINE_COLUMNS]
+    return (lines.order_by('order__date', 'order_id', 'menuitem_id')
+            .values_list(*lookups).iterator(chunk_size=chunk_size))
+
+
+def _order_objects(rows):
+    split = len(ORDER_COLUMNS)
+    # rows of an order are consecutive, grouping never holds more than one order
+    for _, lines in groupby(rows, key=itemgetter(0)):
+        lines = list(lines)
+        order = {column: json_value(value) for (column, _), value in zip(ORDER_COLUMNS, lines[0])}
+        order['items'] = [{column: json_value(value) for (column, _), value in zip(LINE_COLUMNS, line[split:])}
+                          for line in lines]
+        yield dumps(order) + b'\n'
+
+
+def export_orders(fmt, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """ order history as byte chunks, memory bounded by ``chunk_size`` rows
+
+    CSV has one row per order line with the order columns repeated, NDJSON
+    one object per order with its lines in ``items``. Orders without lines
+    are left out.
+    """
+    rows = order_lines(start, end, chunk_size)
+    if fmt == 'csv':
+        return csv_chunks(ORDER_EXPORT_COLUMNS, rows, chunk_size)
+    return (b''.join(chunk) for chunk in batched(_order_objects(rows), chunk_size))
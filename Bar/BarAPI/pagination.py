@@ -0,0 +1,177 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a composite, indexed sort key
+
+    Pages are selected with ``WHERE (key) > (last seen key)`` instead of
+    ``OFFSET`` and the table is never counted, so every page costs the same
+    as the first one. The last key field must be unique (normally ``id``).
+    Cursors are opaque base64 tokens carrying the boundary key values.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=None):
+        page_query = self.page_query(queryset, request, ordering)
+        return self.finish_page(list(page_query))
+
+    async def apaginate_queryset(self, queryset, request, ordering=None):
+        """ async variant for async views, rows are fetched with the async ORM """
+        page_query = self.page_query(queryset, request, ordering)
+        return self.finish_page([row async for row in page_query])
+
+    def page_query(self, queryset, request, ordering=None):
+        self.request = request
+        self.ordering = tuple(ordering or self.ordering)
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        self.keys, self.reverse = self.decode_cursor(request, queryset.model)
+        order = self.ordering if not self.reverse else tuple(_invert(field) for field in self.ordering)
+        queryset = queryset.order_by(*order)
+        if self.keys is not None:
+            queryset = queryset.filter(self.keyset_filter(order, self.keys))
+        # fetch one extra row to know whether there is a page beyond this one
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        self.page = rows
+        self.has_next = has_more if not self.reverse else self.keys is not None
+        self.has_previous = self.keys is not None if not self.reverse else has_more
+        return rows
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_page_size(self, request):
+        value = request.GET.get(self.page_size_query_param)
+        try:
+            size = int(value)
+        except (TypeError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def keyset_filter(self, order, keys):
+        """ rows strictly after ``keys`` in ``order``, as an OR of prefixes """
+        condition = Q()
+        for position, field in enumerate(order):
+            name = field.lstrip('-')
+            lookup = f'{name}__lt' if field.startswith('-') else f'{name}__gt'
+            prefix = {f.lstrip('-'): keys[i] for i, f in enumerate(order[:position])}
+            condition |= Q(**prefix, **{lookup: keys[position]})
+        return condition
+
+    def row_keys(self, row):
+        keys = []
+        for field in self.ordering:
+            value = row
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr)
+            keys.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return keys
+
+    def encode_cursor(self, keys, reverse=False):
+        payload = json.dumps([keys, int(reverse)], separators=(',', ':')).encode()
+        token = base64.urlsafe_b64encode(payload).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        """ ``(keys, reverse)`` of the cursor, keys converted by their fields
+
+        Cursors come from the client: any key its ordering field would not
+        store is refused like a malformed token.
+        """
+        token = request.GET.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            keys, reverse = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(keys, list) or len(keys) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            keys = [_cursor_key(model, field, key) for field, key in zip(self.ordering, keys)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return keys, bool(reverse)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.row_keys(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.row_keys(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class MenuItemsPagination(KeysetPagination):
+    # sorting by price uses ('price', 'id'): the price index already ends
+    # with the rowid in SQLite
+    ordering = ('id',)
+
+
+class OrdersPagination(KeysetPagination):
+    # newest first, served by the (user|delivery_crew, date, id) indexes
+    ordering = ('-date', '-id')
+
+
+def _cursor_key(model, field, key):
+    # the sort keys are never NULL, and a key must fit its column
+    *path, name = field.lstrip('-').split('__')
+    for part in path:
+        model = model._meta.get_field(part).related_model
+    model_field = model._meta.get_field(name)
+    value = model_field.to_python(key)
+    if value is None:
+        raise ValueError('Cursor keys cannot be null')
+    model_field.run_validators(value)
+    return value
+
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
@@ -0,0 +1,28 @@
+from rest_framework.permissions import BasePermission
+
+from .roles import CUSTOMER, MANAGER, DELIVERY, has_role
+
+
+class IsSuperUser(BasePermission):
+    def has_permission(self, request, view):
+        return request.user and request.user.is_superuser
+
+class HasRole(BasePermission):
+    """Grant access to authenticated members of ``role``"""
+    role = None
+    message = 'You do not have the required role to perform this action.'
+
+    def has_permission(self, request, view):
+        return bool(request.user and has_role(request.user, self.role))
+
+class IsCustomer(HasRole):
+    role = CUSTOMER
+    message = 'Only customers can perform this action.'
+
+class IsManager(HasRole):
+    role = MANAGER
+    message = 'Only managers can perform this action.'
+
+class IsDeliveryCrew(HasRole):
+    role = DELIVERY
+    message = 'Only delivery crew can perform this action.'
@@ -0,0 +1,49 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+# DRF's encoder still handles the types orjson does not (Decimal, lazy
+# strings, timedelta, querysets, ...), so both write them the same way
+_fallback = JSONEncoder().default
+
+
+def dumps(data):
+    """ compact UTF-8 JSON bytes, what DRF's JSONRenderer writes with the
+    default settings
+
+    Data orjson refuses, such as integers past 64 bits, is handed to DRF's
+    renderer. One difference remains: orjson writes NaN and infinite floats
+    as ``null`` where DRF raises ``ValueError`` (``STRICT_JSON``).
+    """
+    if orjson is None or not api_settings.UNICODE_JSON or not api_settings.COMPACT_JSON:
+        return JSONRenderer().render(data)
+    try:
+        ret = orjson.dumps(data, default=_fallback, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # orjson.JSONEncodeError is a TypeError
+        return JSONRenderer().render(data)
+    # like DRF, escape the two separators that are valid JSON but not JavaScript
+    if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+        ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return ret
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding with orjson when it is installed
+
+    orjson serializes dicts, lists, strings, numbers, dates and datetimes in
+    C; only the remaining types go through DRF's encoder. Requests for an
+    indented response keep the stdlib encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
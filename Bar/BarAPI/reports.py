@@ -0,0 +1,145 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+
+from .db import values_cte
+from .models import DailyCategorySales, DailyMenuItemSales, DailySales, MenuItem, OrderItem
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _increment_sql(table, key_columns, select):
+    """ upsert adding revenue, orders and units onto an existing rollup row """
+    table = connection.ops.quote_name(table)
+    keys = ', '.join(key_columns)
+    return (
+        f'INSERT INTO {table} ({keys}, revenue, orders, units) {select} '
+        f'ON CONFLICT ({keys}) DO UPDATE SET '
+        f'revenue = {table}.revenue + excluded.revenue, '
+        f'orders = {table}.orders + excluded.orders, '
+        f'units = {table}.units + excluded.units'
+    )
+
+
+def record_order_sales(order, order_items):
+    """ add one placed order to the daily rollups
+
+    Three upserts, whatever the number of lines: the day, the categories and
+    the menu items. Call it inside the transaction that creates the order so
+    the rollups never count an order that was rolled back.
+    """
+    lines = [(item.menuitem_id, item.quantity, item.price) for item in order_items]
+    if not lines:
+        return
+    menuitem_table = connection.ops.quote_name(MenuItem._meta.db_table)
+    sold, params = values_cte('sold', ('menuitem_id', 'quantity', 'price'), lines)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _increment_sql(DailySales._meta.db_table, ('date',), 'VALUES (%s, %s, 1, %s)'),
+            [order.date, sum(price for _, _, price in lines), sum(quantity for _, quantity, _ in lines)],
+        )
+        # WHERE true: SQLite needs it to parse ON CONFLICT after a join
+        cursor.execute(sold + _increment_sql(
+            DailyCategorySales._meta.db_table, ('date', 'category_id'),
+            f'SELECT %s, m.category_id, SUM(s.price), 1, SUM(s.quantity) '
+            f'FROM sold s JOIN {menuitem_table} m ON m.id = s.menuitem_id WHERE true GROUP BY m.category_id',
+        ), params + [order.date])
+        cursor.execute(sold + _increment_sql(
+            DailyMenuItemSales._meta.db_table, ('date', 'menuitem_id'),
+            'SELECT %s, s.menuitem_id, s.price, 1, s.quantity FROM sold s WHERE true',
+        ), params + [order.date])
+
+
+def rebuild_sales_rollups(start=None, end=None):
+    """ recompute the rollups of ``start``..``end`` (inclusive) from the orders
+
+    A missing bound means the beginning or the end of the history. Returns
+    the number of days, category rows and menu item rows written.
+    """
+    with transaction.atomic():
+        for model in (DailySales, DailyCategorySales, DailyMenuItemSales):
+            rollups = model.objects.all()
+            if start is not None:
+                rollups = rollups.filter(date__gte=start)
+            if end is not None:
+                rollups = rollups.filter(date__lte=end)
+            rollups.delete()
+
+        lines = OrderItem.objects.all()
+        if start is not None:
+            lines = lines.filter(order__date__gte=start)
+        if end is not None:
+            lines = lines.filter(order__date__lte=end)
+
+        totals = (
+            lines.values('order__date')
+            .annotate(revenue=Sum('price'), orders=Count('order_id', distinct=True), units=Sum('quantity'))
+            .order_by()
+        )
+        days = DailySales.objects.bulk_create(
+            (DailySales(date=row['order__date'], revenue=row['revenue'], orders=row['orders'], units=row['units'])
+             for row in totals.iterator()),
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+        by_category = (
+            lines.values('order__date', 'menuitem__category_id')
+            .annotate(revenue=Sum('price'), orders=Count('order_id', distinct=True), units=Sum('quantity'))
+            .order_by()
+        )
+        categories = DailyCategorySales.objects.bulk_create(
+            (DailyCategorySales(date=row['order__date'], category_id=row['menuitem__category_id'],
+                                revenue=row['revenue'], orders=row['orders'], units=row['units'])
+             for row in by_category.iterator()),
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+        by_menuitem = (
+            lines.values('order__date', 'menuitem_id')
+            .annotate(revenue=Sum('price'), orders=Count('order_id'), units=Sum('quantity'))
+            .order_by()
+        )
+        menuitems = DailyMenuItemSales.objects.bulk_create(
+            (DailyMenuItemSales(date=row['order__date'], menuitem_id=row['menuitem_id'],
+                                revenue=row['revenue'], orders=row['orders'], units=row['units'])
+             for row in by_menuitem.iterator()),
+            batch_size=REBUILD_BATCH_SIZE,
+        )
+    return len(days), len(categories), len(menuitems)
+
+
+def sales_summary(start, end):
+    """ totals and per-day rows of ``start``..``end`` read from the rollups """
+    days = list(
+        DailySales.objects.filter(date__range=(start, end))
+        .order_by('date').values('date', 'revenue', 'orders', 'units')
+    )
+    return {
+        'start': start,
+        'end': end,
+        'revenue': sum((day['revenue'] for day in days), Decimal(0)),
+        'orders': sum(day['orders'] for day in days),
+        'units': sum(day['units'] for day in days),
+        'days': days,
+    }
+
+
+TOP_SELLER_METRICS = ('revenue', 'units', 'orders')
+
+
+def top_sellers(start, end, by='menuitem', metric='revenue', limit=10):
+    """ best selling menu items or categories of ``start``..``end`` """
+    if by == 'category':
+        rows = DailyCategorySales.objects.values(key=F('category_id'), name=F('category__title'))
+    else:
+        rows = DailyMenuItemSales.objects.values(key=F('menuitem_id'), name=F('menuitem__title'))
+    rows = (
+        rows.filter(date__range=(start, end))
+        .annotate(total_revenue=Sum('revenue'), total_orders=Sum('orders'), total_units=Sum('units'))
+        .order_by(f'-total_{metric}', 'key')[:limit]
+    )
+    return [
+        {'id': row['key'], 'title': row['name'], 'revenue': row['total_revenue'],
+         'orders': row['total_orders'], 'units': row['total_units']}
+        for row in rows
+    ]
@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+# Group names used for permission checks across the API
+CUSTOMER = 'Customer'
+MANAGER = 'Manager'
+DELIVERY = 'Delivery'
+
+# used when settings.AUTH_USER_CACHE has no TIMEOUT
+ROLE_CACHE_TIMEOUT = 60
+
+# attribute used to memoize the role set on the request user for one request
+_REQUEST_ATTR = '_bar_role_names'
+
+
+def _cache_key(user_id):
+    return f'bar:roles:{user_id}'
+
+
+def _timeout():
+    # the default cache is per process unless configured otherwise: a group
+    # change in one worker reaches the others once their entry expires, so
+    # keep role sets no longer than the authenticated users holding them
+    return getattr(settings, 'AUTH_USER_CACHE', {}).get('TIMEOUT', ROLE_CACHE_TIMEOUT)
+
+
+def get_user_roles(user):
+    """ return the group names of a user, loaded at most once per request
+
+    The set is memoized on the user instance (request.user lives for one
+    request) and shared across requests through the default cache.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, _REQUEST_ATTR, None)
+    if roles is not None:
+        return roles
+
+    key = _cache_key(user.pk)
+    roles = cache.get(key)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        cache.set(key, roles, _timeout())
+    setattr(user, _REQUEST_ATTR, roles)
+    return roles
+
+
+async def aget_user_roles(user):
+    """ async variant of ``get_user_roles`` for async views """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, _REQUEST_ATTR, None)
+    if roles is not None:
+        return roles
+
+    key = _cache_key(user.pk)
+    roles = await cache.aget(key)
+    if roles is None:
+        roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+        await cache.aset(key, roles, _timeout())
+    setattr(user, _REQUEST_ATTR, roles)
+    return roles
+
+
+def set_user_roles(user, roles):
+    """ prime the role cache when the group names are already known """
+    roles = frozenset(roles)
+    cache.set(_cache_key(user.pk), roles, _timeout())
+    setattr(user, _REQUEST_ATTR, roles)
+    return roles
+
+
+def prime_user_roles(*group_names):
+    """ cache the role sets of every member of ``group_names`` with one query """
+    memberships = User.groups.through.objects
+    members = memberships.filter(group__name__in=group_names).values('user_id')
+    roles = defaultdict(set)
+    for user_id, name in memberships.filter(user_id__in=members).values_list('user_id', 'group__name'):
+        roles[user_id].add(name)
+    cache.set_many({_cache_key(user_id): frozenset(names) for user_id, names in roles.items()}, _timeout())
+    return len(roles)
+
+
+def remember_request_roles(user, roles):
+    """ memoize already known roles on the user without touching the cache """
+    setattr(user, _REQUEST_ATTR, roles)
+
+
+def has_role(user, role):
+    return role in get_user_roles(user)
+
+
+def invalidate_user_roles(*user_ids):
+    """ drop cached role sets, called whenever group membership changes """
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def forget_request_roles(user):
+    """ drop the per-request memo so the next check sees fresh membership """
+    if hasattr(user, _REQUEST_ATTR):
+        delattr(user, _REQUEST_ATTR)
@@ -0,0 +1,53 @@
+import re
+
+from django.db import connection
+
+from .models import MenuItem
+
+# FTS5 index over menu item and category titles, rowid = menu item id.
+# Created by migration 0006 and kept in sync by SQLite triggers, so bulk
+# creates, queryset updates and raw SQL writes are indexed too.
+SEARCH_TABLE = 'LittleLemonAPI_menuitemsearch'
+
+# bm25 column weights: a match in the item title counts more than one in
+# its category title
+TITLE_WEIGHT = 10.0
+CATEGORY_WEIGHT = 1.0
+
+MAX_SEARCH_TERMS = 8
+MAX_SEARCH_RESULTS = 50
+
+_term = re.compile(r'\w+')
+
+
+def match_expression(text):
+    """ FTS5 query matching every word of ``text`` as a prefix, or None
+
+    Only word characters are kept, so user input can never form FTS5 syntax
+    (quotes, ``OR``, ``NEAR``, column filters).
+    """
+    terms = _term.findall(text or '')[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_menu_items(text, limit=10, menu_items=None):
+    """ best matching menu items for ``text``, best first
+
+    Two queries whatever the catalog size: the ranked ids from the index and
+    the rows of ``menu_items`` (all menu items by default) with those ids.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    table = connection.ops.quote_name(SEARCH_TABLE)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s '
+            f'ORDER BY bm25({table}, %s, %s), rowid LIMIT %s',
+            [expression, TITLE_WEIGHT, CATEGORY_WEIGHT, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    items = (menu_items if menu_items is not None else MenuItem.objects).in_bulk(ids)
+    return [items[pk] for pk in ids if pk in items]
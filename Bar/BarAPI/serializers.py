@@ -1,50 +1,110 @@
 from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Lower
 from rest_framework import serializers
+from .metrics import measure
 from .models import Category, MenuItem, Cart, Order, OrderItem
 
 
-class ManagerSerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    """Let a serializer declare the relations its representation reads
+
+    Set ``select_related`` / ``prefetch_related`` on ``Meta`` and build list
+    querysets with ``setup_eager_loading`` so serializing N rows costs a
+    constant number of queries.
+    """
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select_related = getattr(cls.Meta, 'select_related', ())
+        prefetch_related = getattr(cls.Meta, 'prefetch_related', ())
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+
+class TimedDataMixin:
+    """Report the time spent building ``.data`` as the request's serialize phase
+
+    Pair it with ``Meta.list_serializer_class = TimedListSerializer`` so
+    ``many=True`` serializers are measured too.
+    """
+
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+
+class ManagerSerializer(EagerLoadingMixin, TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'username', 'groups']
+        prefetch_related = ('groups',)
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(EagerLoadingMixin, TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'slug', 'title']
 
-class MenuItemSerializer(serializers.ModelSerializer):
+    def validate_title(self, value):
+        # the unique Lower('title') index, checked through that index
+        others = Category.objects.annotate(key=Lower('title')).filter(key=Lower(Value(value)))
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError('A category with this title already exists.')
+        return value
+
+class MenuItemSerializer(EagerLoadingMixin, TimedDataMixin, serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
     # category = CategorySerializer()
     class Meta:
         model = MenuItem
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'title', 'price', 'category', 'featured']
         depth = 1
+        select_related = ('category',)
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['category'] = CategorySerializer(instance.category).data
+        representation['category'] = category_representation(instance.category)
         return representation
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(EagerLoadingMixin, TimedDataMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
     menuitem = serializers.PrimaryKeyRelatedField(queryset=MenuItem.objects.all())
     class Meta:
         model = Cart
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'user', 'menuitem', 'quantity', 'unit_price', 'price']
+        select_related = ('user', 'menuitem__category')
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['menuitem'] = MenuItemSerializer(instance.menuitem).data
+        representation['menuitem'] = menuitem_representation(instance.menuitem)
         representation['user'] = instance.user.username
         return representation
     
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(EagerLoadingMixin, TimedDataMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
     delivery_crew = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), allow_null=True)
     class Meta:
         model = Order
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'user', 'delivery_crew', 'status', 'total', 'date']
+        select_related = ('user', 'delivery_crew')
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -55,15 +115,62 @@ class OrderSerializer(serializers.ModelSerializer):
             representation['delivery_crew'] = None
         return representation
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(EagerLoadingMixin, TimedDataMixin, serializers.ModelSerializer):
     order = serializers.PrimaryKeyRelatedField(queryset=Order.objects.all())
     menuitem = serializers.PrimaryKeyRelatedField(queryset=MenuItem.objects.all())
     class Meta:
         model = OrderItem
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'order', 'menuitem', 'quantity', 'unit_price', 'price']
+        select_related = ('menuitem__category',)
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['menuitem'] = MenuItemSerializer(instance.menuitem).data
-        representation['order'] = instance.order.id
-        return representation
\ No newline at end of file
+        representation['menuitem'] = menuitem_representation(instance.menuitem)
+        representation['order'] = instance.order_id
+        return representation
+
+
+# Nested representations share one serializer instance instead of building
+# a new serializer (and re-introspecting its fields) for every row.
+_category_serializer = CategorySerializer()
+_menuitem_serializer = MenuItemSerializer()
+
+def category_representation(category):
+    return _category_serializer.to_representation(category)
+
+def menuitem_representation(menuitem):
+    return _menuitem_serializer.to_representation(menuitem)
+
+
+class SalesRowSerializer(serializers.Serializer):
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+
+class SalesDaySerializer(SalesRowSerializer):
+    date = serializers.DateField()
+
+class SalesSummarySerializer(SalesRowSerializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    days = SalesDaySerializer(many=True)
+
+class TopSellerSerializer(SalesRowSerializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+
+
+# Rows of a catalog import (see catalog_io). Category references are plain
+# ids checked once per batch, not a primary key lookup per row.
+class CategoryImportSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False, min_value=1)
+    slug = serializers.SlugField(max_length=50)
+    title = serializers.CharField(max_length=255)
+
+class MenuItemImportSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False, min_value=1)
+    title = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=0)
+    featured = serializers.BooleanField(required=False)
+    category = serializers.IntegerField(min_value=1)
@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import m2m_changed, pre_delete, post_save, post_delete
+from django.dispatch import receiver
+
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import blacklist, forget_cached_users
+from .catalog import category_ids
+from .models import ORDER_SEQUENCE, Category, MenuItem, Order, OrderUnassignment, Sequence
+from .roles import invalidate_user_roles
+
+
+def forget_users(*user_ids):
+    invalidate_user_roles(*user_ids)
+    forget_cached_users(*user_ids)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """ drop cached roles and users of every user whose group membership changed """
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear
+        forget_users(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear(): pk_set is not provided, collect members first
+        forget_users(*instance.user_set.values_list('pk', flat=True))
+    elif pk_set:
+        # group.user_set.add/remove
+        forget_users(*pk_set)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    forget_users(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # deactivation, password or staff changes must not be served from the cache
+    forget_cached_users(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+@receiver(post_delete, sender=BlacklistedToken)
+def blacklist_changed(sender, **kwargs):
+    blacklist.expire()
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    # the change log triggers version the catalog, drop the map right away
+    if sender is Category:
+        category_ids.clear()
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    """ let the assigned driver's next sync drop the deleted order """
+    if instance.delivery_crew_id is not None:
+        OrderUnassignment.objects.create(order_id=instance.pk, delivery_crew_id=instance.delivery_crew_id,
+                                         updated=Sequence.next(ORDER_SEQUENCE))
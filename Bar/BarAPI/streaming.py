@@ -0,0 +1,102 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from .renderers import dumps
+
+# rows fetched, serialized and encoded per step of a streamed response
+STREAM_CHUNK_SIZE = 500
+
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def stream_format(params):
+    """ ``(format, error_message)`` from the ``stream`` query parameter
+
+    ``format`` is None when the client asked for a normal paginated response.
+    """
+    fmt = params.get('stream')
+    if not fmt:
+        return None, None
+    if fmt not in STREAM_CONTENT_TYPES:
+        return None, f"stream must be one of {', '.join(STREAM_CONTENT_TYPES)}"
+    return fmt, None
+
+
+def serialized_chunks(queryset, serializer_class, chunk_size=STREAM_CHUNK_SIZE):
+    """ serializer data of ``queryset`` in lists of ``chunk_size`` rows
+
+    Rows come from ``queryset.iterator()``, so memory stays bounded by one
+    chunk whatever the size of the result.
+    """
+    rows = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield serializer_class(rows, many=True).data
+            rows = []
+    if rows:
+        yield serializer_class(rows, many=True).data
+
+
+def _ndjson(chunks):
+    for data in chunks:
+        yield b''.join(dumps(item) + b'\n' for item in data)
+
+
+def _json_array(chunks):
+    yield b'['
+    separator = b''
+    for data in chunks:
+        # one encoder call per chunk, without the brackets of the list
+        yield separator + dumps(data)[1:-1]
+        separator = b','
+    yield b']'
+
+
+class AsyncChunks:
+    """Chunks of a sync iterator served to an ASGI server
+
+    Given a sync iterator, Django's ASGI handler reads it to the end with
+    ``sync_to_async(list)`` before sending a byte. Here each chunk is made
+    by one ``sync_to_async`` call, in the request's thread like the view,
+    so the cursor the iterator holds stays on its connection. Django calls
+    ``close()`` once the response is done, a disconnect included.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    async def __aiter__(self):
+        # chunks are bytes: None marks the end, StopIteration can't cross threads
+        next_chunk = sync_to_async(functools.partial(next, self.chunks, None))
+        while (chunk := await next_chunk()) is not None:
+            yield chunk
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+def streaming_response(request, chunks, content_type):
+    """ a ``StreamingHttpResponse`` of byte ``chunks``, iterated asynchronously under ASGI """
+    # a DRF Request wraps the Django one
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = AsyncChunks(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+def stream_response(request, queryset, serializer_class, fmt, chunk_size=STREAM_CHUNK_SIZE):
+    """ every row of ``queryset`` as a chunked JSON array or NDJSON, in its order
+
+    The rows are read while the response is sent, after the view returned:
+    those queries are not part of the request's query count or budget.
+    """
+    chunks = serialized_chunks(queryset, serializer_class, chunk_size)
+    content = _ndjson(chunks) if fmt == 'ndjson' else _json_array(chunks)
+    return streaming_response(request, content, STREAM_CONTENT_TYPES[fmt])
@@ -0,0 +1,109 @@
+import base64
+import json
+
+from django.db.models import Max, Min
+from rest_framework.exceptions import ValidationError
+
+from .models import CatalogChange, Order, OrderUnassignment
+
+SYNC_PAGE_SIZE = 100
+MAX_SYNC_PAGE_SIZE = 500
+# beyond this many menu changes a full snapshot is smaller than the delta
+MAX_CATALOG_CHANGES = 500
+# menu changes the log keeps, see prune_catalog_changes
+CATALOG_CHANGES_KEPT = 10000
+
+
+def encode_sync_token(number):
+    payload = json.dumps([number], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_sync_token(token):
+    """ the change number a token stands for; an empty token starts from zero """
+    if not token:
+        return 0
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        number, = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError):
+        raise ValidationError({'since': 'Invalid sync token'})
+    if not isinstance(number, int) or number < 0:
+        raise ValidationError({'since': 'Invalid sync token'})
+    return number
+
+
+def sync_page_size(params):
+    try:
+        size = int(params.get('page_size', SYNC_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return SYNC_PAGE_SIZE
+    return min(max(size, 1), MAX_SYNC_PAGE_SIZE)
+
+
+def delivery_changes(delivery_crew, since, limit, orders=None):
+    """ a driver's order changes after change number ``since``
+
+    Returns ``(orders, removed_order_ids, last_number, has_more)``. Both
+    reads walk the (delivery_crew, updated) indexes from ``since``, so a
+    poll with nothing new reads no rows. Changes come out in the order they
+    were committed; ``last_number`` is the token for the next poll.
+    """
+    orders = (orders if orders is not None else Order.objects).filter(
+        delivery_crew=delivery_crew, updated__gt=since).order_by('updated')
+    removals = OrderUnassignment.objects.filter(
+        delivery_crew=delivery_crew, updated__gt=since).order_by('updated').values_list('updated', 'order_id')
+
+    changes = [(order.updated, order) for order in orders[:limit + 1]]
+    changes += [(number, order_id) for number, order_id in removals[:limit + 1]]
+    changes.sort(key=lambda change: change[0])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    changed = [change for _, change in changes if isinstance(change, Order)]
+    current = {order.pk for order in changed}
+    # an order removed and assigned back within the page is simply current
+    removed = sorted({change for _, change in changes if not isinstance(change, Order)} - current)
+    last_number = changes[-1][0] if changes else since
+    return changed, removed, last_number, has_more
+
+
+def catalog_changes(since, limit=MAX_CATALOG_CHANGES):
+    """ menu item and category ids changed after change number ``since``
+
+    Returns ``(changes, last_number)`` with ``changes`` mapping each
+    ``CatalogChange`` kind to ``(changed_ids, deleted_ids)``, the latest
+    change of an object winning. ``changes`` is None when the client has to
+    take a snapshot instead: a first sync, a token older than the pruned log
+    or unknown to it, or more than ``limit`` changes. A poll with nothing
+    new runs one query.
+    """
+    bounds = CatalogChange.objects.aggregate(first=Min('id'), last=Max('id'))
+    first, last = bounds['first'], bounds['last'] or 0
+    if not since or since > last or (first is not None and since < first - 1):
+        return None, last
+    if since == last:
+        return {}, last
+
+    log = list(CatalogChange.objects.filter(id__gt=since, id__lte=last).order_by('id')
+               .values_list('kind', 'object_id', 'deleted')[:limit + 1])
+    if len(log) > limit:
+        return None, last
+    latest = {}
+    for kind, object_id, deleted in log:
+        latest[kind, object_id] = deleted
+    changes = {}
+    for (kind, object_id), deleted in latest.items():
+        changed, removed = changes.setdefault(kind, ([], []))
+        (removed if deleted else changed).append(object_id)
+    return changes, last
+
+
+def prune_catalog_changes(keep=CATALOG_CHANGES_KEPT):
+    """ drop all but the last ``keep`` menu changes, returns how many went
+
+    Clients whose token predates the remaining log get a snapshot.
+    """
+    last = CatalogChange.objects.aggregate(last=Max('id'))['last'] or 0
+    deleted, _ = CatalogChange.objects.filter(id__lte=last - max(keep, 1)).delete()
+    return deleted
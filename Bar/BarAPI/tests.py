@@ -1,3 +1,1860 @@
-from django.test import TestCase
+import asyncio
+import base64
+import contextlib
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import async_views
+from .authentication import blacklist, user_cache
+from .catalog import category_ids, get_catalog_version
+from .cart import CacheCartStore, CartBusy, get_cart_store
+from .catalog_io import CATALOG_IMPORTS
+from .db import write_transaction
+from .events import ORDER_ASSIGNED, SQLiteBroker, hub, order_event, publish, sse_message, subscribe
+from .idempotency import IdempotencyStore, KeyReused, RequestInProgress, idempotency_store
+from .metrics import QueryBudgetExceeded, query_budget
+from .order_export import export_orders
+from .middleware import QueryTimingMiddleware
+from .renderers import FastJSONRenderer
+from .streaming import stream_response
+from .checkout import place_order
+from .models import (Category, CatalogChange, MenuItem, Cart, Order, OrderItem, DailySales, DailyCategorySales,
+                     DailyMenuItemSales)
+from .serializers import MenuItemSerializer
+from .roles import CUSTOMER, MANAGER, DELIVERY, get_user_roles, has_role
+from .sync import catalog_changes, decode_sync_token, encode_sync_token, prune_catalog_changes
+from .throttling import LocMemBucketStore, SQLiteBucketStore, get_bucket_store
+from .views import catalogExportView, customerOrderListView, managerOrderExportView, menu_sync_data
+from .warmup import WARMUP_PHASES, warm_up, warm_up_worker
 
 # Create your tests here.
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class BarAPITestCase(TestCase):
+    """Base test case with the three role groups and an API client
+
+    Query budgets are strict, so a view going over its budget fails the test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        request_log = logging.getLogger('LittleLemonAPI.requests')
+        cls._request_log_level = request_log.level
+        request_log.setLevel(logging.WARNING)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.getLogger('LittleLemonAPI.requests').setLevel(cls._request_log_level)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        caches['carts'].clear()
+        get_bucket_store().clear()
+        # ids are reused once a test rolls back
+        user_cache.clear()
+        category_ids.clear()
+        idempotency_store.clear()
+        blacklist.expire()
+        self.client = APIClient()
+        self.customer_group = Group.objects.create(name=CUSTOMER)
+        self.manager_group = Group.objects.create(name=MANAGER)
+        self.delivery_group = Group.objects.create(name=DELIVERY)
+
+    def make_user(self, username, *groups, **extra):
+        user = User.objects.create_user(username=username, **extra)
+        if groups:
+            user.groups.add(*groups)
+        return user
+
+    def login(self, user):
+        # reload so per-request state from earlier calls is not reused
+        self.client.force_authenticate(user=User.objects.get(pk=user.pk))
+
+
+class RoleCacheTests(BarAPITestCase):
+
+    def test_roles_loaded_once_per_request(self):
+        user = self.make_user('alice', self.customer_group)
+        with self.assertNumQueries(1):
+            self.assertTrue(has_role(user, CUSTOMER))
+            self.assertFalse(has_role(user, MANAGER))
+
+    def test_roles_shared_across_requests(self):
+        user = self.make_user('alice', self.customer_group)
+        get_user_roles(User.objects.get(pk=user.pk))
+        fresh_user = User.objects.get(pk=user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(fresh_user, CUSTOMER))
+
+    def test_membership_change_invalidates_cache(self):
+        user = self.make_user('alice', self.customer_group)
+        self.assertFalse(has_role(User.objects.get(pk=user.pk), MANAGER))
+
+        self.manager_group.user_set.add(user)
+        self.assertTrue(has_role(User.objects.get(pk=user.pk), MANAGER))
+
+        user.groups.remove(self.manager_group)
+        self.assertFalse(has_role(User.objects.get(pk=user.pk), MANAGER))
+
+        self.customer_group.user_set.clear()
+        self.assertFalse(has_role(User.objects.get(pk=user.pk), CUSTOMER))
+
+    @override_settings(AUTH_USER_CACHE={'SIZE': 10, 'TIMEOUT': 5})
+    def test_roles_expire_with_the_user_cache(self):
+        user = self.make_user('alice', self.customer_group)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            get_user_roles(User.objects.get(pk=user.pk))
+        cache_set.assert_called_once_with(f'bar:roles:{user.pk}', frozenset({CUSTOMER}), 5)
+
+    def test_manager_groups_view_invalidates_cache(self):
+        admin = self.make_user('admin', is_staff=True, is_superuser=True)
+        user = self.make_user('bob', self.customer_group)
+        self.assertFalse(has_role(User.objects.get(pk=user.pk), MANAGER))
+
+        self.login(admin)
+        response = self.client.post(reverse('manager-users'), {'username': 'bob'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(has_role(User.objects.get(pk=user.pk), MANAGER))
+
+        response = self.client.delete(reverse('manager-users'), {'username': 'bob'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(has_role(User.objects.get(pk=user.pk), MANAGER))
+
+    def test_role_permission_classes(self):
+        customer = self.make_user('carol', self.customer_group)
+        driver = self.make_user('dave', self.delivery_group)
+
+        self.login(driver)
+        self.assertEqual(self.client.get(reverse('customer-orders')).status_code, 403)
+
+        self.login(customer)
+        self.assertEqual(self.client.get(reverse('customer-orders')).status_code, 204)
+
+
+class JWTAuthenticationTests(BarAPITestCase):
+    """Bearer tokens are served from the in-process user cache"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.token = AccessToken.for_user(self.customer)
+        Category.objects.create(slug='pizza', title='Pizza')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_cached_user_needs_no_queries(self):
+        # blacklist snapshot, user, roles, the catalog version and the categories
+        with self.assertNumQueries(5):
+            self.assertEqual(self.client.get(reverse('categories')).status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('customer-orders')).status_code, 204)
+
+    def test_requests_get_their_own_user(self):
+        self.client.get(reverse('categories'))
+        first = user_cache.get((str(self.customer.pk), None))[0]
+        first.first_name = 'changed'
+        self.assertEqual(user_cache.get((str(self.customer.pk), None))[0].first_name, '')
+
+    def test_user_and_group_changes_are_picked_up(self):
+        self.assertEqual(self.client.get(reverse('customer-orders')).status_code, 204)
+        self.customer.groups.remove(self.customer_group)
+        self.assertEqual(self.client.get(reverse('customer-orders')).status_code, 403)
+
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get(reverse('categories')).status_code, 401)
+
+    def test_blacklisted_token_is_refused(self):
+        self.assertEqual(self.client.get(reverse('categories')).status_code, 200)
+        outstanding = OutstandingToken.objects.create(
+            user=self.customer, jti=self.token['jti'], token=str(self.token),
+            expires_at=timezone.now() + timezone.timedelta(minutes=5))
+        BlacklistedToken.objects.create(token=outstanding)
+        self.assertEqual(self.client.get(reverse('categories')).status_code, 401)
+
+    def test_blacklist_snapshot_is_reloaded_periodically(self):
+        self.client.get(reverse('categories'))
+        with self.assertNumQueries(2):
+            self.client.get(reverse('categories'))
+        with override_settings(TOKEN_BLACKLIST_REFRESH=0):
+            with self.assertNumQueries(3):
+                self.client.get(reverse('categories'))
+
+    async def test_async_path_uses_the_cache(self):
+        middleware = QueryTimingMiddleware(async_views.categories)
+        for _ in range(2):
+            response = await middleware(AsyncRequestFactory().get(
+                reverse('categories'), headers={'Authorization': f'Bearer {self.token}'}))
+            self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+
+class CatalogETagTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(slug='pizza', title='Pizza')
+        MenuItem.objects.create(title='Margherita', price='9.99', featured=False, category=self.category)
+        self.customer = self.make_user('carol', self.customer_group)
+        self.login(self.customer)
+
+    def test_menu_items_not_modified(self):
+        response = self.client.get(reverse('menu-items'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        self.login(self.customer)
+        # only the catalog version is read
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('menu-items'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query_parameters(self):
+        plain = self.client.get(reverse('menu-items'))['ETag']
+        ordered = self.client.get(reverse('menu-items'), {'ordering': '-price'})['ETag']
+        self.assertNotEqual(plain, ordered)
+
+    def test_catalog_write_changes_etag(self):
+        etag = self.client.get(reverse('menu-items'))['ETag']
+        categories_etag = self.client.get(reverse('categories'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(title='Marinara', price='8.50', featured=False, category=self.category)
+
+        response = self.client.get(reverse('menu-items'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get(reverse('categories'), HTTP_IF_NONE_MATCH=categories_etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class CategoryFilterTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pizza = Category.objects.create(slug='pizza', title='Pizza')
+        self.drinks = Category.objects.create(slug='drinks', title='Drinks')
+        MenuItem.objects.create(title='Margherita', price='9.99', featured=False, category=self.pizza)
+        MenuItem.objects.create(title='Soda', price='2.00', featured=False, category=self.drinks)
+        self.customer = self.make_user('carol', self.customer_group)
+        get_user_roles(self.customer)
+
+    def menu(self, category_name, login=True):
+        if login:
+            self.login(self.customer)
+        return self.client.get(reverse('menu-items'), {'category_name': category_name})
+
+    def titles(self, response):
+        return [item['title'] for item in response.data['results']]
+
+    def test_filter_is_one_indexed_query(self):
+        self.menu('pizza')
+        self.login(self.customer)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.menu('PIZZA', login=False)
+        self.assertEqual(self.titles(response), ['Margherita'])
+        # the catalog version, then the menu items
+        self.assertEqual(len(queries), 2)
+        # the category join only feeds the nested representation
+        where = queries[1]['sql'].split(' WHERE ')[1]
+        self.assertTrue(where.startswith(f'"LittleLemonAPI_menuitem"."category_id" = {self.pizza.pk} '), where)
+
+    def test_unknown_and_empty_categories(self):
+        self.menu('pizza')
+        self.login(self.customer)
+        with self.assertNumQueries(1):
+            response = self.menu('Nope', login=False)
+        self.assertEqual(response.status_code, 404)
+        Category.objects.create(slug='desserts', title='Desserts')
+        response = self.menu('desserts')
+        self.assertEqual((response.status_code, self.titles(response)), (200, []))
+
+    def test_map_follows_category_writes(self):
+        self.assertEqual(self.menu('pizza').status_code, 200)
+        self.pizza.title = 'Pizzas'
+        self.pizza.save()
+        self.assertEqual(self.menu('pizza').status_code, 404)
+        self.assertEqual(self.titles(self.menu('pizzas')), ['Margherita'])
+        # writes without signals, or from another process, still change the version
+        Category.objects.filter(pk=self.drinks.pk).update(title='Beverages')
+        self.assertEqual(self.titles(self.menu('beverages')), ['Soda'])
+
+    def test_map_follows_categories_created_by_other_workers(self):
+        self.assertEqual(self.menu('desserts').status_code, 404)
+        # like a write in another worker, bulk_create sends no signal to this map
+        Category.objects.bulk_create([Category(slug='desserts', title='Desserts')])
+        self.assertEqual(self.menu('desserts').status_code, 200)
+
+    def test_titles_are_unique_in_any_case(self):
+        self.login(self.customer)
+        response = self.client.post(reverse('categories'), {'slug': 'pizza2', 'title': 'PIZZA'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Category.objects.create(slug='pizza2', title='pizza')
+
+        report = CATALOG_IMPORTS['categories']().run(io.BytesIO(
+            b'id,slug,title\n,pizza2,PiZZa\n,desserts,Desserts\n,desserts2,desserts\n'
+            + f'{self.drinks.pk},drinks,DRINKS\n'.encode()
+        ), 'csv')
+        self.assertEqual((report.created, report.updated), (1, 1))
+        self.assertEqual([error['row'] for error in report.errors], [1, 3])
+
+
+class MenuSyncTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pizza = Category.objects.create(slug='pizza', title='Pizza')
+        self.margherita = MenuItem.objects.create(title='Margherita', price='9.99', featured=False, category=self.pizza)
+        self.marinara = MenuItem.objects.create(title='Marinara', price='8.50', featured=False, category=self.pizza)
+        self.customer = self.make_user('carol', self.customer_group)
+
+    def sync(self, token=''):
+        self.login(self.customer)
+        response = self.client.get(reverse('menu-items'), {'since': token})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_first_sync_is_a_snapshot(self):
+        data = self.sync().data
+        self.assertTrue(data['snapshot'])
+        self.assertEqual([item['title'] for item in data['menu_items']], ['Margherita', 'Marinara'])
+        self.assertEqual([category['slug'] for category in data['categories']], ['pizza'])
+        self.assertEqual(self.sync(data['sync_token']).data['menu_items'], [])
+
+    def test_delta_carries_only_the_changes(self):
+        token = self.sync().data['sync_token']
+        self.margherita.price = '10.50'
+        self.margherita.save()
+        response = self.sync(token)
+        self.assertFalse(response.data['snapshot'])
+        self.assertEqual([(item['id'], item['price']) for item in response.data['menu_items']],
+                         [(self.margherita.pk, '10.50')])
+        self.assertEqual(response.data['deleted'], {'menu_items': [], 'categories': []})
+        self.assertLess(len(response.content), 300)
+
+        with self.assertNumQueries(1):
+            menu_sync_data({'since': response.data['sync_token']})
+
+    def test_bulk_writes_and_deletes_are_logged(self):
+        token = self.sync().data['sync_token']
+        MenuItem.objects.filter(pk=self.marinara.pk).update(featured=True)
+        MenuItem.objects.filter(pk=self.margherita.pk).update(featured=False)  # no-op
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        soda = MenuItem.objects.create(title='Soda', price='2.00', featured=False, category=drinks)
+        soda_id = soda.pk
+        soda.delete()
+        data = self.sync(token).data
+        self.assertEqual([item['id'] for item in data['menu_items']], [self.marinara.pk])
+        self.assertEqual([category['id'] for category in data['categories']], [drinks.pk])
+        self.assertEqual(data['deleted'], {'menu_items': [soda_id], 'categories': []})
+
+    def test_snapshot_when_too_far_behind(self):
+        token = self.sync().data['sync_token']
+        for price in ('1.00', '2.00', '3.00'):
+            MenuItem.objects.filter(pk=self.marinara.pk).update(price=price)
+        since = decode_sync_token(token)
+        self.assertIsNone(catalog_changes(since, limit=2)[0])
+        self.assertEqual(catalog_changes(since, limit=3)[0], {CatalogChange.MENUITEM: ([self.marinara.pk], [])})
+
+        # 3 rows from setUp and 3 updates: the update right after the token goes
+        self.assertEqual(prune_catalog_changes(keep=2), 4)
+        self.assertTrue(self.sync(token).data['snapshot'])
+        # a token from another database
+        self.assertTrue(self.sync(encode_sync_token(since + 100)).data['snapshot'])
+
+    def test_invalid_token(self):
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('menu-items'), {'since': '!!'}).status_code, 400)
+
+
+class MenuSearchTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.desserts = Category.objects.create(slug='desserts', title='Desserts')
+        self.specials = Category.objects.create(slug='specials', title='Lemon specials')
+        self.tart = MenuItem.objects.create(title='Lemon tart', price='6.50', featured=False, category=self.desserts)
+        self.cake = MenuItem.objects.create(title='Carrot cake', price='5.00', featured=False, category=self.specials)
+        MenuItem.objects.create(title='Brownie', price='4.00', featured=False, category=self.desserts)
+        self.customer = self.make_user('carol', self.customer_group)
+        get_user_roles(self.customer)
+        self.login(self.customer)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('menu-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data['results']]
+
+    def test_prefix_match_ranks_titles_first(self):
+        self.assertEqual(self.search('lem'), ['Lemon tart', 'Carrot cake'])
+        self.assertEqual(self.search('car'), ['Carrot cake'])
+        self.assertEqual(self.search('lemon ta'), ['Lemon tart'])
+        self.assertEqual(self.search('lemon', limit=1), ['Lemon tart'])
+
+    def test_index_follows_writes(self):
+        MenuItem.objects.filter(pk=self.cake.pk).update(title='Carrot muffin')
+        self.assertEqual(self.search('muff'), ['Carrot muffin'])
+        self.specials.title = 'Seasonal'
+        self.specials.save()
+        self.assertEqual(self.search('lemon'), ['Lemon tart'])
+        self.assertEqual(self.search('seas'), ['Carrot muffin'])
+        self.tart.delete()
+        self.assertEqual(self.search('lemon'), [])
+        MenuItem.objects.bulk_create([MenuItem(title='Lemonade', price='3.00', featured=False, category=self.desserts)])
+        self.assertEqual(self.search('lemon'), ['Lemonade'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for q in ('"lemon', 'lemon OR', 'title:brownie', 'NEAR(a b)', '*', 'tart -lemon'):
+            self.search(q)
+        self.assertEqual(self.search('"brownie"'), ['Brownie'])
+
+    def test_query_count_and_etag(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('menu-search'), {'q': 'lemon'})
+        etag = response['ETag']
+        self.login(self.customer)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('menu-search'), {'q': 'lemon'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_validation(self):
+        self.assertEqual(self.client.get(reverse('menu-search')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('menu-search'), {'q': 'a', 'limit': 'x'}).status_code, 400)
+        self.login(self.make_user('dave', self.delivery_group))
+        self.assertEqual(self.client.get(reverse('menu-search'), {'q': 'lemon'}).status_code, 403)
+
+
+class CatalogImportExportTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pizza = Category.objects.create(slug='pizza', title='Pizza')
+        self.item = MenuItem.objects.create(title='Margherita', price='9.99', featured=False, category=self.pizza)
+        self.manager = self.make_user('mia', self.manager_group)
+        get_user_roles(self.manager)
+        self.login(self.manager)
+
+    def upload(self, name, body, content_type='text/csv'):
+        return self.client.post(reverse(name), data=body.encode(), content_type=content_type)
+
+    def export(self, name, output):
+        response = self.client.get(reverse(name), {'output': output})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_import_reports_errors_and_keeps_going(self):
+        body = ('id,title,price,featured,category\n'
+                f',Marinara,8.50,true,{self.pizza.pk}\n'
+                f',Bad price,abc,,{self.pizza.pk}\n'
+                ',Orphan,5.00,,999\n'
+                f'{self.item.pk},Margherita DOP,11.00,,{self.pizza.pk}\n'
+                f'999,Ghost,5.00,,{self.pizza.pk}\n'
+                f',Diavola,10.00,,{self.pizza.pk}\n')
+        version = get_catalog_version()
+        response = self.upload('menu-items-import', body)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(get_catalog_version(), version)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['error_count']), (2, 1, 3))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3, 5])
+        self.assertIn('category', response.data['errors'][1]['errors'])
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.title, str(self.item.price)), ('Margherita DOP', '11.00'))
+        self.assertTrue(MenuItem.objects.get(title='Marinara').featured)
+
+    def test_update_keeps_columns_the_row_leaves_out(self):
+        MenuItem.objects.filter(pk=self.item.pk).update(featured=True)
+        body = ('id,title,price,category\n'
+                f'{self.item.pk},Margherita DOP,11.00,{self.pizza.pk}\n')
+        self.assertEqual(self.upload('menu-items-import', body).data['updated'], 1)
+        body = ('id,title,price,featured,category\n'
+                f'{self.item.pk},Margherita,9.99,,{self.pizza.pk}\n')
+        self.assertEqual(self.upload('menu-items-import', body).data['updated'], 1)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.title, self.item.featured), ('Margherita', True))
+
+    def test_upload_is_read_before_the_write_transaction(self):
+        depth = len(connection.atomic_blocks)
+        test = self
+
+        class Upload(io.BytesIO):
+            def read(self, *args):
+                test.assertEqual(len(connection.atomic_blocks), depth)
+                return super().read(*args)
+
+        report = CATALOG_IMPORTS['categories']().run(Upload(b'slug,title\ndrinks,Drinks\n'), 'csv')
+        self.assertEqual(report.created, 1)
+
+    def test_queries_per_batch_not_per_row(self):
+        def import_rows(count):
+            body = 'title,price,category\n' + ''.join(f'Item {i},5.00,{self.pizza.pk}\n' for i in range(count))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.upload('menu-items-import', body).data['created'], count)
+            return len(queries)
+        self.assertEqual(import_rows(5), import_rows(100))
+
+    def test_ndjson_import(self):
+        body = ('{"slug": "drinks", "title": "Drinks"}\n'
+                'not json\n'
+                '\n'
+                f'{{"id": {self.pizza.pk}, "slug": "pizza", "title": "Pizzas"}}\n')
+        response = self.upload('categories-import', body, 'application/x-ndjson')
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['error_count']), (1, 1, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(Category.objects.get(pk=self.pizza.pk).title, 'Pizzas')
+
+    async def test_asgi_export_is_iterated_asynchronously(self):
+        request = AsyncRequestFactory().get(reverse('menu-items-export'), {'output': 'csv'},
+                                            headers={'Authorization': f'Bearer {AccessToken.for_user(self.manager)}'})
+        response = await sync_to_async(catalogExportView)(request, kind='menu-items')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body.decode().splitlines()[1], f'{self.item.pk},Margherita,9.99,false,{self.pizza.pk}')
+        await sync_to_async(response.close)()
+
+    def test_export_round_trip(self):
+        exported = self.export('menu-items-export', 'csv')
+        self.assertEqual(exported.splitlines(), ['id,title,price,featured,category',
+                                                 f'{self.item.pk},Margherita,9.99,false,{self.pizza.pk}'])
+        response = self.upload('menu-items-import', exported.replace('9.99', '10.50'))
+        self.assertEqual((response.data['created'], response.data['updated']), (0, 1))
+
+        rows = [json.loads(line) for line in self.export('categories-export', 'ndjson').splitlines()]
+        self.assertEqual(rows, [{'id': self.pizza.pk, 'slug': 'pizza', 'title': 'Pizza'}])
+        MenuItem.objects.all().delete()
+        Category.objects.all().delete()
+        self.assertEqual(self.export('categories-export', 'csv'), 'id,slug,title\r\n')
+
+    def test_validation_and_permissions(self):
+        self.assertEqual(self.upload('menu-items-import', '{}', 'application/json').status_code, 415)
+        self.assertEqual(self.client.get(reverse('menu-items-export'), {'output': 'xml'}).status_code, 400)
+        self.login(self.make_user('carol', self.customer_group))
+        self.assertEqual(self.client.get(reverse('menu-items-export')).status_code, 403)
+        self.assertEqual(self.upload('menu-items-import', 'title\n').status_code, 403)
+
+
+class WarmUpTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        Category.objects.create(slug='pizza', title='Pizza')
+        self.manager = self.make_user('mia', self.manager_group, self.customer_group)
+        self.make_user('carol', self.customer_group)
+
+    def test_warm_up_fills_caches(self):
+        with self.assertNumQueries(5):
+            timings = warm_up()
+        self.assertEqual(list(timings), list(WARMUP_PHASES))
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(category_ids.get('pizza'))
+            self.assertEqual(get_user_roles(User(pk=self.manager.pk)), {MANAGER, CUSTOMER})
+        # customers are not primed
+        self.assertEqual(len(cache.get_many([f'bar:roles:{user.pk}' for user in User.objects.all()])), 1)
+
+    def test_worker_hook_is_opt_in(self):
+        with mock.patch('LittleLemonAPI.warmup.connections') as connections:
+            self.assertIsNone(warm_up_worker())
+            with override_settings(WARMUP_ON_START=True), self.assertLogs('LittleLemonAPI.warmup', 'INFO'):
+                self.assertEqual(list(warm_up_worker()), list(WARMUP_PHASES))
+        connections.close_all.assert_called_once_with()
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('warm_up', '--phase', 'urls', '--phase', 'settings', stdout=out)
+        self.assertEqual([line.split()[0] for line in out.getvalue().splitlines()], ['urls', 'settings', 'Warmed'])
+
+
+class ListQueryCountTests(BarAPITestCase):
+    """Every list endpoint runs a constant number of queries"""
+
+    ROWS = 12
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.driver = self.make_user('dave', self.delivery_group)
+        self.admin = self.make_user('admin', self.manager_group, is_staff=True)
+        for i in range(self.ROWS):
+            category = Category.objects.create(slug=f'cat-{i}', title=f'Category {i}')
+            item = MenuItem.objects.create(title=f'Item {i}', price='5.00', featured=False, category=category)
+            Cart.objects.create(user=self.customer, menuitem=item, quantity=1, unit_price='5.00', price='5.00')
+            Order.objects.create(user=self.customer, delivery_crew=self.driver, total='5.00', date='2025-01-01')
+            self.make_user(f'manager{i}', self.manager_group)
+
+    def assertListQueries(self, user, url, num, params=None):
+        self.login(user)
+        # warm the role cache so only the list queries are counted
+        self.client.get(url, params)
+        self.login(user)
+        with self.assertNumQueries(num):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if 'results' in response.data else response.data
+        self.assertGreaterEqual(len(rows), 2)
+
+    # the catalog version, then the list
+
+    def test_menu_items(self):
+        self.assertListQueries(self.customer, reverse('menu-items'), 2)
+
+    def test_menu_items_ordered(self):
+        self.assertListQueries(self.customer, reverse('menu-items'), 2, {'ordering': '-price'})
+
+    def test_menu_items_by_category(self):
+        MenuItem.objects.create(title='Item 0b', price='6.00', featured=False,
+                                category=Category.objects.get(slug='cat-0'))
+        self.assertListQueries(self.customer, reverse('menu-items'), 2, {'category_name': 'category 0'})
+
+    def test_categories(self):
+        self.assertListQueries(self.customer, reverse('categories'), 2)
+
+    def test_cart(self):
+        self.assertListQueries(self.customer, reverse('cart-management'), 1)
+
+    def test_customer_orders(self):
+        self.assertListQueries(self.customer, reverse('customer-orders'), 1)
+
+    def test_delivery_crew_orders(self):
+        self.assertListQueries(self.driver, reverse('delivery-crew-orders'), 1)
+
+    def test_group_members(self):
+        self.assertListQueries(self.admin, reverse('manager-users'), 4, {'group_name': 'manager'})
+
+
+class RendererTests(TestCase):
+
+    def test_fast_renderer_matches_drf(self):
+        from collections import OrderedDict
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        data = OrderedDict([
+            ('price', Decimal('9.50')),
+            ('date', timezone.localdate()),
+            ('at', timezone.now()),
+            ('naive', timezone.now().replace(tzinfo=None)),
+            ('label', gettext_lazy('Menu')),
+            ('counts', {1: 2}),
+            ('text', 'caf\u00e9 \u2028 "quoted"'),
+            ('rows', [None, True, 1.5, []]),
+        ])
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_values_orjson_refuses_go_to_drf(self):
+        from rest_framework.renderers import JSONRenderer
+        data = {'big': 2 ** 70, 'small': -2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        # the one documented difference
+        self.assertEqual(FastJSONRenderer().render({'x': float('nan')}), b'{"x":null}')
+
+    def test_indented_response_uses_drf_encoder(self):
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'), b'{\n  "a": 1\n}')
+
+
+class StreamingListTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.driver = self.make_user('dave', self.delivery_group)
+        category = Category.objects.create(slug='pizza', title='Pizza')
+        for i in range(5):
+            MenuItem.objects.create(title=f'Item {i}', price=f'{9 - i}.00', featured=False, category=category)
+            Order.objects.create(user=self.customer, delivery_crew=self.driver, total='5.00', date=f'2025-01-0{i + 1}')
+        self.login(self.customer)
+
+    def get_stream(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        return response, b''.join(response.streaming_content)
+
+    def test_menu_items_ndjson(self):
+        response, body = self.get_stream(reverse('menu-items'), stream='ndjson', ordering='price')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(response.has_header('ETag'))
+        items = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([item['price'] for item in items], ['5.00', '6.00', '7.00', '8.00', '9.00'])
+        self.assertEqual(items[0]['category']['title'], 'Pizza')
+
+    def test_orders_json_array_matches_pages(self):
+        page = self.client.get(reverse('customer-orders'), {'page_size': 100}).data['results']
+        _, body = self.get_stream(reverse('customer-orders'), stream='json')
+        self.assertEqual(json.loads(body), json.loads(json.dumps(page)))
+
+        self.login(self.driver)
+        _, body = self.get_stream(reverse('delivery-crew-orders'), stream='ndjson')
+        self.assertEqual(len(body.splitlines()), 5)
+
+    def test_chunks_and_empty_results(self):
+        request = APIRequestFactory().get(reverse('menu-items'))
+        menu_items = MenuItemSerializer.setup_eager_loading(MenuItem.objects.order_by('id'))
+        body = b''.join(stream_response(request, menu_items, MenuItemSerializer, 'json', chunk_size=2).streaming_content)
+        self.assertEqual([item['title'] for item in json.loads(body)], [f'Item {i}' for i in range(5)])
+        body = b''.join(stream_response(request, menu_items.none(), MenuItemSerializer, 'json').streaming_content)
+        self.assertEqual(body, b'[]')
+        response = stream_response(request, menu_items.none(), MenuItemSerializer, 'ndjson')
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    async def test_asgi_stream_is_read_chunk_by_chunk(self):
+        request = AsyncRequestFactory().get(reverse('menu-items'))
+        menu_items = MenuItemSerializer.setup_eager_loading(MenuItem.objects.order_by('id'))
+        response = stream_response(request, menu_items, MenuItemSerializer, 'ndjson', chunk_size=2)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual([len(chunk.splitlines()) for chunk in chunks], [2, 2, 1])
+        await sync_to_async(response.close)()
+
+    def test_invalid_stream_format(self):
+        self.assertEqual(self.client.get(reverse('menu-items'), {'stream': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('customer-orders'), {'stream': 'csv'}).status_code, 400)
+
+
+class CheckoutTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.category = Category.objects.create(slug='mains', title='Mains')
+        get_user_roles(self.customer)
+
+    def fill_cart(self, size):
+        for i in range(size):
+            item = MenuItem.objects.create(title=f'Dish {i}', price='2.50', featured=False, category=self.category)
+            Cart.objects.create(user=self.customer, menuitem=item, quantity=2, unit_price='2.50', price='5.00')
+
+    def checkout(self):
+        self.login(self.customer)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('customer-orders'))
+        return response, len(queries)
+
+    def test_checkout_creates_order_and_clears_cart(self):
+        self.fill_cart(3)
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(str(order.total), '15.00')
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_checkout_query_count_independent_of_basket_size(self):
+        self.fill_cart(2)
+        _, small = self.checkout()
+        self.fill_cart(20)
+        _, large = self.checkout()
+        self.assertEqual(small, large)
+
+    def test_empty_cart_creates_no_order(self):
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_rolls_back_order(self):
+        self.fill_cart(2)
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError('boom')):
+            response, _ = self.checkout()
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 2)
+
+
+class SalesReportTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.manager = self.make_user('mia', self.manager_group)
+        mains = Category.objects.create(slug='mains', title='Mains')
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        self.burger = MenuItem.objects.create(title='Burger', price='8.00', featured=False, category=mains)
+        self.soda = MenuItem.objects.create(title='Soda', price='2.00', featured=False, category=drinks)
+        self.today = timezone.now().date().isoformat()
+
+    def order(self, *lines):
+        for item, quantity in lines:
+            Cart.objects.create(user=self.customer, menuitem=item, quantity=quantity,
+                                unit_price=item.price, price=Decimal(item.price) * quantity)
+        return place_order(self.customer)
+
+    def report(self, name, params=None):
+        self.login(self.manager)
+        return self.client.get(reverse(name), params)
+
+    def test_checkout_updates_rollups(self):
+        self.order((self.burger, 2), (self.soda, 1))
+        self.order((self.soda, 3))
+
+        day = DailySales.objects.get()
+        self.assertEqual((str(day.revenue), day.orders, day.units), ('24.00', 2, 6))
+        soda = DailyMenuItemSales.objects.get(menuitem=self.soda)
+        self.assertEqual((str(soda.revenue), soda.orders, soda.units), ('8.00', 2, 4))
+        mains = DailyCategorySales.objects.get(category=self.burger.category)
+        self.assertEqual((str(mains.revenue), mains.orders, mains.units), ('16.00', 1, 2))
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.order((self.burger, 2), (self.soda, 1))
+        self.order((self.soda, 3))
+
+        def snapshot():
+            return [sorted(model.objects.values_list(*fields)) for model, fields in (
+                (DailySales, ('date', 'revenue', 'orders', 'units')),
+                (DailyCategorySales, ('date', 'category_id', 'revenue', 'orders', 'units')),
+                (DailyMenuItemSales, ('date', 'menuitem_id', 'revenue', 'orders', 'units')),
+            )]
+
+        incremental = snapshot()
+        DailySales.objects.update(revenue=0)
+        call_command('rebuild_sales_rollups', start=timezone.now().date(), stdout=io.StringIO())
+        self.assertEqual(snapshot(), incremental)
+
+    def test_sales_report(self):
+        self.order((self.burger, 1))
+        response = self.report('sales-report', {'start': self.today, 'end': self.today})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['revenue'], '8.00')
+        self.assertEqual(response.data['orders'], 1)
+        self.assertEqual(len(response.data['days']), 1)
+
+    def test_top_sellers(self):
+        self.order((self.burger, 1), (self.soda, 1))
+        self.order((self.soda, 5))
+        response = self.report('top-sellers', {'metric': 'units'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['title'] for row in response.data['results']], ['Soda', 'Burger'])
+        response = self.report('top-sellers', {'by': 'category'})
+        self.assertEqual([row['title'] for row in response.data['results']], ['Drinks', 'Mains'])
+        self.assertEqual(response.data['results'][0]['revenue'], '12.00')
+
+    def test_reports_are_manager_only(self):
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('sales-report')).status_code, 403)
+
+    def test_invalid_range(self):
+        response = self.report('sales-report', {'start': '2025-02-01', 'end': '2025-01-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.report('top-sellers', {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderExportTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.manager = self.make_user('mia', self.manager_group)
+        self.burger = MenuItem.objects.create(title='Burger', price='8.00', featured=False,
+                                              category=Category.objects.create(slug='mains', title='Mains'))
+        self.soda = MenuItem.objects.create(title='Soda', price='2.00', featured=False,
+                                            category=Category.objects.create(slug='drinks', title='Drinks'))
+        self.first = self.order((self.burger, 2), (self.soda, 1))
+        self.second = self.order((self.soda, 3))
+        old = self.order((self.burger, 1))
+        Order.objects.filter(pk=old.pk).update(date=datetime.date(2020, 1, 1))
+
+    order = SalesReportTests.order
+
+    def export(self, params):
+        self.login(self.manager)
+        response = self.client.get(reverse('orders-export'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_a_row_per_line(self):
+        rows = list(csv.DictReader(io.StringIO(self.export({'output': 'csv'}))))
+        self.assertEqual([(int(row['order']), row['title'], row['quantity']) for row in rows], [
+            (self.first.pk, 'Burger', '2'), (self.first.pk, 'Soda', '1'), (self.second.pk, 'Soda', '3'),
+        ])
+        self.assertEqual((rows[0]['customer'], rows[0]['category'], rows[0]['total'], rows[0]['delivery_crew']),
+                         ('carol', 'Mains', '18.00', ''))
+
+    def test_ndjson_nests_lines_and_filters_dates(self):
+        orders = [json.loads(line) for line in self.export({'start': '2019-12-01', 'end': '2020-01-31'}).splitlines()]
+        self.assertEqual(len(orders), 1)
+        self.assertEqual((orders[0]['date'], orders[0]['total']), ('2020-01-01', '8.00'))
+        self.assertEqual(orders[0]['items'], [{
+            'menuitem': self.burger.pk, 'title': 'Burger', 'category': 'Mains',
+            'quantity': 1, 'unit_price': '8.00', 'price': '8.00',
+        }])
+
+    async def test_asgi_export_is_iterated_asynchronously(self):
+        request = AsyncRequestFactory().get(reverse('orders-export'), {'output': 'csv'},
+                                            headers={'Authorization': f'Bearer {AccessToken.for_user(self.manager)}'})
+        response = await sync_to_async(managerOrderExportView)(request)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 4)
+        await sync_to_async(response.close)()
+
+    def test_chunks_do_not_split_output(self):
+        with self.assertNumQueries(1):
+            chunks = list(export_orders('ndjson', chunk_size=1))
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(chunk.endswith(b'\n') for chunk in chunks))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_orders', start=datetime.date(2020, 1, 1), end=datetime.date(2020, 1, 1), stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        with self.assertRaises(CommandError):
+            call_command('export_orders', start=datetime.date(2020, 2, 1), end=datetime.date(2020, 1, 1))
+
+    def test_validation_and_permissions(self):
+        self.login(self.manager)
+        self.assertEqual(self.client.get(reverse('orders-export'), {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('orders-export'), {'start': 'yesterday'}).status_code, 400)
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('orders-export')).status_code, 403)
+
+
+class KeysetPaginationTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        category = Category.objects.create(slug='drinks', title='Drinks')
+        # repeated prices exercise the id tie-breaker
+        for i in range(11):
+            MenuItem.objects.create(title=f'Drink {i}', price=f'{i % 4 + 1}.00', featured=False, category=category)
+        for i in range(7):
+            Order.objects.create(user=self.customer, total='1.00', date=f'2025-01-{i % 3 + 1:02d}')
+        self.login(self.customer)
+
+    def walk(self, url, params):
+        seen, pages = [], 0
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            while True:
+                pages += 1
+                seen.extend(response.data['results'])
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        return seen, pages
+
+    def test_menu_items_by_price(self):
+        items, pages = self.walk(reverse('menu-items'), {'ordering': '-price', 'page_size': 3})
+        self.assertEqual(pages, 4)
+        self.assertEqual(len({item['id'] for item in items}), 11)
+        keys = [(float(item['price']), item['id']) for item in items]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_previous_link(self):
+        first = self.client.get(reverse('menu-items'), {'ordering': 'price', 'page_size': 4}).data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_customer_orders_newest_first(self):
+        orders, _ = self.walk(reverse('customer-orders'), {'page_size': 2})
+        keys = [(order['date'], order['id']) for order in orders]
+        self.assertEqual(len(keys), 7)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('menu-items'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_keys_of_the_wrong_type(self):
+        def cursor(*keys):
+            return base64.urlsafe_b64encode(json.dumps([list(keys), 0]).encode()).decode().rstrip('=')
+
+        driver = self.make_user('dave', self.delivery_group)
+        cases = [
+            (self.customer, reverse('menu-items'), {'cursor': cursor('abc')}),
+            (self.customer, reverse('menu-items'), {'cursor': cursor({'a': 1})}),
+            (self.customer, reverse('menu-items'), {'cursor': cursor(None)}),
+            (self.customer, reverse('menu-items'), {'cursor': cursor(2 ** 70)}),
+            (self.customer, reverse('menu-items'), {'ordering': 'price', 'cursor': cursor('cheap', 1)}),
+            (self.customer, reverse('menu-items'), {'ordering': '-price', 'cursor': cursor('1.00', [])}),
+            (self.customer, reverse('customer-orders'), {'cursor': cursor('yesterday', 1)}),
+            (self.customer, reverse('customer-orders'), {'cursor': cursor('2025-01-01', 'x')}),
+            (driver, reverse('delivery-crew-orders'), {'cursor': cursor(20250101, 1)}),
+        ]
+        for user, url, params in cases:
+            self.login(user)
+            response = self.client.get(url, params)
+            self.assertEqual((response.status_code, response.data), (404, {'detail': 'Invalid cursor'}), params)
+        # well-formed keys still page
+        self.login(self.customer)
+        response = self.client.get(reverse('menu-items'), {'ordering': 'price', 'cursor': cursor('2.00', 1)})
+        self.assertEqual(response.status_code, 200)
+
+
+class DeliverySyncTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.driver = self.make_user('dave', self.delivery_group)
+        self.other_driver = self.make_user('erin', self.delivery_group)
+        self.orders = [
+            Order.objects.create(user=self.customer, delivery_crew=self.driver, total='5.00', date='2025-01-01')
+            for _ in range(3)
+        ]
+        get_user_roles(self.driver)
+
+    def poll(self, token='', **params):
+        self.login(self.driver)
+        response = self.client.get(reverse('delivery-crew-orders'), {'since': token, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_first_poll_returns_everything(self):
+        data = self.poll()
+        self.assertEqual([order['id'] for order in data['results']], [order.id for order in self.orders])
+        self.assertEqual(data['removed'], [])
+        self.assertFalse(data['has_more'])
+
+    def test_steady_state_poll_reads_no_rows(self):
+        token = self.poll()['sync_token']
+        self.login(self.driver)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('delivery-crew-orders'), {'since': token})
+        # the changed orders and the removals, both empty index range scans
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['sync_token'], token)
+
+    def test_status_change_and_reassignment(self):
+        token = self.poll()['sync_token']
+        self.orders[0].status = True
+        self.orders[0].save()
+        self.orders[1].delivery_crew = self.other_driver
+        self.orders[1].save()
+        new_order = Order.objects.create(user=self.customer, total='7.00', date='2025-01-02')
+        new_order.delivery_crew = self.driver
+        new_order.save(update_fields=['delivery_crew'])
+
+        data = self.poll(token)
+        self.assertEqual([order['id'] for order in data['results']], [self.orders[0].id, new_order.id])
+        self.assertTrue(data['results'][0]['status'])
+        self.assertEqual(data['removed'], [self.orders[1].id])
+        self.assertEqual(self.poll(data['sync_token'])['results'], [])
+
+    def test_deleted_order_is_removed(self):
+        token = self.poll()['sync_token']
+        order_id = self.orders[2].id
+        self.orders[2].delete()
+        self.assertEqual(self.poll(token)['removed'], [order_id])
+
+    def test_pages_through_changes(self):
+        first = self.poll(page_size=2)
+        self.assertTrue(first['has_more'])
+        second = self.poll(first['sync_token'], page_size=2)
+        self.assertFalse(second['has_more'])
+        ids = [order['id'] for order in first['results'] + second['results']]
+        self.assertEqual(ids, [order.id for order in self.orders])
+
+    def test_invalid_token(self):
+        self.login(self.driver)
+        response = self.client.get(reverse('delivery-crew-orders'), {'since': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DispatchTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.manager = self.make_user('mia', self.manager_group)
+        self.busy = self.make_user('dave', self.delivery_group)
+        self.idle = self.make_user('erin', self.delivery_group)
+        for _ in range(3):
+            Order.objects.create(user=self.customer, delivery_crew=self.busy, total='5.00', date='2025-01-01')
+        get_user_roles(self.manager)
+
+    def waiting(self, count):
+        return [Order.objects.create(user=self.customer, total='5.00', date='2025-01-02') for _ in range(count)]
+
+    def dispatch(self, body=None):
+        self.login(self.manager)
+        return self.client.post(reverse('dispatch-orders'), body or {}, format='json')
+
+    def test_balances_open_orders(self):
+        self.waiting(5)
+        response = self.dispatch()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assigned'], 5)
+        # erin catches up with dave's three open orders, then they alternate
+        self.assertEqual(response.data['open_orders'], {'dave': 4, 'erin': 4})
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+
+    def test_query_count_independent_of_batch_size(self):
+        self.waiting(2)
+        self.login(self.manager)
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(reverse('dispatch-orders'), {}, format='json')
+        self.waiting(200)
+        self.login(self.manager)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(reverse('dispatch-orders'), {}, format='json')
+        self.assertEqual(response.data['assigned'], 200)
+        self.assertEqual(len(small), len(large))
+
+    def test_updates_stay_under_the_parameter_limit(self):
+        self.waiting(5)
+        # two orders per UPDATE
+        with mock.patch.object(connection.features, 'max_query_params', 7), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.dispatch()
+        self.assertEqual(response.data['assigned'], 5)
+        self.assertEqual(sum(query['sql'].startswith('WITH assigned') for query in queries), 3)
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+
+    def test_delivered_and_assigned_orders_are_left_alone(self):
+        delivered = Order.objects.create(user=self.customer, status=True, total='5.00', date='2025-01-01')
+        waiting, = self.waiting(1)
+        response = self.dispatch({'order_ids': [delivered.id, waiting.id]})
+        self.assertEqual([row['order_id'] for row in response.data['assignments']], [waiting.id])
+        delivered.refresh_from_db()
+        self.assertIsNone(delivered.delivery_crew_id)
+
+    def test_dispatch_shows_up_in_driver_sync(self):
+        waiting, = self.waiting(1)
+        token = encode_sync_token(Order.objects.get(pk=waiting.pk).updated)
+        self.dispatch()
+        self.login(self.idle)
+        response = self.client.get(reverse('delivery-crew-orders'), {'since': token})
+        self.assertEqual([order['id'] for order in response.data['results']], [waiting.id])
+
+    def test_no_delivery_crew(self):
+        self.delivery_group.user_set.clear()
+        self.waiting(1)
+        self.assertEqual(self.dispatch().status_code, 409)
+
+    def test_managers_only(self):
+        self.login(self.customer)
+        self.assertEqual(self.client.post(reverse('dispatch-orders'), {}, format='json').status_code, 403)
+
+    def test_validation(self):
+        self.assertEqual(self.dispatch({'limit': 0}).status_code, 400)
+        self.assertEqual(self.dispatch({'order_ids': 'all'}).status_code, 400)
+
+
+class WriteTransactionTests(TestCase):
+
+    def run_locked(self, failures):
+        calls = []
+
+        @write_transaction
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        # run as if outside the test transaction so retries are allowed
+        with mock.patch('LittleLemonAPI.db.transaction.atomic', contextlib.nullcontext), \
+                mock.patch('LittleLemonAPI.db.connection') as conn, \
+                mock.patch('LittleLemonAPI.db.time.sleep'):
+            conn.in_atomic_block = False
+            return write(), len(calls)
+
+    def test_retries_locked_writes(self):
+        self.assertEqual(self.run_locked(2), ('done', 3))
+
+    def test_gives_up_after_bounded_retries(self):
+        with self.assertRaises(OperationalError):
+            self.run_locked(10)
+
+
+class CartItemTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.item = MenuItem.objects.create(title='Burger', price='7.25', featured=False, category=category)
+        self.login(self.customer)
+
+    def test_add_then_update(self):
+        url = reverse('cart-management')
+        response = self.client.post(url, {'menuitem_id': self.item.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(url, {'menuitem_id': self.item.id, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quantity'], 3)
+        self.assertEqual(response.data['price'], '21.75')
+
+    def test_unknown_menu_item(self):
+        response = self.client.post(reverse('cart-management'), {'menuitem_id': 999, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_add_is_one_write(self):
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=1, unit_price='7.25', price='7.25')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('cart-management'), {'menuitem_id': self.item.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quantity'], 3)
+        statements = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # the upsert, then one read for the response
+        self.assertEqual(len(statements), 2)
+        self.assertIn('ON CONFLICT', statements[0])
+
+    def test_quantity_must_be_positive(self):
+        response = self.client.post(reverse('cart-management'), {'menuitem_id': self.item.id, 'quantity': -1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_quantity_must_be_a_bounded_integer(self):
+        for quantity in (10 ** 7, 1000, 1.7, '1.7'):
+            response = self.client.post(reverse('cart-management'), {'menuitem_id': self.item.id, 'quantity': quantity},
+                                        format='json')
+            self.assertEqual(response.status_code, 400, quantity)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_lines_stay_within_their_columns(self):
+        url = reverse('cart-management')
+        self.assertEqual(self.client.post(url, {'menuitem_id': self.item.id, 'quantity': 600}, format='json').status_code, 201)
+        # 1200 items, and 8700.00 only fits the price column
+        response = self.client.post(url, {'menuitem_id': self.item.id, 'quantity': 600}, format='json')
+        self.assertEqual(response.status_code, 400)
+        pricey = MenuItem.objects.create(title='Lobster', price='99.00', featured=False, category=self.item.category)
+        response = self.client.post(reverse('cart-batch'), {'items': [{'menuitem_id': self.item.id, 'quantity': 1},
+                                                                      {'menuitem_id': pricey.id, 'quantity': 150}]},
+                                    format='json')
+        self.assertEqual((response.status_code, response.data['menuitem_ids']), (400, [pricey.id]))
+        # nothing of the refused adds was written, the cart still reads
+        self.assertEqual(list(Cart.objects.filter(user=self.customer).values_list('quantity', flat=True)), [600])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_batch(self):
+        fries = MenuItem.objects.create(title='Fries', price='2.50', featured=False, category=self.item.category)
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=1, unit_price='7.25', price='7.25')
+        items = [
+            {'menuitem_id': self.item.id, 'quantity': 2},
+            {'menuitem_id': fries.id, 'quantity': 1},
+            {'menuitem_id': fries.id, 'quantity': 2},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('cart-batch'), {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['menuitem']['id']: row for row in response.data}
+        self.assertEqual(rows[self.item.id]['quantity'], 3)
+        self.assertEqual(rows[self.item.id]['price'], '21.75')
+        self.assertEqual(rows[fries.id]['quantity'], 3)
+        self.assertEqual(rows[fries.id]['price'], '7.50')
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('WITH')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_batch_unknown_item_writes_nothing(self):
+        items = [{'menuitem_id': self.item.id, 'quantity': 1}, {'menuitem_id': 999, 'quantity': 1}]
+        response = self.client.post(reverse('cart-batch'), {'items': items}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['menuitem_ids'], [999])
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_batch_validation(self):
+        for body in ({}, {'items': []}, {'items': [{'menuitem_id': self.item.id, 'quantity': 0}]}, {'items': ['x']}):
+            response = self.client.post(reverse('cart-batch'), body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+CACHE_CART_STORE = {'BACKEND': 'LittleLemonAPI.cart.CacheCartStore', 'OPTIONS': {'cache': 'carts', 'idle': 300}}
+
+
+@override_settings(CART_STORE=CACHE_CART_STORE)
+class CacheCartStoreTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.item = MenuItem.objects.create(title='Burger', price='7.25', featured=False, category=category)
+        self.fries = MenuItem.objects.create(title='Fries', price='2.50', featured=False, category=category)
+        self.login(self.customer)
+
+    def add(self, menuitem_id, quantity):
+        return self.client.post(reverse('cart-management'), {'menuitem_id': menuitem_id, 'quantity': quantity}, format='json')
+
+    def writes(self, queries):
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE', 'WITH'))]
+
+    def test_lines_stay_within_their_columns(self):
+        self.assertEqual(self.add(self.item.id, 900).status_code, 201)
+        self.assertEqual(self.add(self.item.id, 100).status_code, 400)
+        self.assertEqual(self.add(self.fries.id, 999).status_code, 201)
+        self.assertEqual(self.add(self.item.id, 99).status_code, 200)
+        listed = self.client.get(reverse('cart-management'))
+        self.assertEqual([row['quantity'] for row in listed.data], [999, 999])
+
+    def test_adds_and_reads_write_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.add(self.item.id, 2)
+            second = self.add(self.item.id, 1)
+            self.add(self.fries.id, 1)
+            listed = self.client.get(reverse('cart-management'))
+        self.assertEqual(self.writes(queries), [])
+        self.assertFalse(Cart.objects.exists())
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['quantity'], 3)
+        self.assertEqual(second.data['price'], '21.75')
+        self.assertEqual(second.data['user'], 'carol')
+        self.assertEqual(second.data['menuitem']['category']['title'], 'Mains')
+        self.assertIsNone(second.data['id'])
+        self.assertEqual([row['menuitem']['id'] for row in listed.data], [self.item.id, self.fries.id])
+
+    def test_read_is_one_query(self):
+        self.add(self.item.id, 2)
+        with self.assertNumQueries(1):
+            response = get_cart_store().lines(self.customer)
+        self.assertEqual(len(response), 1)
+
+    def test_unknown_menu_item(self):
+        self.assertEqual(self.add(999, 1).status_code, 404)
+        response = self.client.post(reverse('cart-batch'), {'items': [{'menuitem_id': self.item.id, 'quantity': 1},
+                                                                      {'menuitem_id': 999, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(reverse('cart-management')).status_code, 204)
+
+    def test_batch(self):
+        self.add(self.fries.id, 1)
+        items = [{'menuitem_id': self.item.id, 'quantity': 1}, {'menuitem_id': self.fries.id, 'quantity': 2},
+                 {'menuitem_id': self.item.id, 'quantity': 1}]
+        response = self.client.post(reverse('cart-batch'), {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['menuitem']['id'], row['quantity']) for row in response.data],
+                         [(self.fries.id, 3), (self.item.id, 2)])
+
+    def test_checkout(self):
+        self.add(self.item.id, 2)
+        self.add(self.fries.id, 1)
+        response = self.client.post(reverse('customer-orders'))
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(str(order.total), '17.00')
+        self.assertEqual(sorted(OrderItem.objects.filter(order=order).values_list('menuitem_id', 'quantity')),
+                         [(self.item.id, 2), (self.fries.id, 1)])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_store().lines(self.customer), [])
+        self.assertEqual(self.client.post(reverse('customer-orders')).status_code, 400)
+
+    def test_flush_idle_writes_rows(self):
+        self.add(self.item.id, 2)
+        store = get_cart_store()
+        # still within the idle period
+        self.assertEqual(store.flush_idle(), 0)
+        self.assertFalse(Cart.objects.exists())
+
+        out = io.StringIO()
+        call_command('flush_carts', idle=0, stdout=out)
+        self.assertIn('Wrote 1 carts', out.getvalue())
+        row = Cart.objects.get(user=self.customer)
+        self.assertEqual((row.quantity, str(row.price)), (2, '14.50'))
+        self.assertEqual(self.client.get(reverse('cart-management')).data[0]['id'], row.id)
+        # clean carts are not written again
+        self.assertEqual(store.flush_idle(0), 0)
+
+        self.add(self.item.id, 1)
+        self.assertEqual(store.flush_idle(0), 1)
+        row.refresh_from_db()
+        self.assertEqual((row.quantity, str(row.price)), (3, '21.75'))
+
+        # checkout removes the written rows
+        self.client.post(reverse('customer-orders'))
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(Order.objects.get().total, Decimal('21.75'))
+
+    def test_cart_missing_from_cache_is_loaded_from_rows(self):
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=1, unit_price='7.00', price='7.00')
+        response = self.add(self.item.id, 1)
+        self.assertEqual(response.status_code, 200)
+        # the row keeps its unit price
+        self.assertEqual(response.data['price'], '14.00')
+        self.assertEqual(response.data['id'], Cart.objects.get().id)
+
+    def test_deleted_menu_item_is_dropped(self):
+        self.add(self.item.id, 1)
+        self.add(self.fries.id, 1)
+        self.fries.delete()
+        self.assertEqual([row['menuitem']['id'] for row in self.client.get(reverse('cart-management')).data],
+                         [self.item.id])
+        self.assertEqual(get_cart_store().flush_idle(0), 1)
+        self.assertEqual(list(Cart.objects.values_list('menuitem_id', flat=True)), [self.item.id])
+
+    def test_locked_cart(self):
+        store = get_cart_store()
+        self.assertIsInstance(store, CacheCartStore)
+        with mock.patch.object(store, 'lock_wait', 0.01), store._locked(store._key(self.customer.pk)):
+            response = self.add(self.item.id, 1)
+            self.assertEqual(response.status_code, 409)
+            with self.assertRaises(CartBusy):
+                store.place_order(self.customer)
+        self.assertEqual(self.add(self.item.id, 1).status_code, 201)
+
+
+class IdempotencyTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.item = MenuItem.objects.create(title='Burger', price='7.25', featured=False, category=category)
+        self.login(self.customer)
+
+    def add_to_cart(self, key, quantity=1):
+        return self.client.post(reverse('cart-management'), {'menuitem_id': self.item.id, 'quantity': quantity},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_checkout_retry_replays_without_a_second_order(self):
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=2, unit_price='7.25', price='14.50')
+        first = self.client.post(reverse('customer-orders'), HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.client.post(reverse('customer-orders'), HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.filter(user=self.customer).count(), 1)
+        # only authentication reads, the view did not run
+        self.assertFalse([q for q in queries.captured_queries if 'INSERT' in q['sql'] or 'cart' in q['sql']])
+
+    def test_cart_retry_adds_once(self):
+        self.assertEqual(self.add_to_cart('add-1', 2).status_code, 201)
+        self.assertEqual(self.add_to_cart('add-1', 2).status_code, 201)
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 2)
+        # a new key is a new write
+        self.assertEqual(self.add_to_cart('add-2', 2).data['quantity'], 4)
+
+    def test_key_reused_with_other_body(self):
+        self.add_to_cart('add-1', 2)
+        response = self.add_to_cart('add-1', 3)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 2)
+
+    def test_keys_are_per_user(self):
+        self.add_to_cart('add-1')
+        other = self.make_user('erin', self.customer_group)
+        self.login(other)
+        response = self.add_to_cart('add-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertTrue(Cart.objects.filter(user=other).exists())
+
+    def test_failure_is_not_replayed(self):
+        response = self.client.post(reverse('cart-management'), {'menuitem_id': 999, 'quantity': 1},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, 404)
+        # the key is free again, the corrected retry is a write
+        response = self.client.post(reverse('cart-management'), {'menuitem_id': 999, 'quantity': 1},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.add_to_cart('add-1').status_code, 201)
+
+    def test_without_header_every_request_runs(self):
+        url = reverse('cart-management')
+        self.client.post(url, {'menuitem_id': self.item.id, 'quantity': 1}, format='json')
+        response = self.client.post(url, {'menuitem_id': self.item.id, 'quantity': 1}, format='json')
+        self.assertEqual(response.data['quantity'], 2)
+
+    def test_invalid_key(self):
+        for key in ('', 'x' * 256):
+            self.assertEqual(self.add_to_cart(key).status_code, 400, key)
+        self.assertFalse(Cart.objects.exists())
+
+
+class IdempotencyStoreTests(TestCase):
+
+    def test_concurrent_duplicate_waits_for_the_first(self):
+        store = IdempotencyStore()
+        _, entry = store.begin('k', 'body', wait=1)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(store.begin('k', 'body', wait=5)))
+        waiter.start()
+        store.finish('k', entry, (201, {'id': 1}))
+        waiter.join()
+        self.assertEqual(results, [((201, {'id': 1}), None)])
+
+    def test_waiter_takes_over_a_failed_key(self):
+        store = IdempotencyStore()
+        _, entry = store.begin('k', 'body', wait=1)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(store.begin('k', 'body', wait=5)))
+        waiter.start()
+        store.finish('k', entry)
+        waiter.join()
+        stored, claimed = results[0]
+        self.assertIsNone(stored)
+        self.assertIsNot(claimed, entry)
+
+    def test_wait_timeout_and_other_body(self):
+        store = IdempotencyStore()
+        store.begin('k', 'body', wait=1)
+        with self.assertRaises(RequestInProgress):
+            store.begin('k', 'body', wait=0.01)
+        with self.assertRaises(KeyReused):
+            store.begin('k', 'other', wait=0)
+
+    @override_settings(IDEMPOTENCY={'SIZE': 2, 'TIMEOUT': 60, 'WAIT': 1})
+    def test_expiry_and_size(self):
+        store = IdempotencyStore()
+        for key in ('a', 'b', 'c'):
+            _, entry = store.begin(key, 'body', wait=0)
+            store.finish(key, entry, (200, key))
+        # 'a' was the least recently used
+        self.assertIsNotNone(store.begin('a', 'body', wait=0)[1])
+        self.assertEqual(store.begin('c', 'body', wait=0), ((200, 'c'), None))
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNotNone(store.begin('c', 'body', wait=0)[1])
+
+
+class QueryTimingMiddlewareTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.login(self.customer)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('customer-orders'))
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('view;dur=', timing)
+
+    def test_structured_log_line(self):
+        with self.assertLogs('LittleLemonAPI.requests', level='INFO') as logs:
+            logging.getLogger('LittleLemonAPI.requests').setLevel(logging.INFO)
+            self.client.get(reverse('customer-orders'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('customer-orders'))
+        self.assertIn('queries', record)
+
+    def test_budget_exceeded_fails_in_strict_mode(self):
+        tight_view = query_budget(0)(customerOrderListView)
+        request = APIRequestFactory().get(reverse('customer-orders'))
+        force_authenticate(request, user=User.objects.get(pk=self.customer.pk))
+        middleware = QueryTimingMiddleware(tight_view)
+        with self.assertRaises(QueryBudgetExceeded):
+            middleware(request)
+
+
+class AsyncReadEndpointTests(BarAPITestCase):
+    """The async read views answer exactly like the DRF views"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.driver = self.make_user('dave', self.delivery_group)
+        for i in range(3):
+            category = Category.objects.create(slug=f'cat-{i}', title=f'Category {i}')
+            MenuItem.objects.create(title=f'Item {i}', price=f'{i + 5}.00', featured=False, category=category)
+            Order.objects.create(user=self.customer, delivery_crew=self.driver, total='5.00', date=f'2025-01-0{i + 1}')
+        self.factory = AsyncRequestFactory()
+
+    def async_get(self, user, path, params=None, **headers):
+        if user is not None:
+            headers['Authorization'] = f'Bearer {AccessToken.for_user(user)}'
+        return self.factory.get(path, params, headers=headers)
+
+    def sync_get(self, user, path, params=None):
+        self.login(user)
+        return self.client.get(path, params)
+
+    async def assertSameResponse(self, view, user, path, params=None):
+        expected = await sync_to_async(self.sync_get)(user, path, params)
+        response = await view(self.async_get(user, path, params))
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        return response
+
+    async def test_menu_items(self):
+        await self.assertSameResponse(async_views.menu_items, self.customer, reverse('menu-items'))
+        await self.assertSameResponse(async_views.menu_items, self.customer, reverse('menu-items'),
+                                      {'ordering': '-price', 'page_size': 2})
+        await self.assertSameResponse(async_views.menu_items, self.customer, reverse('menu-items'),
+                                      {'category_name': 'Nope'})
+        await self.assertSameResponse(async_views.menu_items, self.customer, reverse('menu-items'), {'since': ''})
+
+    async def test_categories(self):
+        await self.assertSameResponse(async_views.categories, self.customer, reverse('categories'))
+
+    async def test_order_lists(self):
+        await self.assertSameResponse(async_views.customer_orders, self.customer, reverse('customer-orders'),
+                                      {'page_size': 2})
+        await self.assertSameResponse(async_views.delivery_crew_orders, self.driver, reverse('delivery-crew-orders'))
+        await self.assertSameResponse(async_views.delivery_crew_orders, self.driver, reverse('delivery-crew-orders'),
+                                      {'since': '', 'page_size': 2})
+
+    async def test_permission_denied(self):
+        await self.assertSameResponse(async_views.delivery_crew_orders, self.customer, reverse('delivery-crew-orders'))
+        response = await async_views.menu_items(self.async_get(None, reverse('menu-items')))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+    async def test_invalid_cursor(self):
+        response = await self.assertSameResponse(async_views.customer_orders, self.customer,
+                                                 reverse('customer-orders'), {'cursor': '!!'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_not_modified(self):
+        response = await async_views.categories(self.async_get(self.customer, reverse('categories')))
+        etag = response['ETag']
+        response = await async_views.categories(
+            self.async_get(self.customer, reverse('categories'), **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_middleware_counts_async_queries(self):
+        middleware = QueryTimingMiddleware(async_views.customer_orders)
+        response = await middleware(self.async_get(self.customer, reverse('customer-orders')))
+        self.assertEqual(response.status_code, 200)
+        # blacklist snapshot, user, roles and the order page on a cold cache
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+
+
+class OrderEventTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manager = self.make_user('mia', self.manager_group, is_staff=True)
+        self.customer = self.make_user('carol', self.customer_group)
+        self.driver = self.make_user('dave', self.delivery_group)
+        self.other_driver = self.make_user('dan', self.delivery_group)
+        self.order = Order.objects.create(user=self.customer, delivery_crew=self.other_driver, total='5.00',
+                                          date='2025-01-01')
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscriptions(self, *users):
+        subscriptions = {user.username: subscribe(user.pk, self.loop) for user in users}
+        for subscription in subscriptions.values():
+            self.addCleanup(subscription.close)
+        return subscriptions
+
+    def received(self, subscription):
+        # run the callbacks delivery scheduled on the loop
+        self.loop.run_until_complete(asyncio.sleep(0))
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        return [(event['event'], event['data']['delivery_crew'], event['data']['status']) for event in events]
+
+    def test_assignment_reaches_customer_and_both_drivers(self):
+        subscriptions = self.subscriptions(self.customer, self.driver, self.other_driver, self.manager)
+        self.login(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('assign-delivery-crew'),
+                                        {'order_username': 'carol', 'delivery_crew_username': 'dave'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        for username in ('carol', 'dave', 'dan'):
+            self.assertEqual(self.received(subscriptions[username]), [(ORDER_ASSIGNED, 'dave', False)], username)
+        self.assertEqual(self.received(subscriptions['mia']), [])
+
+    def test_dispatch_reaches_customer_and_driver(self):
+        waiting = Order.objects.create(user=self.customer, total='5.00', date='2025-01-02')
+        subscriptions = self.subscriptions(self.customer, self.driver, self.other_driver)
+        self.login(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('dispatch-orders'), {'order_ids': [waiting.id]}, format='json')
+        # dan already has an open order
+        self.assertEqual(response.data['assignments'], [{'order_id': waiting.id, 'delivery_crew': 'dave'}])
+        self.assertEqual(self.received(subscriptions['carol']), [(ORDER_ASSIGNED, 'dave', False)])
+        self.assertEqual(self.received(subscriptions['dave']), [(ORDER_ASSIGNED, 'dave', False)])
+        self.assertEqual(self.received(subscriptions['dan']), [])
+
+    def test_status_change(self):
+        subscriptions = self.subscriptions(self.customer, self.other_driver, self.driver)
+        self.login(self.other_driver)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('delivery-crew-orders', args=[self.order.id]), {'status': True},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.received(subscriptions['carol']), [('order.status', 'dan', True)])
+        self.assertEqual(self.received(subscriptions['dan']), [('order.status', 'dan', True)])
+        self.assertEqual(self.received(subscriptions['dave']), [])
+
+    def test_events_wait_for_commit(self):
+        subscriptions = self.subscriptions(self.customer)
+        self.login(self.other_driver)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(reverse('delivery-crew-orders', args=[self.order.id]), {'status': True}, format='json')
+        self.assertEqual(self.received(subscriptions['carol']), [])
+        self.assertEqual(len(callbacks), 1)
+
+    def test_full_queue_ends_the_stream(self):
+        event = order_event(ORDER_ASSIGNED, self.order)
+        with override_settings(ORDER_EVENTS={'KEEPALIVE': 15, 'QUEUE_SIZE': 2}):
+            subscription = self.subscriptions(self.customer)['carol']
+        for _ in range(3):
+            publish(event)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(subscription.overflowed)
+
+    def test_broker_failure_does_not_fail_the_write(self):
+        self.login(self.other_driver)
+        broker = mock.Mock(**{'publish.side_effect': sqlite3.OperationalError('database is locked')})
+        with mock.patch('LittleLemonAPI.events.get_broker', return_value=broker), \
+                self.assertLogs('LittleLemonAPI.events', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('delivery-crew-orders', args=[self.order.id]), {'status': True},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        broker.publish.assert_called_once()
+        self.assertTrue(Order.objects.get(pk=self.order.pk).status)
+
+    def test_sqlite_broker_poll_survives_errors(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            broker = SQLiteBroker(os.path.join(tmp, 'events.sqlite3'), poll_interval=0.01)
+            delivered = threading.Event()
+
+            def dispatch(event):
+                if event['id'] == 1:
+                    raise ValueError('bad event')
+                delivered.set()
+
+            with self.assertLogs('LittleLemonAPI.events', 'ERROR'):
+                broker.start(dispatch)
+                broker.publish({'event': ORDER_ASSIGNED, 'id': 1, 'recipients': [], 'data': {}})
+                broker.publish({'event': ORDER_ASSIGNED, 'id': 2, 'recipients': [], 'data': {}})
+                self.assertTrue(delivered.wait(5))
+                broker.stop()
+
+    def test_sqlite_broker_delivers_across_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            broker = SQLiteBroker(os.path.join(tmp, 'events.sqlite3'), poll_interval=0.01)
+            delivered = threading.Event()
+            events = []
+            broker.start(lambda event: (events.append(event), delivered.set()))
+            # another worker publishing through its own broker and file connection
+            SQLiteBroker(broker.path).publish(order_event(ORDER_ASSIGNED, self.order))
+            self.assertTrue(delivered.wait(5))
+            broker.stop()
+        self.assertEqual(events[0]['recipients'], sorted([self.customer.pk, self.other_driver.pk]))
+        self.assertEqual(events[0]['data']['delivery_crew'], 'dan')
+
+
+class OrderEventStreamTests(BarAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('carol', self.customer_group)
+        self.driver = self.make_user('dave', self.delivery_group)
+        self.order = Order.objects.create(user=self.customer, delivery_crew=self.driver, total='5.00', date='2025-01-01')
+        self.other = Order.objects.create(user=self.make_user('erin', self.customer_group), total='7.00',
+                                          date='2025-01-01')
+        self.factory = AsyncRequestFactory()
+
+    def request(self, user):
+        return self.factory.get(reverse('order-events'), headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'})
+
+    @override_settings(ORDER_EVENTS={'KEEPALIVE': 0.05, 'QUEUE_SIZE': 10})
+    async def test_stream_only_carries_own_orders(self):
+        response = await async_views.order_events(self.request(self.customer))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+
+        other_event = await sync_to_async(order_event)(ORDER_ASSIGNED, self.other)
+        own_event = await sync_to_async(order_event)(ORDER_ASSIGNED, self.order)
+        publish(other_event)
+        publish(own_event)
+        message = await anext(chunks)
+        self.assertEqual(message, sse_message(own_event))
+        self.assertTrue(message.startswith(f'id: {self.order.updated}\nevent: order.assigned\ndata: {{'.encode()))
+        self.assertEqual(json.loads(message.split(b'data: ')[1])['user'], 'carol')
+        # nothing else for carol: a keep-alive comment
+        self.assertEqual(await anext(chunks), b': keep-alive\n\n')
+
+        await chunks.aclose()
+        # Django closes the response once the client is gone
+        response.close()
+        self.assertEqual(len(hub), 0)
+
+    async def test_needs_authentication_and_asgi(self):
+        response = await async_views.order_events(self.factory.get(reverse('order-events')))
+        self.assertEqual(response.status_code, 401)
+        await sync_to_async(self.login)(self.customer)
+        response = await sync_to_async(self.client.get)(reverse('order-events'))
+        self.assertEqual(response.status_code, 501)
+
+
+class SeedDataCommandTests(TestCase):
+
+    def seed(self, *extra):
+        out = io.StringIO()
+        call_command('seed_data', '--categories=3', '--menu-items=20', '--customers=10', '--managers=2',
+                     '--delivery=3', '--carts=4', '--orders=30', *extra, verbosity=0, stdout=out)
+        self.assertEqual(out.getvalue(), '')
+        return list(MenuItem.objects.order_by('title').values_list('title', 'price', 'category__title'))
+
+    def test_seed_is_deterministic(self):
+        first = self.seed()
+        self.assertEqual(len(first), 20)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(User.objects.filter(groups__name=DELIVERY).count(), 3)
+        self.assertEqual(self.seed('--clear'), first)
+        self.assertEqual(Order.objects.count(), 30)
+
+    def test_refuses_to_seed_twice(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+class TokenBucketThrottleTests(BarAPITestCase):
+
+    def test_bucket_allows_burst_then_refills(self):
+        store = LocMemBucketStore()
+        results = [store.consume('k', 3, 1.0, 100.0)[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        allowed, wait = store.consume('k', 3, 1.0, 100.0)
+        self.assertAlmostEqual(wait, 1.0)
+        self.assertTrue(store.consume('k', 3, 1.0, 101.0)[0])
+
+    def test_locmem_store_is_bounded(self):
+        store = LocMemBucketStore(max_entries=2)
+        for key in 'abc':
+            store.consume(key, 1, 1.0, 0.0)
+        self.assertEqual(list(store._buckets), ['b', 'c'])
+
+    def test_sqlite_store_is_shared(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'throttle.sqlite3')
+            first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+            self.assertTrue(first.consume('k', 2, 1.0, 50.0)[0])
+            self.assertTrue(second.consume('k', 2, 1.0, 50.0)[0])
+            self.assertFalse(first.consume('k', 2, 1.0, 50.0)[0])
+
+    def test_checkout_scope(self):
+        customer = self.make_user('carol', self.customer_group)
+        self.login(customer)
+        with mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'checkout': '2/minute'}):
+            codes = [self.client.post(reverse('customer-orders')).status_code for _ in range(3)]
+            # other scopes keep their own bucket
+            self.assertEqual(self.client.get(reverse('customer-orders')).status_code, 204)
+        self.assertEqual(codes, [400, 400, 429])
@@ -0,0 +1,202 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+DEFAULT_STORE = {
+    'BACKEND': 'LittleLemonAPI.throttling.LocMemBucketStore',
+    'OPTIONS': {},
+}
+
+
+def parse_rate(rate):
+    """ '100/minute' -> (capacity, tokens per second) """
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def take_token(tokens, updated, now, capacity, refill_rate):
+    """ refill a bucket up to ``now`` and try to take one token
+
+    Returns ``(allowed, tokens, wait)`` where ``wait`` is the number of
+    seconds until the next token when the request is not allowed.
+    """
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / refill_rate
+
+
+class LocMemBucketStore:
+    """Token buckets in process memory, for a single worker
+
+    Each key holds two numbers, and the least recently used keys are
+    dropped beyond ``max_entries`` so memory stays bounded.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (None, now))
+            allowed, tokens, wait = take_token(tokens, updated, now, capacity, refill_rate)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker on the host"""
+
+    def __init__(self, path, timeout=1.0):
+        self.path = str(path)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS throttle_bucket '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID'
+            )
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key, capacity, refill_rate, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM throttle_bucket WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (None, now)
+            allowed, tokens, wait = take_token(tokens, updated, now, capacity, refill_rate)
+            conn.execute(
+                'INSERT INTO throttle_bucket (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, tokens, now),
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, wait
+
+    def clear(self):
+        self._connection().execute('DELETE FROM throttle_bucket')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """ the store configured by ``settings.THROTTLE_STORE``, built once """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'THROTTLE_STORE', DEFAULT_STORE)
+                try:
+                    store_class = import_string(config['BACKEND'])
+                except ImportError as e:
+                    raise ImproperlyConfigured(f"Invalid THROTTLE_STORE backend: {e}")
+                _store = store_class(**config.get('OPTIONS', {}))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_bucket_store(*, setting, **kwargs):
+    global _store
+    if setting == 'THROTTLE_STORE':
+        _store = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle with a constant-size token bucket per client and scope
+
+    Rates come from ``DEFAULT_THROTTLE_RATES[scope]`` like DRF's
+    ``SimpleRateThrottle``; the number is the burst size and the bucket
+    refills evenly over the period.
+    """
+    scope = None
+    _parsed_rates = {}
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return f'{self.scope}:{ident}'
+
+    def get_rate(self):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if rate is None:
+            return None
+        parsed = self._parsed_rates.get(rate)
+        if parsed is None:
+            parsed = self._parsed_rates[rate] = parse_rate(rate)
+        return parsed
+
+    def allow_request(self, request, view):
+        rate = self.get_rate()
+        if rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        capacity, refill_rate = rate
+        allowed, self._wait = get_bucket_store().consume(key, capacity, refill_rate, time.time())
+        return allowed
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    scope = 'user'
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None  # only throttle unauthenticated requests
+        return super().get_cache_key(request, view)
+
+
+class CheckoutThrottle(TokenBucketThrottle):
+    scope = 'checkout'
+
+
+class CartThrottle(TokenBucketThrottle):
+    scope = 'cart'
+
+
+class MenuThrottle(TokenBucketThrottle):
+    scope = 'menu'
@@ -1,14 +1,25 @@
+from django.conf import settings
 from django.urls import path
+
+from . import async_views
 from .views import (ManagerGroupsView, 
                     menuItemsView, 
+                    menuSearchView,
+                    catalogImportView,
+                    catalogExportView,
                     CategoryView, 
                     # ManagerGroupDeliveryCrewView, 
                     CartItemView,
                     assignDeliveryCrewToOrderView,
+                    dispatchOrdersView,
                     customerOrderListView,
                     deliveryCrewCheckOrUpdateOrderStatusView,
                     managerUpdateMenuItemView,
-                    placeOrderView)
+                    placeOrderView,
+                    managerSalesReportView,
+                    managerTopSellersView,
+                    managerOrderExportView,
+                    dispatch_by_method)
 urlpatterns = [
     path('groups/manager/users', ManagerGroupsView.as_view({
         'get': 'get',
@@ -16,22 +27,48 @@ urlpatterns = [
         'delete': 'delete',
     }), name='manager-users'),
     path('menu-items', menuItemsView, name='menu-items'),
+    path('menu-items/search', menuSearchView, name='menu-search'),
+    path('menu-items/import', catalogImportView, {'kind': 'menu-items'}, name='menu-items-import'),
+    path('menu-items/export', catalogExportView, {'kind': 'menu-items'}, name='menu-items-export'),
     path('categories', CategoryView.as_view({
         'get': 'list', 
         'post': 'create',
         }), name='categories'),
+    path('categories/import', catalogImportView, {'kind': 'categories'}, name='categories-import'),
+    path('categories/export', catalogExportView, {'kind': 'categories'}, name='categories-export'),
     # path('groups/manager/delivery', ManagerGroupDeliveryCrewView.as_view({ 
     #     'post': 'post',
     # }), name='manager-delivery-crew'),
     path('cart/menu-items', CartItemView.as_view({
         'get': 'get',
+        'post': 'post',
     }), name='cart-management'),
-    path('cart/menu-items', CartItemView.as_view({'post': 'post'}), name='add-cart-item'),
+    path('cart/menu-items/batch', CartItemView.as_view({
+        'post': 'batch',
+    }), name='cart-batch'),
     path('assign-delivery-crew', assignDeliveryCrewToOrderView, name='assign-delivery-crew'),
-    path('cart/orders', customerOrderListView, name='customer-orders'),
-    path('cart/orders', placeOrderView, name='place-order'),
+    path('cart/orders', dispatch_by_method(get=customerOrderListView, post=placeOrderView), name='customer-orders'),
     path('orders', deliveryCrewCheckOrUpdateOrderStatusView, name='delivery-crew-orders'),
+    path('orders/dispatch', dispatchOrdersView, name='dispatch-orders'),
+    path('orders/export', managerOrderExportView, name='orders-export'),
+    path('orders/events', async_views.order_events, name='order-events'),
     path('orders/<int:order_id>', deliveryCrewCheckOrUpdateOrderStatusView, name='delivery-crew-orders'),
     path('menu-items/<int:menuitem_id>', managerUpdateMenuItemView, name='manager-update-menu-item'),
+    path('reports/sales', managerSalesReportView, name='sales-report'),
+    path('reports/top-sellers', managerTopSellersView, name='top-sellers'),
+]
 
-]
\ No newline at end of file
+if settings.ASYNC_READ_ENDPOINTS:
+    # under ASGI the read endpoints are served by async views at the same
+    # paths and names; writes still go through the DRF views
+    async_routes = {
+        'menu-items': async_views.menu_items,
+        'categories': async_views.categories,
+        'cart/orders': async_views.customer_orders,
+        'orders': async_views.delivery_crew_orders,
+    }
+    urlpatterns = [
+        path(str(pattern.pattern), async_routes[str(pattern.pattern)], name=pattern.name)
+        if str(pattern.pattern) in async_routes else pattern
+        for pattern in urlpatterns
+    ]
@@ -1,43 +1,69 @@
 # from django.shortcuts import render
-from decimal import Decimal
-from django.contrib.auth.models import User, Group
+import datetime
+import functools
 
-from .serializers import ManagerSerializer, MenuItemSerializer, CategorySerializer, CartSerializer, OrderSerializer
-from .models import MenuItem, Category, Cart, Order, OrderItem
+from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from .serializers import (ManagerSerializer, MenuItemSerializer, CategorySerializer, CartSerializer, OrderSerializer,
+                          SalesSummarySerializer, TopSellerSerializer)
+from .models import MenuItem, Category, CatalogChange, Order, OrderItem
+from .permissions import IsSuperUser, IsCustomer, IsDeliveryCrew, IsManager
+from .roles import CUSTOMER, MANAGER, has_role
+from .throttling import (AnonTokenBucketThrottle, UserTokenBucketThrottle,
+                         CartThrottle, CheckoutThrottle, MenuThrottle)
+from .catalog import catalog_etag, category_ids, etag_matches, get_catalog_version, not_modified
+from .catalog_io import CATALOG_IMPORTS, EXPORT_CONTENT_TYPES, IMPORT_FORMATS, export_rows
+from .cart import MAX_BATCH_ITEMS, MAX_LINE_QUANTITY, CartBusy, CartLineTooLarge, UnknownMenuItems, get_cart_store
+from .checkout import CheckoutError, EmptyCartError
+from .dispatch import MAX_DISPATCH, NoDeliveryCrew, dispatch_orders
+from .events import ORDER_ASSIGNED, ORDER_STATUS, order_event, publish
+from .idempotency import idempotent
+from .metrics import query_budget
+from .order_export import export_orders
+from .pagination import MenuItemsPagination, OrdersPagination
+from .reports import TOP_SELLER_METRICS, sales_summary, top_sellers
+from .search import MAX_SEARCH_RESULTS, search_menu_items
+from .streaming import stream_format, stream_response, streaming_response
+from .sync import catalog_changes, decode_sync_token, delivery_changes, encode_sync_token, sync_page_size
 
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import generics, viewsets
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
-from rest_framework.permissions import IsAuthenticated, BasePermission, IsAdminUser
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 # Create your views here.
 
+def dispatch_by_method(**views):
+    """ route one path to a different view per HTTP method
+
+    The first view also handles methods that are not listed so it can answer
+    with its own 405 response.
+    """
+    default = next(iter(views.values()))
+
+    @csrf_exempt
+    def view(request, *args, **kwargs):
+        return views.get(request.method.lower(), default)(request, *args, **kwargs)
+    return view
+
 def get_cart_by_user(request, user):
     user = request.user
-    cart = Cart.objects.all()
-    if user.groups.filter(name='Customer').exists():
-        user_cart = cart.filter(user=user)
+    if has_role(user, CUSTOMER):
+        user_cart = get_cart_store().lines(user)
     else:
         return Response({"error": "User is not customer"}, status=status.HTTP_401_UNAUTHORIZED)
     # if no username return all carts
-    if user_cart.count() == 0:
+    if not user_cart:
         return Response({"message": f"Cart of {user.username} is empty"}, status=status.HTTP_204_NO_CONTENT)
     serializer = CartSerializer(user_cart, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class IsSuperUser(BasePermission):
-    def has_permission(self, request, view):
-        return request.user and request.user.is_superuser
-
-class IsCustomer(BasePermission):
-    def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='Customer').exists()
-
 class ManagerGroupsView(viewsets.ModelViewSet):
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonTokenBucketThrottle, UserTokenBucketThrottle]
 
     # request staff for GET, staff or superuser for the rest
     def get_permissions(self):
@@ -63,7 +89,7 @@ class ManagerGroupsView(viewsets.ModelViewSet):
                 return Response({"error": "Group does not exist"}, status=status.HTTP_204_NO_CONTENT)
             
             one_group  = Group.objects.get(name=group_name) # get the group object
-            groupMembers = User.objects.filter(groups=one_group) # get all users in that group
+            groupMembers = ManagerSerializer.setup_eager_loading(User.objects.filter(groups=one_group)) # get all users in that group
 
             if len(groupMembers) == 0:
                 return Response({"message": "No group members found"}, status=status.HTTP_204_NO_CONTENT)
@@ -102,54 +128,108 @@ class ManagerGroupsView(viewsets.ModelViewSet):
         return Response({"message": f"User {username} removed from Manager group"}, status=status.HTTP_200_OK)
 # end ManagerGroupsView class
 
-class MenuItemsPagination(PageNumberPagination):
-    page_size = 2
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
+def menu_items_query(params, category_id=None):
+    """ build the menu item list query from the request parameters
+
+    ``category_id`` is the id ``category_name`` resolves to, looked up by the
+    caller in ``category_ids``. Returns ``(queryset, ordering,
+    error_message)``; shared by the sync and async menu views.
+    """
+    menu_items = MenuItemSerializer.setup_eager_loading(MenuItem.objects.all())
+    ordering = ('id',)
+    # ordering by price
+    if params.get('ordering'):
+        ordering_param = params.get('ordering')
+        if ordering_param not in ['price', '-price']:
+            return None, None, "Invalid ordering parameter. Use 'price' or '-price'."
+        # id breaks ties between equal prices so cursors stay stable
+        ordering = (ordering_param, '-id' if ordering_param.startswith('-') else 'id')
+
+    # query by category: an indexed category_id lookup, no join
+    if params.get('category_name'):
+        menu_items = menu_items.filter(category_id=category_id)
+    return menu_items, ordering, None
+
+def unknown_category(category_name):
+    return {"message": f"category: '{category_name}' does not exist"}
+
+def list_menu_items(request, version=None):
+    """ list menu items honouring ordering, category_name and cursor pagination
+
+    With ``stream=json|ndjson`` every matching item is streamed instead.
+    ``version`` is the catalog version the caller already read, if any.
+    """
+    category_name = request.query_params.get('category_name')
+    category_id = category_ids.get(category_name, version) if category_name else None
+    menu_items, ordering, error = menu_items_query(request.query_params, category_id)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    if category_name and category_id is None:
+        return Response(unknown_category(category_name), status=status.HTTP_404_NOT_FOUND)
+    fmt, error = stream_format(request.query_params)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    if fmt:
+        return stream_response(request, menu_items.order_by(*ordering), MenuItemSerializer, fmt)
+
+    paginator = MenuItemsPagination()
+    page = paginator.paginate_queryset(menu_items, request, ordering=ordering)
+    serializer = MenuItemSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+def menu_sync_data(params):
+    """ body of an incremental ``GET /menu-items?since=<sync token>`` poll """
+    since = decode_sync_token(params.get('since'))
+    changes, last_number = catalog_changes(since)
+    menu_items = MenuItemSerializer.setup_eager_loading(MenuItem.objects.order_by('id'))
+    categories = Category.objects.order_by('id')
+    if changes is None:
+        return {
+            'snapshot': True,
+            'menu_items': MenuItemSerializer(menu_items, many=True).data,
+            'categories': CategorySerializer(categories, many=True).data,
+            'deleted': {'menu_items': [], 'categories': []},
+            'sync_token': encode_sync_token(last_number),
+        }
+
+    data, deleted_ids = {'snapshot': False}, {}
+    for key, kind, rows, serializer_class in (
+        ('menu_items', CatalogChange.MENUITEM, menu_items, MenuItemSerializer),
+        ('categories', CatalogChange.CATEGORY, categories, CategorySerializer),
+    ):
+        changed, deleted = changes.get(kind, ((), ()))
+        rows = list(rows.filter(pk__in=changed)) if changed else []
+        # deleted after the log was read: the next poll reports it too
+        found = {row.pk for row in rows}
+        data[key] = serializer_class(rows, many=True).data
+        deleted_ids[key] = sorted({*deleted, *(pk for pk in changed if pk not in found)})
+    data['deleted'] = deleted_ids
+    data['sync_token'] = encode_sync_token(last_number)
+    return data
+
+@query_budget(6)
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([MenuThrottle])
 def menuItemsView(request):
     if request.method == 'GET':
-        if not request.user.groups.filter(name__in=['Customer']).exists():
+        if not has_role(request.user, CUSTOMER):
             return Response({"error": "Only customers can view menu items"}, status=status.HTTP_403_FORBIDDEN)
-        
-        menu_items = MenuItem.objects.all()
-        # ordering by price
-        if request.query_params.get('ordering'):
-            ordering_param = request.query_params.get('ordering')
-            if ordering_param not in ['price', '-price']:
-                return Response({"error": "Invalid ordering parameter. Use 'price' or '-price'."}, status=status.HTTP_400_BAD_REQUEST)
-            try:
-                menu_items = menu_items.order_by(ordering_param)
-            except Exception as e:
-                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-        paginator = MenuItemsPagination()
-        # query by category
-        if request.query_params.get('category_name'):
-            category_name = request.query_params.get('category_name')
-            menu_items = menu_items.filter(category__title__iexact=category_name)
-            if not menu_items:
-                return Response({"message": f"category: '{category_name}' does not exist"}, status=status.HTTP_404_NOT_FOUND)
-            serializer = MenuItemSerializer(menu_items, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        # Check for page_size and page query parameters
-        if request.query_params.get('page_size'):
-            paginator.page_size = request.query_params.get('page_size')
-        if request.query_params.get('page'):
-            page = paginator.paginate_queryset(menu_items, request)
-            if page is not None:
-                serializer = MenuItemSerializer(page, many=True)
-                return paginator.get_paginated_response(serializer.data)
-        else:
-            serializer = MenuItemSerializer(menu_items, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        if 'since' in request.query_params:
+            return Response(menu_sync_data(request.query_params), status=status.HTTP_200_OK)
+
+        version = get_catalog_version()
+        etag = catalog_etag(request, 'menu-items', version=version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = list_menu_items(request, version)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
         
     elif request.method == 'POST':
         user = request.user
-        if not user.groups.filter(name='Manager').exists():
+        if not has_role(user, MANAGER):
             return Response({"error": "Only managers can create menu items"}, status=status.HTTP_403_FORBIDDEN)
         serializer = MenuItemSerializer(data=request.data)
         if serializer.is_valid():
@@ -161,19 +241,51 @@ def menuItemsView(request):
     return Response({"error": "Invalid data"}, status=status.HTTP_400_BAD_REQUEST)
 # end MenuItemsView
 
+@query_budget(4)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([MenuThrottle])
+def menuSearchView(request):
+    """ ranked prefix search over menu item and category titles """
+    if not has_role(request.user, CUSTOMER):
+        return Response({"error": "Only customers can view menu items"}, status=status.HTTP_403_FORBIDDEN)
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({"error": "q parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    etag = catalog_etag(request, 'menu-search', params=('q', 'limit'))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    menu_items = search_menu_items(query, limit, MenuItemSerializer.setup_eager_loading(MenuItem.objects.all()))
+    serializer = MenuItemSerializer(menu_items, many=True)
+    response = Response({"query": query, "results": serializer.data}, status=status.HTTP_200_OK)
+    response['ETag'] = etag
+    return response
+# end menuSearchView
+
 class CategoryView(viewsets.ModelViewSet):
     """List all categories or create a new category"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [MenuThrottle]
+    query_budget = 4
 
     def list(self, request, *args, **kwargs):
+        etag = catalog_etag(request, 'categories', params=())
+        if etag_matches(request, etag):
+            return not_modified(etag)
         categories = self.get_queryset()
         if not categories:
             return Response({"error": "Category list is empty"}, status=status.HTTP_404_NOT_FOUND)
         serializer = self.get_serializer(categories, many=True)
-        return Response(serializer.data)
+        response = Response(serializer.data)
+        response['ETag'] = etag
+        return response
 
     def create(self, request, *args, **kwargs):
         serializer = CategorySerializer(data=request.data)
@@ -184,9 +296,43 @@ class CategoryView(viewsets.ModelViewSet):
 
 # end CategoryView
 
+# managers can load and dump the catalog in bulk
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsManager])
+@throttle_classes([UserTokenBucketThrottle])
+def catalogImportView(request, kind):
+    """ create or update categories / menu items from a CSV or NDJSON body """
+    content_type = request.content_type.split(';')[0].strip()
+    fmt = IMPORT_FORMATS.get(content_type)
+    if fmt is None:
+        return Response({"error": f"Content-Type must be one of {', '.join(IMPORT_FORMATS)}"},
+                        status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    if request.stream is None:
+        return Response({"error": "The upload is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        report = CATALOG_IMPORTS[kind]().run(request.stream, fmt)
+    except UnicodeDecodeError:
+        return Response({"error": "The upload is not UTF-8"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsManager])
+@throttle_classes([UserTokenBucketThrottle])
+def catalogExportView(request, kind):
+    """ stream every category / menu item as CSV or NDJSON (``output=``) """
+    fmt = request.query_params.get('output', 'ndjson')
+    if fmt not in EXPORT_CONTENT_TYPES:
+        return Response({"error": f"output must be one of {', '.join(EXPORT_CONTENT_TYPES)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    response = streaming_response(request, export_rows(kind, fmt), EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+# end catalog import / export
+
 class ManagerGroupDeliveryCrewView(viewsets.ModelViewSet):
     """Manger can add users to Delivery crew group"""
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonTokenBucketThrottle, UserTokenBucketThrottle]
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -211,131 +357,128 @@ class ManagerGroupDeliveryCrewView(viewsets.ModelViewSet):
     
 # end ManagerGroupDeliveryCrewView class
 
+def _integer(value):
+    # int() would truncate 1.7 to 1
+    if isinstance(value, float) and not value.is_integer():
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_cart_item(menuitem_id, quantity):
+    """ ``(menuitem_id, quantity)`` as ints, ``None`` for an invalid value
+
+    A quantity is an integer from 1 to ``MAX_LINE_QUANTITY``.
+    """
+    menuitem_id = _integer(menuitem_id)
+    quantity = _integer(quantity)
+    if quantity is not None and not 1 <= quantity <= MAX_LINE_QUANTITY:
+        quantity = None
+    return menuitem_id, quantity
+
+
 class CartItemView(viewsets.ModelViewSet):
     # only customers can create cart
     permission_classes = [IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [CartThrottle]
+    query_budget = 8
 
     # anyone can get cart list
     def get(self, request):
         user = request.user
         return get_cart_by_user(request, user)
 
+    @idempotent
     def post(self, request):
-        username = request.data.get('username')
-        
-        # Retrieve the user by username
-        try:
-            user = request.user
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        user = request.user
 
         # Get data from request
         menuitem_id = request.data.get('menuitem_id') 
         quantity = request.data.get('quantity')
-        print(f'menuitem_id: {menuitem_id}, quantity: {quantity}')
         # Validate the inputs
         if not menuitem_id or not quantity:
             return Response({"error": "menuitem_id and quantity are required"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if MenuItem.objects.filter(id=menuitem_id).exists() is False:
-            return Response({"error": "Menu item does not exist"}, status=status.HTTP_404_NOT_FOUND)
 
-        # if cart item already exists, update it
-        if Cart.objects.filter(user=user, menuitem__id=menuitem_id).exists():
-            cart_item = Cart.objects.get(user=user, menuitem__id=menuitem_id)
-            cart_item.quantity += int(quantity)
-            cart_item.price = cart_item.unit_price * cart_item.quantity
-            cart_item.save()
-            serializer = CartSerializer(cart_item)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        
-        # if not exists, create new cart item
-        try:
-            # Get the MenuItem object
-            menuitem = MenuItem.objects.get(id=menuitem_id)
-            unit_price = menuitem.price
-            price = unit_price * int(quantity)
-
-            # Get or create the cart item
-            cart_item = Cart.objects.create(
-                user=user,
-                menuitem=menuitem,
-                quantity=quantity,
-                unit_price=unit_price,
-                price=price,
-            )
-
-            cart_item.save()
-            serializer = CartSerializer(cart_item)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        menuitem_id, quantity = parse_cart_item(menuitem_id, quantity)
+        if quantity is None:
+            return Response({"error": f"quantity must be an integer from 1 to {MAX_LINE_QUANTITY}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if menuitem_id is None:
+            return Response({"error": "menuitem_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            [(cart_item, created)] = get_cart_store().add(user, {menuitem_id: quantity})
         except MenuItem.DoesNotExist:
-            return Response({"error": "Failed to create cart item"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": "Menu item does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        except CartLineTooLarge as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except CartBusy as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+
+        serializer = CartSerializer(cart_item)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    # add or update many menu items in one request
+    @idempotent
+    def batch(self, request):
+        items = request.data.get('items') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response({"error": "items must be a non-empty list of {menuitem_id, quantity}"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_BATCH_ITEMS:
+            return Response({"error": f"at most {MAX_BATCH_ITEMS} items per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        quantities = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                return Response({"error": f"items[{index}] must be an object"}, status=status.HTTP_400_BAD_REQUEST)
+            menuitem_id, quantity = parse_cart_item(item.get('menuitem_id'), item.get('quantity'))
+            if menuitem_id is None or quantity is None:
+                return Response({"error": f"items[{index}] needs an integer menuitem_id "
+                                          f"and an integer quantity from 1 to {MAX_LINE_QUANTITY}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            quantities[menuitem_id] = quantities.get(menuitem_id, 0) + quantity
+
+        try:
+            result = get_cart_store().add(request.user, quantities)
+        except UnknownMenuItems as e:
+            return Response({"error": "Menu items do not exist", "menuitem_ids": e.menuitem_ids}, status=status.HTTP_404_NOT_FOUND)
+        except CartLineTooLarge as e:
+            return Response({"error": str(e), "menuitem_ids": e.menuitem_ids}, status=status.HTTP_400_BAD_REQUEST)
+        except CartBusy as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+
+        serializer = CartSerializer([cart_item for cart_item, created in result], many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 # end CartItemView class
 
 # customer can create order
+@query_budget(12)
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
-@throttle_classes([AnonRateThrottle, UserRateThrottle])
+@permission_classes([IsAuthenticated, IsCustomer])
+@throttle_classes([CheckoutThrottle])
+@idempotent
 def placeOrderView(request):
     if request.method == 'POST':
         user = request.user
-        if not user.groups.filter(name='Customer').exists():
-            return Response({"error": "Only customers can view their orders"}, status=status.HTTP_403_FORBIDDEN)
-        
-        # create new order for the user
-        from django.utils import timezone
         try:
-            new_order = Order.objects.create(
-                user=user,
-                delivery_crew=None,
-                status = False,
-                total=0,
-                date = timezone.now().date()
-            )
-
-            if new_order is None:
-                return Response({"error": "Failed to create order"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            user_cart_list = get_cart_by_user(request, user).data
-            print(f'user_cart_list: {user_cart_list}')
-            for cart_item in user_cart_list:
-                menuite_id = cart_item['menuitem']['id']
-                quantity = cart_item['quantity']
-                unit_price = cart_item['unit_price']
-                price = cart_item['price']
-
-                price = Decimal(price)
-                unit_price = Decimal(unit_price)
-
-                order_item = OrderItem.objects.create(
-                    order = new_order,
-                    menuitem = MenuItem.objects.get(id=menuite_id),
-                    quantity = quantity,
-                    unit_price = unit_price,
-                    price = price
-                )
-                if order_item is None:
-                    return Response({"error": "Failed to create order item"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                
-                order_item.save()
-                new_order.total += price
-
-            # endfor cart_item
-            new_order.save()
-
-            return Response({"message": f"Order for '{user.username}' created successfully with id '{new_order.id}'"}, status=status.HTTP_201_CREATED)
-        #TODO clean cart item after payment success
+            new_order = get_cart_store().place_order(user)
+        except EmptyCartError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (CheckoutError, CartBusy) as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({"error": f"Failed to create final order: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({"message": f"Order for '{user.username}' created successfully with id '{new_order.id}'"}, status=status.HTTP_201_CREATED)
 # end OrderView function
 
 # manager can assign order to delivery crew
 
 @api_view(['POST'])
 @permission_classes([IsAdminUser | IsSuperUser])
-@throttle_classes([AnonRateThrottle, UserRateThrottle])
+@throttle_classes([AnonTokenBucketThrottle, UserTokenBucketThrottle])
 def assignDeliveryCrewToOrderView(request):
     if request.method == 'POST':
         username = request.data.get('order_username')
@@ -354,56 +497,114 @@ def assignDeliveryCrewToOrderView(request):
         if not delivery_crew_user:
             return Response({"error": f"Delivery crew user'{delivery_crew_name}' does not exist"}, status=status.HTTP_404_NOT_FOUND)
         
+        previous_crew_id = latest_order.delivery_crew_id
+        latest_order.user = user
         latest_order.delivery_crew = delivery_crew_user
         latest_order.save()
+        # the driver losing the order hears about it too
+        event = order_event(ORDER_ASSIGNED, latest_order, previous_crew_id)
+        transaction.on_commit(functools.partial(publish, event))
         return Response({"message": f"Order '{latest_order.id}' of user '{user.username}' assigned to delivery crew '{delivery_crew_name}'"}, status=status.HTTP_200_OK)
 # end AssignOrderView function
 
 
+# manager can dispatch all waiting orders at once
+@query_budget(10)
+@api_view(['POST'])
+@permission_classes([IsAdminUser | IsManager])
+@throttle_classes([UserTokenBucketThrottle])
+def dispatchOrdersView(request):
+    """ assign unassigned pending orders across the delivery crew, balancing open orders """
+    limit = request.data.get('limit', MAX_DISPATCH)
+    order_ids = request.data.get('order_ids')
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= limit <= MAX_DISPATCH:
+        return Response({"error": f"limit must be between 1 and {MAX_DISPATCH}"}, status=status.HTTP_400_BAD_REQUEST)
+    if order_ids is not None and (not isinstance(order_ids, list)
+                                  or not all(isinstance(order_id, int) for order_id in order_ids)):
+        return Response({"error": "order_ids must be a list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+    if order_ids is not None and len(order_ids) > MAX_DISPATCH:
+        return Response({"error": f"at most {MAX_DISPATCH} order_ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        assignments, open_orders = dispatch_orders(limit=limit, order_ids=order_ids)
+    except NoDeliveryCrew as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+
+    return Response({
+        "assigned": len(assignments),
+        "assignments": [{"order_id": order_id, "delivery_crew": username}
+                        for order_id, username in sorted(assignments.items())],
+        "open_orders": open_orders,
+    }, status=status.HTTP_200_OK)
+# end dispatchOrdersView function
+
+
+def list_orders(request, orders, empty_message):
+    """ one keyset page of ``orders``, newest first, or all of them streamed
+    with ``stream=json|ndjson``
+    """
+    orders = OrderSerializer.setup_eager_loading(orders)
+    fmt, error = stream_format(request.query_params)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    if fmt:
+        return stream_response(request, orders.order_by(*OrdersPagination.ordering), OrderSerializer, fmt)
+
+    paginator = OrdersPagination()
+    page = paginator.paginate_queryset(orders, request)
+    if not page and not request.query_params.get('cursor'):
+        return Response({"message": empty_message}, status=status.HTTP_204_NO_CONTENT)
+    serializer = OrderSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@query_budget(3)
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
-@throttle_classes([UserRateThrottle])
+@permission_classes([IsAuthenticated, IsCustomer])
+@throttle_classes([UserTokenBucketThrottle])
 def customerOrderListView(request):
     """ get all orders of a customer """
     if request.method == 'GET':
         user = request.user
-        if not user.groups.filter(name='Customer').exists():
-            return Response({"error": "Only customers can view their orders"}, status=status.HTTP_403_FORBIDDEN)
-        
-        orders = Order.objects.filter(user=user)
-        if not orders:
-            return Response({"message": "No orders found"}, status=status.HTTP_204_NO_CONTENT)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return list_orders(request, Order.objects.filter(user=user), "No orders found")
     
 
 from rest_framework.exceptions import NotFound
 
+def delivery_sync_data(delivery_user, params):
+    """ body of an incremental ``GET /orders?since=<sync token>`` poll """
+    since = decode_sync_token(params.get('since'))
+    orders, removed, last_number, has_more = delivery_changes(
+        delivery_user, since, sync_page_size(params), OrderSerializer.setup_eager_loading(Order.objects.all()))
+    return {
+        'results': OrderSerializer(orders, many=True).data,
+        'removed': removed,
+        'sync_token': encode_sync_token(last_number),
+        'has_more': has_more,
+    }
+
+@query_budget(4)
 @api_view(['GET', 'PATCH'])
-@permission_classes([IsAuthenticated])
-@throttle_classes([UserRateThrottle])
-def deliveryCrewCheckOrUpdateOrderStatusView(request, order_id):
+@permission_classes([IsAuthenticated, IsDeliveryCrew])
+@throttle_classes([UserTokenBucketThrottle])
+def deliveryCrewCheckOrUpdateOrderStatusView(request, order_id=None):
     """ Delivery crew can view and update order status assigned to them """
     delivery_user = request.user
     
-    # Ensure user is a member of the 'Delivery' group
-    if not delivery_user.groups.filter(name='Delivery').exists():
-        return Response({"error": "Only delivery crew can view their assigned orders"}, status=status.HTTP_403_FORBIDDEN)
-    
     if request.method == 'GET':
+        if 'since' in request.query_params:
+            return Response(delivery_sync_data(delivery_user, request.query_params), status=status.HTTP_200_OK)
+
         # Fetch the orders assigned to the delivery user
-        assigned_orders = Order.objects.filter(delivery_crew=delivery_user)
-        if not assigned_orders.exists():
-            return Response({"message": "No assigned orders found"}, status=status.HTTP_204_NO_CONTENT)
-        
-        # Serialize the orders
-        serializer = OrderSerializer(assigned_orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return list_orders(request, Order.objects.filter(delivery_crew=delivery_user), "No assigned orders found")
 
     elif request.method == 'PATCH':
         # Retrieve order username from the request
-        order_instance = Order.objects.filter(pk=order_id)
-        if not order_instance.exists():
+        order_instance = OrderSerializer.setup_eager_loading(Order.objects.filter(pk=order_id)).first()
+        if order_instance is None:
             return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
         # Update order status and save it
@@ -415,15 +616,17 @@ def deliveryCrewCheckOrUpdateOrderStatusView(request, order_id):
 
         # Serialize and return the updated order
         serializer = OrderSerializer(order_instance)
+        event = order_event(ORDER_STATUS, order_instance)
+        transaction.on_commit(functools.partial(publish, event))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['PUT', 'PATCH'])
 @permission_classes([IsAdminUser | IsSuperUser])
-@throttle_classes([UserRateThrottle])
+@throttle_classes([UserTokenBucketThrottle])
 def managerUpdateMenuItemView(request, menuitem_id):
     if request.method == 'PUT':
         user = request.user
-        if not user.groups.filter(name='Manager').exists():
+        if not has_role(user, MANAGER):
             return Response({"error": "Only managers can update menu items"}, status=status.HTTP_403_FORBIDDEN)
         try:
             menu_item_obj = MenuItem.objects.get(id=menuitem_id)
@@ -437,17 +640,90 @@ def managerUpdateMenuItemView(request, menuitem_id):
             return Response({"error": "Menu item not found"}, status=status.HTTP_404_NOT_FOUND)
     elif request.method == 'PATCH':
         user = request.user
-        if not user.groups.filter(name='Manager').exists():
+        if not has_role(user, MANAGER):
             return Response({"error": "Only managers can update menu items"}, status=status.HTTP_403_FORBIDDEN)
         try:
             menu_item_obj = MenuItem.objects.get(id=menuitem_id)
-            status = request.data.get('status')
-            if status is None:
+            featured = request.data.get('status')
+            if featured is None:
                 return Response({"error": "Status field is required"}, status=status.HTTP_400_BAD_REQUEST)
-            menu_item_obj.featured = status
+            menu_item_obj.featured = featured
             menu_item_obj.save()
             serializer = MenuItemSerializer(menu_item_obj)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except MenuItem.DoesNotExist:
             return Response({"error": "Menu item not found"}, status=status.HTTP_404_NOT_FOUND)
 # end managerUpdateMenuItemView function
+
+
+# default report period when no dates are given
+REPORT_DAYS = 30
+
+def report_range(params):
+    """ ``(start, end)`` from the query string, or an error message """
+    try:
+        end = datetime.date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+        start = (datetime.date.fromisoformat(params['start']) if params.get('start')
+                 else end - datetime.timedelta(days=REPORT_DAYS - 1))
+    except ValueError:
+        return None, None, "start and end must be dates (YYYY-MM-DD)"
+    if start > end:
+        return None, None, "start must not be after end"
+    return start, end, None
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsManager])
+@throttle_classes([UserTokenBucketThrottle])
+def managerSalesReportView(request):
+    """ revenue, orders and units per day of a date range, from the rollups """
+    start, end, error = report_range(request.query_params)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = SalesSummarySerializer(sales_summary(start, end))
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsManager])
+@throttle_classes([UserTokenBucketThrottle])
+def managerTopSellersView(request):
+    """ best selling menu items (or categories with by=category) of a date range """
+    start, end, error = report_range(request.query_params)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    by = request.query_params.get('by', 'menuitem')
+    metric = request.query_params.get('metric', 'revenue')
+    if by not in ('menuitem', 'category'):
+        return Response({"error": "by must be 'menuitem' or 'category'"}, status=status.HTTP_400_BAD_REQUEST)
+    if metric not in TOP_SELLER_METRICS:
+        return Response({"error": f"metric must be one of {', '.join(TOP_SELLER_METRICS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = top_sellers(start, end, by=by, metric=metric, limit=limit)
+    return Response({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'by': by,
+        'metric': metric,
+        'results': TopSellerSerializer(rows, many=True).data,
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsManager])
+@throttle_classes([UserTokenBucketThrottle])
+def managerOrderExportView(request):
+    """ stream the orders of a date range with their lines as CSV or NDJSON """
+    start, end, error = report_range(request.query_params)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    fmt = request.query_params.get('output', 'ndjson')
+    if fmt not in EXPORT_CONTENT_TYPES:
+        return Response({"error": f"output must be one of {', '.join(EXPORT_CONTENT_TYPES)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    response = streaming_response(request, export_orders(fmt, start, end), EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="orders_{start}_{end}.{fmt}"'
+    return response
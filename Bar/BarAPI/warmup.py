@@ -0,0 +1,105 @@
+import inspect
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver, resolve, reverse
+from django.utils import timezone, translation
+from rest_framework import serializers as drf_serializers
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import serializers
+from .authentication import blacklist
+from .catalog import category_ids
+from .models import Category
+from .renderers import dumps
+from .roles import DELIVERY, MANAGER, prime_user_roles
+
+logger = logging.getLogger('LittleLemonAPI.warmup')
+
+
+def warm_urls():
+    """ compile every URL pattern, the djoser and simplejwt includes too """
+    # populating the reverse dict walks the whole tree and compiles each regex
+    get_resolver().reverse_dict
+    resolve(reverse('menu-items'))
+
+
+def warm_settings():
+    """ import the classes DRF and simplejwt name in settings by dotted path """
+    for name in api_settings.defaults:
+        getattr(api_settings, name)
+    for name in jwt_settings.defaults:
+        getattr(jwt_settings, name)
+    # the token backend and the translation catalogs load on first use
+    from rest_framework_simplejwt.state import token_backend  # noqa: F401
+    translation.gettext('Not found.')
+    timezone.localdate()
+    dumps({'warm': True})
+
+
+def warm_serializers():
+    """ build the fields of every model serializer once
+
+    Field introspection fills Django's per-model ``_meta`` caches and
+    imports DRF's field machinery.
+    """
+    for _, serializer_class in inspect.getmembers(serializers, inspect.isclass):
+        if issubclass(serializer_class, drf_serializers.ModelSerializer) and \
+                serializer_class.__module__ == serializers.__name__:
+            serializer_class().fields
+
+
+def warm_database():
+    """ open the connection, running the SQLite profile's PRAGMAs """
+    connections['default'].ensure_connection()
+    Category.objects.exists()
+
+
+def warm_caches():
+    """ category id map, blacklist and staff roles """
+    category_ids.load()
+    blacklist.refresh()
+    # managers and drivers call the API all day; customers are too many
+    prime_user_roles(MANAGER, DELIVERY)
+
+
+# in order: the caches need the database, which needs the settings
+WARMUP_PHASES = {
+    'urls': warm_urls,
+    'settings': warm_settings,
+    'serializers': warm_serializers,
+    'database': warm_database,
+    'caches': warm_caches,
+}
+
+
+def warm_up(phases=None):
+    """ run the warm-up phases (all by default), returns ``{phase: seconds}`` """
+    timings = {}
+    for name, phase in WARMUP_PHASES.items():
+        if phases and name not in phases:
+            continue
+        started = time.perf_counter()
+        phase()
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def warm_up_worker():
+    """ warm-up hook of ``wsgi.py`` / ``asgi.py``, on with ``WARMUP_ON_START``
+
+    Connections are closed afterwards: the hook may run in a pre-fork
+    master (``gunicorn --preload``) whose sockets and file handles the
+    workers must not share.
+    """
+    if not getattr(settings, 'WARMUP_ON_START', False):
+        return None
+    try:
+        timings = warm_up()
+    finally:
+        connections.close_all()
+    logger.info('warm-up %s', ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in timings.items()))
+    return timings
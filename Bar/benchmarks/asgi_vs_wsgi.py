@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Read endpoint throughput under gunicorn (WSGI) and uvicorn (ASGI).
+
+Seeds a temporary database once, then starts each server in turn on a free
+port and drives concurrent keep-alive GETs at the read endpoints with a
+customer and a delivery crew token. Uvicorn runs with the async read views
+(BAR_ASYNC_READ_ENDPOINTS=1); gunicorn serves the DRF views.
+
+    python benchmarks/asgi_vs_wsgi.py --concurrency 32 --duration 10
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# throttling would turn most of the load into 429s
+BENCH_SETTINGS = """
+from LittleLemon.settings import *
+
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {
+    scope: '1000000/second' for scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+}
+"""
+
+
+def prepare(args, tmp):
+    """ write the settings module, seed the database, return the tokens """
+    with open(os.path.join(tmp, 'bench_settings.py'), 'w') as fh:
+        fh.write(BENCH_SETTINGS)
+    sys.path.insert(0, tmp)
+    sys.path.insert(0, BASE_DIR)
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'bench_settings'
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from LittleLemonAPI.roles import CUSTOMER, DELIVERY
+
+    call_command('migrate', verbosity=0)
+    call_command('seed_data', seed=args.seed, verbosity=0)
+    customer = User.objects.filter(groups__name=CUSTOMER, order__isnull=False).distinct().order_by('id').first()
+    driver = User.objects.filter(groups__name=DELIVERY, delivery_crew__isnull=False).distinct().order_by('id').first()
+    return {'customer': str(AccessToken.for_user(customer)), 'driver': str(AccessToken.for_user(driver))}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', 'LittleLemon.wsgi:application',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning']
+    return [sys.executable, '-m', 'uvicorn', 'LittleLemon.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def drive(port, requests, concurrency, duration):
+    """ keep-alive GETs from ``concurrency`` threads, round robin over ``requests`` """
+    stop = threading.Event()
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def client(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        done, mine = 0, []
+        while not stop.is_set():
+            path, token = requests[(offset + done) % len(requests)]
+            started = time.perf_counter()
+            conn.request('GET', path, headers={'Authorization': f'Bearer {token}'})
+            response = conn.getresponse()
+            response.read()
+            mine.append(time.perf_counter() - started)
+            done += 1
+            with lock:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+        'status': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', nargs='+', default=['gunicorn', 'uvicorn'], choices=['gunicorn', 'uvicorn'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['BAR_DB_NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+        os.environ['BAR_SQLITE_PROFILE'] = 'production'
+        os.environ['BAR_REQUEST_LOG_LEVEL'] = 'WARNING'
+        tokens = prepare(args, tmp)
+        requests = [
+            ('/api/menu-items', tokens['customer']),
+            ('/api/categories', tokens['customer']),
+            ('/api/cart/orders', tokens['customer']),
+            ('/api/orders', tokens['driver']),
+        ]
+
+        for server in args.servers:
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join([tmp, BASE_DIR, os.environ.get('PYTHONPATH', '')]))
+            env['BAR_ASYNC_READ_ENDPOINTS'] = '1' if server == 'uvicorn' else ''
+            port = free_port()
+            process = subprocess.Popen(server_command(server, port, args.workers), cwd=BASE_DIR, env=env)
+            try:
+                wait_until_up(port)
+                drive(port, requests, args.concurrency, args.warmup)
+                results[server] = drive(port, requests, args.concurrency, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(f"{'server':<10}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}  status")
+    for server, result in results.items():
+        print(f"{server:<10}{result['rps']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}  {result['status']}")
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""Cart write throughput of the database and cache cart stores.
+
+Each store runs in its own process against a fresh database file: writer
+threads, one customer each, add to their cart and check out every
+``--checkout-every`` adds through the store CartItemView and placeOrderView
+use. The cache store then writes the remaining carts behind with
+``flush_idle``, which is timed separately.
+
+    python benchmarks/cart_writes.py --writers 4 --duration 5 --profile production
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_worker(args):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import OperationalError, connection
+
+    from LittleLemonAPI.cart import get_cart_store
+    from LittleLemonAPI.models import Cart, Category, MenuItem
+
+    call_command('migrate', verbosity=0)
+    category = Category.objects.create(slug='bench', title='Bench')
+    items = MenuItem.objects.bulk_create(
+        MenuItem(title=f'Item {i}', price='4.50', featured=False, category=category) for i in range(200)
+    )
+    item_ids = [item.id for item in items]
+    writers = [User.objects.create(username=f'writer{i}') for i in range(args.writers)]
+    connection.close()
+
+    store = get_cart_store()
+    stop = threading.Event()
+    counts = {'cart_writes': 0, 'checkouts': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(user):
+        step = 0
+        try:
+            while not stop.is_set():
+                step += 1
+                try:
+                    store.add(user, {item_ids[step % len(item_ids)]: 1})
+                    bump('cart_writes')
+                    if step % args.checkout_every == 0:
+                        store.place_order(user)
+                        bump('checkouts')
+                except OperationalError:
+                    bump('errors')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=writer, args=(user,)) for user in writers]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {key: round(value / elapsed, 1) for key, value in counts.items()}
+    result['errors_total'] = counts['errors']
+    started = time.perf_counter()
+    result['flushed'] = store.flush_idle(0)
+    result['flush_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    result['cart_rows'] = Cart.objects.count()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--checkout-every', type=int, default=20)
+    parser.add_argument('--profile', default='default', help='BAR_SQLITE_PROFILE of both runs')
+    parser.add_argument('--stores', nargs='+', default=['db', 'cache'])
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    results = {}
+    print(f"{'store':<8}{'cart/s':>10}{'orders/s':>10}{'errors':>8}{'flushed':>9}{'flush ms':>10}")
+    for store in args.stores:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, BAR_CART_STORE=store, BAR_SQLITE_PROFILE=args.profile,
+                       BAR_DB_NAME=os.path.join(tmp, 'bench.sqlite3'))
+            output = subprocess.run(
+                [sys.executable, __file__, '--worker', '--writers', str(args.writers),
+                 '--duration', str(args.duration), '--checkout-every', str(args.checkout_every)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+        result = results[store] = json.loads(output.strip().splitlines()[-1])
+        print(f"{store:<8}{result['cart_writes']:>10}{result['checkouts']:>10}{result['errors_total']:>8}"
+              f"{result['flushed']:>9}{result['flush_ms']:>10}")
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
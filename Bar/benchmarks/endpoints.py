@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""Repeatable per-endpoint latency and query-count benchmark.
+
+Builds a fresh SQLite database, seeds it with ``manage.py seed_data`` and
+calls every route of the API in-process with real JWT authentication.
+Writes run inside a rolled back transaction so every iteration sees the
+same data. Results (latency percentiles in ms and queries per request) are
+written as JSON so two branches can be compared:
+
+    python benchmarks/endpoints.py --output main.json
+    python benchmarks/endpoints.py --output branch.json --compare main.json
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Rollback(Exception):
+    pass
+
+
+def scenarios(ctx):
+    """ (url name, method, role, url kwargs, query params, body) per route
+
+    A body is sent as JSON, or as is when given as a (content type, bytes) pair.
+    """
+    return [
+        ('menu-items', 'GET', 'customer', {}, {}, None),
+        ('menu-items', 'GET', 'customer', {}, {'ordering': '-price', 'page_size': 50}, None),
+        ('menu-items', 'GET', 'customer', {}, {'category_name': 'Category 1'}, None),
+        ('menu-items', 'GET', 'customer', {}, {'stream': 'ndjson'}, None),
+        ('menu-items', 'GET', 'customer', {}, {'since': ''}, None),
+        ('menu-items', 'GET', 'customer', {}, {'since': ctx['menu_sync_token']}, None),
+        ('menu-search', 'GET', 'customer', {}, {'q': 'me'}, None),
+        ('menu-search', 'GET', 'customer', {}, {'q': 'menu item 12'}, None),
+        ('menu-items', 'POST', 'manager', {}, {}, {'title': 'Bench special', 'price': '9.50', 'category': ctx['category_id'], 'featured': False}),
+        ('manager-update-menu-item', 'PUT', 'manager', {'menuitem_id': ctx['menuitem_id']}, {}, {'price': '11.00'}),
+        ('menu-items-export', 'GET', 'manager', {}, {'output': 'csv'}, None),
+        ('menu-items-import', 'POST', 'manager', {}, {}, ('text/csv', ctx['import_csv'])),
+        ('categories', 'GET', 'customer', {}, {}, None),
+        ('categories', 'POST', 'manager', {}, {}, {'slug': 'bench', 'title': 'Bench'}),
+        ('categories-export', 'GET', 'manager', {}, {'output': 'ndjson'}, None),
+        ('categories-import', 'POST', 'manager', {}, {}, ('application/x-ndjson', ctx['import_ndjson'])),
+        ('manager-users', 'GET', 'admin', {}, {'group_name': 'delivery'}, None),
+        ('manager-users', 'POST', 'admin', {}, {}, {'username': ctx['customer'].username}),
+        ('manager-users', 'DELETE', 'admin', {}, {}, {'username': ctx['manager'].username}),
+        ('cart-management', 'GET', 'customer', {}, {}, None),
+        ('cart-management', 'POST', 'customer', {}, {}, {'menuitem_id': ctx['menuitem_id'], 'quantity': 1}),
+        ('cart-batch', 'POST', 'customer', {}, {}, {'items': [{'menuitem_id': menuitem_id, 'quantity': 1} for menuitem_id in ctx['menuitem_ids']]}),
+        ('customer-orders', 'GET', 'customer', {}, {}, None),
+        ('customer-orders', 'GET', 'customer', {}, {'stream': 'json'}, None),
+        ('customer-orders', 'POST', 'customer', {}, {}, None),
+        ('assign-delivery-crew', 'POST', 'admin', {}, {}, {'order_username': ctx['customer'].username, 'delivery_crew_username': ctx['driver'].username}),
+        ('dispatch-orders', 'POST', 'manager', {}, {}, {'limit': 200}),
+        ('delivery-crew-orders', 'GET', 'driver', {}, {}, None),
+        ('delivery-crew-orders', 'GET', 'driver', {}, {'stream': 'ndjson'}, None),
+        ('delivery-crew-orders', 'GET', 'driver', {}, {'since': ''}, None),
+        ('delivery-crew-orders', 'GET', 'driver', {}, {'since': ctx['sync_token']}, None),
+        ('sales-report', 'GET', 'manager', {}, {'start': ctx['year_ago'], 'end': ctx['today']}, None),
+        ('top-sellers', 'GET', 'manager', {}, {'start': ctx['year_ago'], 'end': ctx['today']}, None),
+        ('top-sellers', 'GET', 'manager', {}, {'by': 'category', 'metric': 'units'}, None),
+        ('orders-export', 'GET', 'manager', {}, {'start': ctx['year_ago'], 'end': ctx['today'], 'output': 'csv'}, None),
+        ('orders-export', 'GET', 'manager', {}, {'start': ctx['year_ago'], 'end': ctx['today']}, None),
+        ('delivery-crew-orders', 'PATCH', 'driver', {'order_id': ctx['order_id']}, {}, {'status': True}),
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(args):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
+    os.environ.setdefault('BAR_REQUEST_LOG_LEVEL', 'WARNING')
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import transaction
+    from django.db.models import F, Max
+    from django.test import Client
+    from django.urls import get_resolver, reverse
+    from rest_framework.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from LittleLemonAPI.models import CatalogChange, Category, MenuItem, Order
+    from LittleLemonAPI.roles import CUSTOMER, DELIVERY, MANAGER
+    from LittleLemonAPI.sync import encode_sync_token
+
+    call_command('migrate', verbosity=0)
+    seed_options = {'seed': args.seed, 'verbosity': 0}
+    if args.scale != 1:
+        seed_options.update(
+            menu_items=int(300 * args.scale), customers=int(500 * args.scale),
+            carts=int(100 * args.scale), orders=int(5000 * args.scale),
+        )
+    call_command('seed_data', **seed_options)
+
+    # the benchmark measures throttling overhead, not its limits
+    for scope in api_settings.DEFAULT_THROTTLE_RATES:
+        api_settings.DEFAULT_THROTTLE_RATES[scope] = '1000000/second'
+
+    customer = User.objects.filter(groups__name=CUSTOMER, cart__isnull=False).distinct().order_by('id').first()
+    driver = User.objects.filter(groups__name=DELIVERY, delivery_crew__isnull=False).distinct().order_by('id').first()
+    manager = User.objects.filter(groups__name=MANAGER).order_by('id').first()
+    admin = User.objects.create_superuser('bench_admin', password='bench-password')
+    ctx = {
+        'customer': customer,
+        'driver': driver,
+        'manager': manager,
+        'category_id': Category.objects.order_by('id').values_list('id', flat=True).first(),
+        'menuitem_id': MenuItem.objects.order_by('id').values_list('id', flat=True).first(),
+        'menuitem_ids': list(MenuItem.objects.order_by('id').values_list('id', flat=True)[:20]),
+        'order_id': Order.objects.filter(delivery_crew=driver).values_list('id', flat=True).first(),
+    }
+    ctx['sync_token'] = encode_sync_token(Order.objects.aggregate(last=Max('updated'))['last'] or 0)
+    # one price change behind
+    ctx['menu_sync_token'] = encode_sync_token(CatalogChange.objects.aggregate(last=Max('id'))['last'])
+    MenuItem.objects.filter(pk=ctx['menuitem_id']).update(price=F('price') + 1)
+    # half updates of existing rows, half new rows
+    ctx['import_csv'] = ('id,title,price,featured,category\n' + ''.join(
+        f"{menuitem_id if i % 2 else ''},Imported {i},{i % 20 + 1}.50,false,{ctx['category_id']}\n"
+        for i, menuitem_id in enumerate(MenuItem.objects.order_by('id').values_list('id', flat=True)[:500])
+    )).encode()
+    ctx['import_ndjson'] = b''.join(
+        json.dumps({'slug': f'imported-{i}', 'title': f'Imported {i}'}).encode() + b'\n' for i in range(100)
+    )
+    ctx['today'] = datetime.date.today().isoformat()
+    ctx['year_ago'] = (datetime.date.today() - datetime.timedelta(days=365)).isoformat()
+    users = {'customer': customer, 'driver': driver, 'manager': manager, 'admin': admin}
+
+    covered = set()
+    results = []
+    for url_name, method, role, kwargs, params, body in scenarios(ctx):
+        covered.add(url_name)
+        url = reverse(url_name, kwargs=kwargs or None)
+        client = Client(raise_request_exception=False, HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(users[role])}')
+
+        def call():
+            if method == 'GET':
+                response = client.get(url, params)
+                if response.streaming:
+                    # the rows are read while the body is sent
+                    b''.join(response.streaming_content)
+                return response
+            if isinstance(body, tuple):
+                content_type, payload = body
+                return client.generic(method, url, payload, content_type=content_type)
+            return client.generic(method, url, json.dumps(body or {}), content_type='application/json')
+
+        def timed_call():
+            if method == 'GET':
+                started = time.perf_counter()
+                response = call()
+                return time.perf_counter() - started, response
+            try:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    response = call()
+                    elapsed = time.perf_counter() - started
+                    raise Rollback
+            except Rollback:
+                return elapsed, response
+
+        for _ in range(args.warmup):
+            timed_call()
+        samples, queries, statuses = [], [], set()
+        for _ in range(args.iterations):
+            elapsed, response = timed_call()
+            samples.append(elapsed * 1000)
+            statuses.add(response.status_code)
+            timing = response.get('Server-Timing', '')
+            if 'queries"' in timing:
+                queries.append(int(timing.split('desc="', 1)[1].split(' ', 1)[0]))
+
+        results.append({
+            'route': url_name,
+            'method': method,
+            'params': params,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(samples, 0.50), 3),
+            'p90_ms': round(percentile(samples, 0.90), 3),
+            'p99_ms': round(percentile(samples, 0.99), 3),
+            'mean_ms': round(statistics.fmean(samples), 3),
+            'queries': round(statistics.fmean(queries), 1) if queries else None,
+        })
+
+    routes = {pattern.name for pattern in get_resolver().url_patterns[-1].url_patterns if pattern.name}
+    missing = sorted(routes - covered)
+    return {'iterations': args.iterations, 'seed': args.seed, 'scale': args.scale,
+            'missing_routes': missing, 'results': results}
+
+
+def key(result):
+    return (result['route'], result['method'], json.dumps(result['params'], sort_keys=True))
+
+
+def report(data, baseline=None):
+    previous = {key(result): result for result in (baseline or {}).get('results', [])}
+    print(f"{'route':<28}{'method':<8}{'p50':>9}{'p90':>9}{'p99':>9}{'queries':>9}  status")
+    for result in data['results']:
+        line = (f"{result['route']:<28}{result['method']:<8}{result['p50_ms']:>9.2f}{result['p90_ms']:>9.2f}"
+                f"{result['p99_ms']:>9.2f}{result['queries'] if result['queries'] is not None else '-':>9}  {result['status']}")
+        old = previous.get(key(result))
+        if old:
+            line += f"  p50 {result['p50_ms'] - old['p50_ms']:+.2f}ms"
+            if old['queries'] is not None and result['queries'] is not None:
+                line += f" queries {result['queries'] - old['queries']:+.1f}"
+        print(line)
+    if data['missing_routes']:
+        print(f"routes without a scenario: {', '.join(data['missing_routes'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the default seed_data sizes')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='earlier JSON result to diff against')
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['BAR_DB_NAME'] = args.db or os.path.join(tmp, 'benchmark.sqlite3')
+        data = run(args)
+
+    with open(args.output, 'w') as fh:
+        json.dump(data, fh, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    report(data, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""Concurrent read/write throughput of the SQLite profiles.
+
+Each profile runs in its own process against a fresh database file: reader
+threads list menu items while writer threads add to their cart and check
+out through the same code paths as CartItemView and placeOrderView.
+
+    python benchmarks/sqlite_concurrency.py --readers 8 --writers 4 --duration 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_worker(args):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import OperationalError, connection
+
+    from LittleLemonAPI.cart import add_cart_item
+    from LittleLemonAPI.checkout import place_order
+    from LittleLemonAPI.models import Category, MenuItem
+    from LittleLemonAPI.serializers import MenuItemSerializer
+
+    call_command('migrate', verbosity=0)
+    category = Category.objects.create(slug='bench', title='Bench')
+    items = MenuItem.objects.bulk_create(
+        MenuItem(title=f'Item {i}', price='4.50', featured=False, category=category) for i in range(200)
+    )
+    item_ids = [item.id for item in items]
+    writers = [User.objects.create(username=f'writer{i}') for i in range(args.writers)]
+    connection.close()
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'cart_writes': 0, 'checkouts': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        try:
+            while not stop.is_set():
+                try:
+                    queryset = MenuItemSerializer.setup_eager_loading(MenuItem.objects.order_by('price', 'id'))
+                    MenuItemSerializer(queryset[:20], many=True).data
+                    bump('reads')
+                except OperationalError:
+                    bump('errors')
+        finally:
+            connection.close()
+
+    def writer(user):
+        step = 0
+        try:
+            while not stop.is_set():
+                step += 1
+                try:
+                    add_cart_item(user, item_ids[step % len(item_ids)], 1)
+                    bump('cart_writes')
+                    if step % 5 == 0:
+                        place_order(user)
+                        bump('checkouts')
+                except OperationalError:
+                    bump('errors')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(user,)) for user in writers]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {key: round(value / elapsed, 1) for key, value in counts.items()}
+    result['errors_total'] = counts['errors']
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    print(f"{'profile':<12}{'reads/s':>10}{'cart/s':>10}{'orders/s':>10}{'errors':>8}")
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, BAR_SQLITE_PROFILE=profile, BAR_DB_NAME=os.path.join(tmp, 'bench.sqlite3'))
+            output = subprocess.run(
+                [sys.executable, __file__, '--worker',
+                 '--readers', str(args.readers), '--writers', str(args.writers), '--duration', str(args.duration)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{profile:<12}{result['reads']:>10}{result['cart_writes']:>10}{result['checkouts']:>10}{result['errors_total']:>8}")
+
+
+if __name__ == '__main__':
+    main()
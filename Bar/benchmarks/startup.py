@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Process start-up cost: manage.py, the WSGI import and the first requests.
+
+Seeds a temporary database once, then times in fresh interpreters:
+``manage.py check``, importing ``LittleLemon.wsgi`` and the first and second
+request a new worker serves, with and without BAR_WARMUP_ON_START. Medians
+over ``--runs`` processes.
+
+    python benchmarks/startup.py --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare(args):
+    """ seed the database, return a customer token """
+    sys.path.insert(0, BASE_DIR)
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'LittleLemon.settings'
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from LittleLemonAPI.roles import CUSTOMER
+
+    call_command('migrate', verbosity=0)
+    call_command('seed_data', seed=args.seed, verbosity=0)
+    customer = User.objects.filter(groups__name=CUSTOMER).order_by('id').first()
+    return str(AccessToken.for_user(customer))
+
+
+def worker(path, token):
+    """ child process: import the WSGI module and serve two requests, print timings """
+    from wsgiref.util import setup_testing_defaults
+
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
+    started = time.perf_counter()
+    from LittleLemon.wsgi import application
+    timings = {'import_ms': (time.perf_counter() - started) * 1000}
+
+    for name in ('first_request_ms', 'second_request_ms'):
+        environ = {'PATH_INFO': path, 'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        setup_testing_defaults(environ)
+        statuses = []
+        started = time.perf_counter()
+        body = application(environ, lambda status, headers: statuses.append(status))
+        for _ in body:
+            pass
+        body.close()
+        timings[name] = (time.perf_counter() - started) * 1000
+        if not statuses[0].startswith('200'):
+            raise RuntimeError(f'{path} answered {statuses[0]}')
+    print(json.dumps(timings))
+
+
+def timed_process(command, env):
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True)
+    return (time.perf_counter() - started) * 1000, completed.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/menu-items')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--worker', metavar='TOKEN', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args.path, args.worker)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['BAR_DB_NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+        os.environ['BAR_REQUEST_LOG_LEVEL'] = 'WARNING'
+        token = prepare(args)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([BASE_DIR, os.environ.get('PYTHONPATH', '')]))
+
+        results['manage.py check'] = {'process_ms': statistics.median(
+            timed_process([sys.executable, 'manage.py', 'check'], env)[0] for _ in range(args.runs)
+        )}
+        for label, warm in (('wsgi', ''), ('wsgi + warm-up', '1')):
+            runs = []
+            for _ in range(args.runs):
+                command = [sys.executable, os.path.abspath(__file__), '--worker', token, '--path', args.path]
+                process_ms, out = timed_process(command, dict(env, BAR_WARMUP_ON_START=warm))
+                runs.append(dict(json.loads(out.splitlines()[-1]), process_ms=process_ms))
+            results[label] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+    columns = ('process_ms', 'import_ms', 'first_request_ms', 'second_request_ms')
+    print(f"{'':<18}" + ''.join(f'{column:>20}' for column in columns))
+    for label, result in results.items():
+        print(f'{label:<18}' + ''.join(
+            f'{result[column]:>20.1f}' if column in result else f"{'-':>20}" for column in columns
+        ))
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()